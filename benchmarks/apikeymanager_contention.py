@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure how well ApiKeyManager hands out tokens to many threads at once.
+
+Starts a few hundred threads that each acquire API keys in a loop for a
+while, and reports the achieved throughput (compared to what the rate
+limits of all keys allow), and the latency of acquiring a key.
+
+Run with `python benchmarks/apikeymanager_contention.py --help`
+(flickrhistory has to be importable, e.g., `pip install -e .`).
+"""
+
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def main():
+    """Run the benchmark."""
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--threads", type=int, default=200)
+    argparser.add_argument("--api-keys", type=int, default=8)
+    argparser.add_argument("--rate-limit-per-second", type=float, default=100.0)
+    argparser.add_argument("--burst", type=int, default=1)
+    argparser.add_argument("--duration", type=float, default=10.0)
+    args = argparser.parse_args()
+
+    # do not touch the user’s cache file
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp()
+    os.environ.pop("LOCALAPPDATA", None)
+
+    from flickrhistory.apikeymanager import ApiKeyManager
+
+    api_key_manager = ApiKeyManager(
+        [f"key-{i}" for i in range(args.api_keys)],
+        rate_limit_per_second=args.rate_limit_per_second,
+        burst=args.burst,
+        calls_per_hour=(args.rate_limit_per_second * 60 * 60),
+    )
+
+    latencies = [[] for _ in range(args.threads)]
+    start = threading.Event()
+    stop = threading.Event()
+
+    def _worker(latencies):
+        start.wait()
+        while not stop.is_set():
+            requested = time.perf_counter()
+            with api_key_manager.get_api_key():
+                latencies.append(time.perf_counter() - requested)
+
+    threads = [
+        threading.Thread(target=_worker, args=(latencies[i],), daemon=True)
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    start.set()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for thread in latencies for latency in thread)
+    percentiles = statistics.quantiles(latencies, n=100)
+    throughput = len(latencies) / elapsed
+    theoretical = args.api_keys * args.rate_limit_per_second
+
+    print(
+        f"{args.threads} threads, {args.api_keys} API keys "
+        f"at {args.rate_limit_per_second:g}/s (burst {args.burst}), "
+        f"{elapsed:.1f} s"
+    )
+    print(
+        f"throughput: {throughput:.1f} keys/s "
+        f"({throughput / theoretical:.1%} of {theoretical:g}/s)"
+    )
+    print(
+        "acquisition latency: "
+        f"p50 {percentiles[49] * 1000:.1f} ms, "
+        f"p99 {percentiles[98] * 1000:.1f} ms, "
+        f"max {latencies[-1] * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Compare how fast the database writers save pages of photos.
+
+Writes the same synthetic pages of search results (see
+decode_search_page.py) with each of:
+
+- save: PhotoSaver.save, one transaction per photo
+- save_many: PhotoSaver.save_many, one transaction per page
+- copy: CopyWriter, COPY into staging tables, merged every `--flush-rows`
+  photos
+
+from `--threads` threads at the same time (each writing its own photos),
+first inserting new photos, then updating the same photos again. Reports
+photos per second, and writes them, together with the parameters, as JSON
+(`--output`).
+
+The database is written to (and, with `--drop-tables`, emptied first):
+use a scratch database, e.g.,
+`--database postgresql://localhost/flickrhistory_benchmark`.
+
+Run with `python benchmarks/database_writers.py --help`
+(flickrhistory has to be importable, e.g., `pip install -e .`).
+"""
+
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+
+from decode_search_page import search_page
+
+
+WRITERS = ("save", "save_many", "copy")
+
+
+def _pages(args, thread, first_id):
+    """Return the pages of photos one thread writes, with unique ids."""
+    pages = []
+    for page in range(args.pages):
+        photos = json.loads(search_page(args.page_size, seed=page))["photos"]["photo"]
+        for i, photo in enumerate(photos):
+            photo["id"] = str(
+                first_id + (thread * args.pages + page) * args.page_size + i
+            )
+        pages.append(photos)
+    return pages
+
+
+def _write(writer, pages, flush_rows):
+    from flickrhistory.database import CopyWriter, PhotoSaver
+
+    if writer == "save":
+        photo_saver = PhotoSaver()
+        for page in pages:
+            for photo in page:
+                photo_saver.save(photo)
+    elif writer == "save_many":
+        photo_saver = PhotoSaver()
+        for page in pages:
+            photo_saver.save_many(page)
+    else:
+        copy_writer = CopyWriter(flush_rows=flush_rows, flush_interval=float("inf"))
+        for page in pages:
+            copy_writer.add(page)
+        copy_writer.close()
+
+
+def _run(writer, pages_by_thread, flush_rows):
+    """Write the pages of each thread in its own thread, return the duration."""
+    threads = [
+        threading.Thread(target=_write, args=(writer, pages, flush_rows))
+        for pages in pages_by_thread
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark."""
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--database", required=True, help="connection string")
+    argparser.add_argument("--drop-tables", action="store_true")
+    argparser.add_argument("--writer", action="append", choices=WRITERS)
+    argparser.add_argument("--threads", type=int, default=4)
+    argparser.add_argument("--pages", type=int, default=10, help="per thread")
+    argparser.add_argument("--page-size", type=int, default=500)
+    argparser.add_argument("--flush-rows", type=int, default=5000)
+    argparser.add_argument("--output", default="database_writers.json")
+    args = argparser.parse_args()
+
+    # do not touch the user’s cache file
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp()
+    os.environ.pop("LOCALAPPDATA", None)
+
+    import sqlalchemy
+
+    from flickrhistory.config import Config
+    from flickrhistory.database import Session
+    from flickrhistory.database.models.base import Base
+    from flickrhistory import __version__ as version
+
+    Config({"database_connection_string": args.database})
+
+    if args.drop_tables:
+        engine = sqlalchemy.create_engine(args.database)
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+    # create a session to initialise the database
+    _ = Session()
+
+    num_photos = args.threads * args.pages * args.page_size
+    results = {}
+    for number, writer in enumerate(args.writer or WRITERS):
+        # each writer inserts photos of its own, then updates them
+        pages_by_thread = [
+            _pages(args, thread, 60000000000 + number * num_photos)
+            for thread in range(args.threads)
+        ]
+        results[writer] = {}
+        for phase in ("insert", "update"):
+            seconds = _run(writer, pages_by_thread, args.flush_rows)
+            results[writer][phase] = {
+                "seconds": seconds,
+                "photos_per_second": num_photos / seconds,
+            }
+            print(
+                f"{writer:>10} {phase:>6}: {num_photos} photos in {seconds:8.2f} s, "
+                f"{num_photos / seconds:10.1f} photos/s"
+            )
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(
+            {
+                "benchmark": "database_writers",
+                "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "flickrhistory": version,
+                "python": platform.python_version(),
+                "parameters": {
+                    key: value for key, value in vars(args).items() if key != "database"
+                },
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure how long decoding and normalising a page of search results takes.
+
+Generates a flickr.photos.search response of 500 photos, then times
+decoding it and normalising all photos (cf. PhotoSaver.normalise) with
+each JSON decoder available (json, orjson, msgspec).
+
+Run with `python benchmarks/decode_search_page.py --help`
+(flickrhistory has to be importable, e.g., `pip install -e .[fastjson]`).
+"""
+
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+
+def search_page(num_photos, seed=0):
+    """Return a synthetic flickr.photos.search response (as bytes)."""
+    random_ = random.Random(seed)
+    start = 1600000000
+    photos = []
+    for i in range(num_photos):
+        date_posted = start + i * 7
+        photos.append(
+            {
+                "id": str(50000000000 + i),
+                "owner": f"{random_.randint(10000000, 99999999)}@N0{random_.randint(0, 8)}",
+                "secret": f"{random_.getrandbits(40):010x}",
+                "server": str(random_.randint(1000, 65535)),
+                "farm": 66,
+                "title": "A photo of something, somewhere " * random_.randint(0, 3),
+                "ispublic": 1,
+                "isfriend": 0,
+                "isfamily": 0,
+                "license": str(random_.randint(0, 10)),
+                "description": {"_content": "Lorem ipsum dolor sit amet " * 5},
+                "dateupload": str(date_posted),
+                "datetaken": time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.gmtime(date_posted - 86400)
+                ),
+                "datetakengranularity": 0,
+                "datetakenunknown": "0",
+                "ownername": "Some Photographer",
+                "tags": " ".join(f"tag{random_.randint(0, 500)}" for _ in range(8)),
+                "latitude": f"{random_.uniform(-90, 90):.6f}",
+                "longitude": f"{random_.uniform(-180, 180):.6f}",
+                "accuracy": str(random_.randint(1, 16)),
+                "context": 0,
+                "place_id": "",
+                "woeid": "",
+                "geo_is_public": 1,
+                "geo_is_contact": 0,
+                "geo_is_friend": 0,
+                "geo_is_family": 0,
+            }
+        )
+    return json.dumps(
+        {
+            "photos": {
+                "page": 1,
+                "pages": 10,
+                "perpage": num_photos,
+                "total": 10 * num_photos,
+                "photo": photos,
+            },
+            "stat": "ok",
+        }
+    ).encode("utf-8")
+
+
+def main():
+    """Run the benchmark."""
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--photos", type=int, default=500)
+    argparser.add_argument("--repeat", type=int, default=50)
+    args = argparser.parse_args()
+
+    from flickrhistory.database import PhotoSaver
+    from flickrhistory.responsedecoder import ResponseDecoder
+
+    content = search_page(args.photos)
+
+    print(
+        f"decode + normalise one page of {args.photos} photos "
+        f"({len(content) / 1024:.0f} KiB), median of {args.repeat} runs"
+    )
+
+    baseline = None
+    for decoder in ResponseDecoder.DECODERS:
+        try:
+            response_decoder = ResponseDecoder(decoder)
+        except RuntimeError:
+            print(f"{decoder:>8}: not installed")
+            continue
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = response_decoder.decode_search_results(content)
+            photos = [
+                PhotoSaver.normalise(photo) for photo in results["photos"]["photo"]
+            ]
+            timings.append(time.perf_counter() - started)
+        assert len(photos) == args.photos
+
+        timing = statistics.median(timings)
+        if baseline is None:
+            baseline = timing
+        print(
+            f"{decoder:>8}: {timing * 1000:6.2f} ms per page, "
+            f"{timing / args.photos * 1e6:5.1f} µs per photo "
+            f"({baseline / timing:.1f}× json)"
+        )
+
+
+if __name__ == "__main__":
+    main()
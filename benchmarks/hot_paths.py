@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure the in-process hot paths of flickrhistory, apart from I/O.
+
+Times each case a few times (best and median of `--repeat` runs) at
+realistic sizes:
+
+- timespan_merge: add one TimeSpan to a coverage of 100k time spans
+  (CacheUpdaterThread, after each downloaded time span)
+- timespan_sum: resolve the overlaps of unsorted time spans with `sum()`
+  (BasicFlickrHistoryDownloader.already_downloaded_timespans)
+- timespan_split: divide a year into 100k pieces (PhotoDownloader.split,
+  UploadDensityModel.plan)
+- photo_normalise: normalise a page of 500 photos (PhotoSaver.save)
+- user_normalise: normalise the owners of a page of 500 photos, and
+  500 user profiles (UserSaver.save)
+- api_key_contention: 64 threads acquiring API keys
+  (ApiKeyManager.get_api_key)
+- cache_save, cache_load: the `already downloaded` list of 100k time
+  spans in the cache file
+
+Results can be written as JSON (`--output`), and compared against an
+earlier run (`--compare`), to show what an optimisation changed.
+
+Run with `python benchmarks/hot_paths.py --help`
+(flickrhistory has to be importable, e.g., `pip install -e .`).
+"""
+
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+import warnings
+
+from decode_search_page import search_page
+
+
+def _coverage(num_timespans, TimeSpan):
+    """Return num_timespans non-overlapping TimeSpans, one hour each."""
+    start = datetime.datetime(2005, 1, 1, tzinfo=datetime.timezone.utc)
+    hour = datetime.timedelta(hours=1)
+    return [
+        TimeSpan(start + 2 * i * hour, start + (2 * i + 1) * hour)
+        for i in range(num_timespans)
+    ]
+
+
+def _profiles(num_profiles):
+    random_ = random.Random(0)
+    return [
+        {
+            "id": f"{random_.randint(10000000, 99999999)}@N0{random_.randint(0, 8)}",
+            "join_date": str(random_.randint(1100000000, 1700000000)),
+            "first_name": "Some",
+            "last_name": "Photographer",
+            "name": "Some Photographer",
+            "city": "",
+            "country": "Finland",
+            "hometown": "Helsinki",
+            "occupation": "",
+            "description": "Lorem ipsum dolor sit amet " * 3,
+            "website": "",
+        }
+        for _ in range(num_profiles)
+    ]
+
+
+def _cases(args):
+    """Yield (name, setup, function) of each benchmark case."""
+    from flickrhistory.apikeymanager import ApiKeyManager
+    from flickrhistory.cache import Cache
+    from flickrhistory.database import PhotoSaver, UserSaver
+    from flickrhistory.timespan import TimeSpan
+
+    coverage = _coverage(args.timespans, TimeSpan)
+    new_timespan = TimeSpan(coverage[0].end, coverage[1].start)
+
+    yield ("timespan_merge", None, lambda: new_timespan + coverage)
+
+    unsorted_timespans = _coverage(args.sum_timespans, TimeSpan)
+    random.Random(0).shuffle(unsorted_timespans)
+    yield ("timespan_sum", None, lambda: sum(unsorted_timespans))
+
+    year = TimeSpan(
+        datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2016, 1, 1, tzinfo=datetime.timezone.utc),
+    )
+    yield ("timespan_split", None, lambda: year / args.timespans)
+
+    photos = json.loads(search_page(args.photos))["photos"]["photo"]
+    yield (
+        "photo_normalise",
+        None,
+        lambda: [PhotoSaver.normalise(photo) for photo in photos],
+    )
+
+    profiles = _profiles(args.photos)
+    yield (
+        "user_normalise",
+        None,
+        lambda: [UserSaver.normalise(photo) for photo in photos]
+        + [UserSaver.normalise(profile) for profile in profiles],
+    )
+
+    api_key_manager = ApiKeyManager(
+        [f"key-{i}" for i in range(8)],
+        rate_limit_per_second=1e6,
+        burst=1000,
+        calls_per_hour=1e9,
+    )
+
+    def _contention():
+        start = threading.Barrier(args.threads)
+
+        def _worker():
+            start.wait()
+            for _ in range(args.api_keys_per_thread):
+                with api_key_manager.get_api_key():
+                    pass
+
+        threads = [threading.Thread(target=_worker) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    yield ("api_key_contention", None, _contention)
+
+    cache = Cache(cache_file_basename="hot_paths_benchmark")
+
+    def _save():
+        cache["already downloaded"] = coverage
+
+    yield ("cache_save", None, _save)
+    yield (
+        "cache_load",
+        _save,
+        lambda: Cache(cache_file_basename="hot_paths_benchmark")["already downloaded"],
+    )
+
+
+def main():
+    """Run the benchmark."""
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--timespans", type=int, default=100000)
+    argparser.add_argument("--sum-timespans", type=int, default=1000)
+    argparser.add_argument("--photos", type=int, default=500)
+    argparser.add_argument("--threads", type=int, default=64)
+    argparser.add_argument("--api-keys-per-thread", type=int, default=100)
+    argparser.add_argument("--repeat", type=int, default=5)
+    argparser.add_argument("--only", action="append", help="run only this case")
+    argparser.add_argument("--output", help="write results to this JSON file")
+    argparser.add_argument("--compare", help="compare to results in this JSON file")
+    args = argparser.parse_args()
+
+    # do not touch the user’s cache file
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp()
+    os.environ.pop("LOCALAPPDATA", None)
+    warnings.filterwarnings("ignore", "No cache found")
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as compare:
+            baseline = json.load(compare)["cases"]
+
+    results = {}
+    for name, setup, function in _cases(args):
+        if args.only and name not in args.only:
+            continue
+        if setup is not None:
+            setup()
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+
+        results[name] = {"best": min(timings), "median": statistics.median(timings)}
+
+        comparison = ""
+        if name in baseline:
+            comparison = (
+                f" ({baseline[name]['median'] / results[name]['median']:.2f}× "
+                "the baseline)"
+            )
+        print(
+            f"{name:>20}: best {results[name]['best'] * 1000:10.2f} ms, "
+            f"median {results[name]['median'] * 1000:10.2f} ms{comparison}"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(
+                {
+                    "benchmark": "hot_paths",
+                    "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "parameters": vars(args),
+                    "cases": results,
+                },
+                output,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure end-to-end ingest throughput, from API response to committed row.
+
+Starts a local fake flickr API (flickrhistory.fakeflickrapi) in a separate
+process, then runs the complete `download()` of a BasicFlickrHistoryDownloader
+against it and a local PostgreSQL/PostGIS database, until a budget of photos
+or of wall-clock time is used up. Reports:
+
+- throughput (photos per second)
+- p50/p99 latency from receiving a page of results to having committed
+  each of its photos
+- database round-trips (statements, commits, rollbacks) per photo
+- CPU time of the downloading process per photo
+
+and writes them, together with the parameters, as JSON (`--output`).
+
+The database is written to (and, with `--drop-tables`, emptied first):
+use a scratch database, e.g.,
+`--database postgresql://localhost/flickrhistory_benchmark`.
+
+Run with `python benchmarks/ingest_throughput.py --help`
+(flickrhistory has to be importable, e.g., `pip install -e .`).
+"""
+
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def _wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The fake flickr API did not start listening on {port}")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    """Run the benchmark."""
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--database", required=True, help="connection string")
+    argparser.add_argument("--drop-tables", action="store_true")
+    argparser.add_argument("--photos", type=int, default=50000, help="photo budget")
+    argparser.add_argument(
+        "--duration", type=float, default=300.0, help="time budget (seconds)"
+    )
+    argparser.add_argument("--engine", choices=["threads", "asyncio"])
+    argparser.add_argument("--workers", type=int)
+    argparser.add_argument("--database-writer", choices=["orm", "copy"])
+    argparser.add_argument("--database-writer-threads", type=int)
+    argparser.add_argument("--api-keys", type=int, default=4)
+    argparser.add_argument("--rate-limit-per-second", type=float, default=20.0)
+    argparser.add_argument("--latency-median", type=float, default=0.3)
+    argparser.add_argument("--error-rate", type=float, default=0.0)
+    argparser.add_argument("--output", default="ingest_throughput.json")
+    args = argparser.parse_args()
+
+    # do not touch the user’s cache file (and start with an empty one)
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp()
+    os.environ.pop("LOCALAPPDATA", None)
+
+    port = _free_port()
+    api_keys = [f"benchmark-key-{i}" for i in range(args.api_keys)]
+    fake_api = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "flickrhistory.fakeflickrapi",
+            "--port",
+            str(port),
+            "--latency-median",
+            str(args.latency_median),
+            "--error-rate",
+            str(args.error_rate),
+            "--rate-limit-per-second",
+            str(args.rate_limit_per_second),
+        ]
+        + [f"--api-key={api_key}" for api_key in api_keys],
+        stdout=subprocess.DEVNULL,
+    )
+
+    try:
+        _wait_for_port(port)
+        results = _run(args, port, api_keys)
+    finally:
+        fake_api.terminate()
+        fake_api.wait()
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+
+    metrics = results["metrics"]
+    print(
+        f"{metrics['photos']} photos in {metrics['seconds']:.1f} s: "
+        f"{metrics['photos_per_second']:.1f} photos/s, "
+        f"commit latency p50 {(metrics['commit_latency_p50'] or 0) * 1000:.1f} ms, "
+        f"p99 {(metrics['commit_latency_p99'] or 0) * 1000:.1f} ms, "
+        f"{metrics['db_round_trips_per_photo']:.1f} DB round-trips "
+        f"and {metrics['cpu_seconds_per_photo'] * 1000:.2f} ms CPU per photo "
+        f"(written to {args.output})"
+    )
+
+
+def _run(args, port, api_keys):
+    import sqlalchemy
+
+    from flickrhistory.basicflickrhistorydownloader import (
+        BasicFlickrHistoryDownloader,
+    )
+    from flickrhistory.config import Config
+    from flickrhistory.database import CopyWriter, PhotoSaver
+    from flickrhistory.database.models.base import Base
+    from flickrhistory.exceptions import DownloadBatchIsTooLargeError
+    from flickrhistory.photodownloader import PhotoDownloader
+    from flickrhistory import __version__ as version
+
+    config = {
+        "database_connection_string": args.database,
+        "flickr_api_keys": api_keys,
+        "flickr_api_endpoint_url": f"http://127.0.0.1:{port}/services/rest/",
+        "api_rate_limit_per_second": args.rate_limit_per_second,
+        "api_calls_per_hour": args.rate_limit_per_second * 60 * 60,
+    }
+    if args.engine is not None:
+        config["download_engine"] = args.engine
+    if args.database_writer is not None:
+        config["database_writer"] = args.database_writer
+    if args.database_writer_threads is not None:
+        config["database_writer_threads"] = args.database_writer_threads
+    Config(config)
+
+    if args.drop_tables:
+        engine = sqlalchemy.create_engine(args.database)
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+    # database round-trips, of all connections of this process
+    round_trips = collections.Counter()
+    lock = threading.Lock()
+
+    def _count(kind):
+        def _listener(*args, **kwargs):
+            with lock:
+                round_trips[kind] += 1
+
+        return _listener
+
+    for event in ("before_cursor_execute", "commit", "rollback"):
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine, event, _count(event))
+
+    # latency from receiving a page to having committed each of its photos
+    received = {}
+    latencies = []
+    photos_saved = [0]
+    budget_used = threading.Event()
+    finished = threading.Event()
+
+    photos_in_results = PhotoDownloader.photos_in_results
+    photos_in_keyset_results = PhotoDownloader.photos_in_keyset_results
+    save = PhotoSaver.save
+    save_many = PhotoSaver.save_many
+    flush = CopyWriter.flush
+
+    def _timed(photos_in_results):
+        def _photos_in_results(self, results):
+            received_at = time.perf_counter()
+            try:
+                for photo in photos_in_results(self, results):
+                    received[photo["id"]] = received_at
+                    yield photo
+            except DownloadBatchIsTooLargeError as exception:
+                # the first page is saved nevertheless
+                for photo in exception.photos:
+                    received[photo["id"]] = received_at
+                raise
+
+        return _photos_in_results
+
+    def _committed(photo_ids):
+        committed_at = time.perf_counter()
+        with lock:
+            for photo_id in photo_ids:
+                # (photos completed by PhotoUpdaterThreads were not received
+                # from a search, and are not counted)
+                received_at = received.pop(photo_id, None)
+                if received_at is not None:
+                    latencies.append(committed_at - received_at)
+                    photos_saved[0] += 1
+            if photos_saved[0] >= args.photos:
+                budget_used.set()
+
+    def _save(self, data):
+        photo = save(self, data)
+        _committed([data["id"]])
+        return photo
+
+    def _save_many(self, page):
+        photos = save_many(self, page)
+        _committed([photo["id"] for photo in photos])
+        return photos
+
+    def _flush(self):
+        # (CopyWriter commits the photos it collected when it flushes)
+        photo_ids = list(self._photo_rows)
+        flush(self)
+        _committed(photo_ids)
+
+    PhotoDownloader.photos_in_results = _timed(photos_in_results)
+    PhotoDownloader.photos_in_keyset_results = _timed(photos_in_keyset_results)
+    PhotoSaver.save = _save
+    PhotoSaver.save_many = _save_many
+    CopyWriter.flush = _flush
+
+    if args.workers is not None:
+        BasicFlickrHistoryDownloader.NUM_WORKERS = args.workers
+    downloader = BasicFlickrHistoryDownloader()
+
+    def _stop_when_budget_used():
+        budget_used.wait(args.duration)
+        if not finished.is_set():
+            # the same as `kill`, downloader shuts down gracefully
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    threading.Thread(target=_stop_when_budget_used, daemon=True).start()
+    downloader.download()
+    finished.set()
+    seconds = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_started
+
+    photos = photos_saved[0]
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "benchmark": "ingest_throughput",
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "flickrhistory": version,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "database"
+        },
+        "metrics": {
+            "photos": photos,
+            "seconds": seconds,
+            "photos_per_second": photos / seconds,
+            "commit_latency_p50": percentiles[49] if percentiles else None,
+            "commit_latency_p99": percentiles[98] if percentiles else None,
+            "db_statements": round_trips["before_cursor_execute"],
+            "db_commits": round_trips["commit"],
+            "db_rollbacks": round_trips["rollback"],
+            "db_round_trips_per_photo": sum(round_trips.values()) / max(photos, 1),
+            "cpu_seconds": cpu_seconds,
+            "cpu_seconds_per_photo": cpu_seconds / max(photos, 1),
+        },
+    }
+
+
+if __name__ == "__main__":
+    main()
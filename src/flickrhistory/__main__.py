@@ -5,12 +5,80 @@
 """Download a complete history of georeferenced flickr posts."""
 
 
+import argparse
+import datetime
+
+from .archivereplayer import ArchiveReplayer
+from .config import Config
 from .flickrhistorydownloader import FlickrHistoryDownloader
+from .region import Region
+from .timespan import TimeSpan
+
+
+def _utc_datetime(value):
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
 
 
 def main():
     """Download a complete history of georeferenced flickr posts."""
-    FlickrHistoryDownloader().download()
+    argparser = argparse.ArgumentParser(
+        prog="flickrhistory",
+        description="Download a complete history of georeferenced flickr posts.",
+    )
+    argparser.add_argument(
+        "command",
+        nargs="?",
+        choices=["download", "plan", "replay"],
+        default="download",
+        help=(
+            "download (default): download all photos not yet downloaded; "
+            "plan: estimate how many API calls and how much time that takes; "
+            "replay: save the API responses kept in the `response_archive` "
+            "to the database again, without calling the API"
+        ),
+    )
+    argparser.add_argument(
+        "--start",
+        type=_utc_datetime,
+        help="replay: only searches for photos uploaded after (ISO 8601 date)",
+    )
+    argparser.add_argument(
+        "--end",
+        type=_utc_datetime,
+        help="replay: only searches for photos uploaded before (ISO 8601 date)",
+    )
+    argparser.add_argument(
+        "--region",
+        help=(
+            "download only photos in this region (one of `regions` in the "
+            "configuration, default: `region` in the configuration)"
+        ),
+    )
+    args = argparser.parse_args()
+
+    if args.region is not None:
+        Config({"region": args.region})
+    try:
+        Region()
+    except ValueError as exception:
+        argparser.error(str(exception))
+
+    if args.command == "plan":
+        FlickrHistoryDownloader().plan()
+    elif args.command == "replay":
+        timespan = None
+        if args.start is not None or args.end is not None:
+            timespan = TimeSpan(
+                args.start
+                or datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc),
+                args.end or datetime.datetime.now(datetime.timezone.utc),
+            )
+        ArchiveReplayer().replay(timespan)
+    else:
+        FlickrHistoryDownloader().download()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Base class for downloaders querying the flickr API."""
+
+
+__all__ = ["ApiDownloader"]
+
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+import requests
+import urllib3
+
+from .apisession import ApiSession
+from .config import Config
+from .exceptions import ApiResponseError, InvalidApiKeyError
+from .responsearchive import ResponseArchive
+from .responsedecoder import ResponseDecoder
+from .retrypolicy import RetryPolicy
+
+
+# flickr error codes, see https://www.flickr.com/services/api/
+# (codes below 95 are specific to each method, e.g., “user not found”)
+FIRST_API_WIDE_ERROR_CODE = 95
+INVALID_API_KEY = 100
+
+# deadlines for connecting to the API and for each read (seconds),
+# see `api_connect_timeout` and `api_read_timeout` in the configuration
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+
+# hedged requests (`api_hedged_requests`): once a call takes longer than
+# HEDGE_PERCENTILE % of the recent LATENCY_SAMPLES calls, send the same
+# query again with another API key, and use its answer if it comes first,
+# or if the first call fails
+HEDGE_PERCENTILE = 95
+LATENCY_SAMPLES = 1000
+MIN_LATENCY_SAMPLES = 100
+MAX_HEDGED_CALLS_IN_FLIGHT = 32  # (calls waiting to be hedged, or hedged)
+
+# read streamed responses in chunks of this many bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+class ApiDownloader:
+    """
+    Base class for downloaders querying the flickr API.
+
+    Sends queries with the next free API key and tells the
+    ApiKeyManager (see ApiKeyManager.get_api_key) and the circuit breaker
+    (see RetryPolicy) how the API responded. Successful responses are
+    archived (see ResponseArchive), if configured.
+
+    Optionally, slow calls are hedged: the query is sent a second time,
+    with a different API key, in case the first request fails. The latencies
+    this is based on, and the statistics, are shared by all downloaders.
+    """
+
+    API_ENDPOINT_URL = "https://api.flickr.com/services/rest/"
+    API_KEY_PRIORITY = "search"
+
+    _lock = threading.Lock()
+    _latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+    _hedge_executor = None
+
+    # statistics
+    _num_calls = 0
+    _num_hedged_calls = 0
+    _num_hedges_won = 0
+
+    def __init__(self, api_key_manager):
+        """
+        Intialize an ApiDownloader.
+
+        Args:
+            api_key_manager: instance of an ApiKeyManager
+        """
+        self._api_key_manager = api_key_manager
+        self._response_decoder = ResponseDecoder()
+        self._response_archive = ResponseArchive()
+
+        with Config() as config:
+            try:
+                self.api_endpoint_url = config["flickr_api_endpoint_url"]
+            except KeyError:
+                self.api_endpoint_url = self.API_ENDPOINT_URL
+            try:
+                self.connect_timeout = float(config["api_connect_timeout"])
+            except KeyError:
+                self.connect_timeout = CONNECT_TIMEOUT
+            try:
+                self.read_timeout = float(config["api_read_timeout"])
+            except KeyError:
+                self.read_timeout = READ_TIMEOUT
+            try:
+                self.hedged_requests = bool(config["api_hedged_requests"])
+            except KeyError:
+                self.hedged_requests = False
+
+    def _get(self, query):
+        """Query the API and return the decoded results."""
+        retry_policy = RetryPolicy()
+        retry_policy.before_call()
+        try:
+            results = self._get_hedged(query)
+        except BaseException as exception:
+            retry_policy.after_call(exception)
+            raise
+        retry_policy.after_call()
+        return results
+
+    def _get_hedged(self, query):
+        """
+        Query the API, and again with another API key if it takes too long.
+
+        The first request is sent from the calling thread, the hedged
+        request from a shared pool of threads. Once the first request
+        is sent, it is waited for: if it fails, the answer of the hedged
+        request is used.
+        """
+        self.record_call()
+
+        hedge_after = self.hedge_after()
+        if hedge_after is None:
+            return self._get_with_api_key(query)
+
+        api_keys_used = []
+        request_sent = threading.Event()
+        primary_done = threading.Event()
+        hedge = self._shared_hedge_executor().submit(
+            self._hedge, query, api_keys_used, request_sent, primary_done, hedge_after
+        )
+
+        first_exception = None
+        try:
+            results = self._get_with_api_key(query, api_keys_used, request_sent)
+        except ApiResponseError as exception:
+            first_exception = exception
+        finally:
+            primary_done.set()
+            request_sent.set()
+
+        # use the hedged request’s answer if it came first,
+        # or if the first request failed
+        if first_exception is not None or hedge.done():
+            try:
+                hedged_results = hedge.result()
+            except ApiResponseError:
+                hedged_results = None
+            if hedged_results is not None:
+                self.record_hedge_won()
+                return hedged_results
+
+        if first_exception is not None:
+            raise first_exception
+        return results
+
+    def _hedge(self, query, api_keys_used, request_sent, primary_done, hedge_after):
+        """
+        Query the API with another API key, unless the first request is fast enough.
+
+        Returns:
+            the decoded results, or None if the query was not hedged
+        """
+        # count the time from sending the request, not from waiting for a key
+        request_sent.wait()
+        if primary_done.wait(hedge_after):
+            return None
+
+        self.record_hedge()
+        return self._get_with_api_key(query, list(api_keys_used))
+
+    def _get_with_api_key(self, query, api_keys_used=None, request_sent=None):
+        """
+        Query the API with the next free API key.
+
+        Args:
+            query: the query parameters
+            api_keys_used: list of API keys not to use, the API key used
+                is appended to it
+            request_sent: threading.Event to set once the API key is available
+        """
+        if api_keys_used is None:
+            api_keys_used = []
+        with self._api_key_manager.get_api_key(
+            self.API_KEY_PRIORITY, exclude=tuple(api_keys_used)
+        ) as api_key:
+            api_keys_used.append(api_key)
+            if request_sent is not None:
+                request_sent.set()
+
+            params = {"api_key": api_key}
+            params.update(query)
+
+            started = time.monotonic()
+            try:
+                with ApiSession().get(
+                    self.api_endpoint_url,
+                    params=params,
+                    timeout=(self.connect_timeout, self.read_timeout),
+                ) as response:
+                    self.check_status_code(response.status_code)
+                    content = response.content
+                    results = self.decode(content)
+            except (
+                ConnectionError,
+                ValueError,  # JSONDecodeError (or another JSON library’s)
+                requests.exceptions.RequestException,
+                urllib3.exceptions.HTTPError,
+            ) as exception:
+                # API hicups, let’s consider this batch
+                # unsuccessful and start over
+                raise ApiResponseError() from exception
+
+            self.check_results(results)
+            self.record_latency(time.monotonic() - started)
+            self.archive(query, content)
+
+        return results
+
+    def _get_streaming(self, query, parse):
+        """
+        Query the API, and parse the response while it arrives.
+
+        Holds on to the API key (and the connection) until the response
+        has been read completely, or the generator is closed. Calls are
+        not hedged. If responses are archived, the chunks are kept until
+        the end of the response; if the caller stops early, the rest of
+        the response is read, so that it can be archived completely.
+
+        Args:
+            query: the query parameters
+            parse: function that takes an iterator over chunks (bytes)
+                of the response and returns an iterator over its contents,
+                the first item is checked as results (see check_results())
+
+        Yields:
+            the items parse() returns
+        """
+        retry_policy = RetryPolicy()
+        retry_policy.before_call()
+        self.record_call()
+        try:
+            with self._api_key_manager.get_api_key(self.API_KEY_PRIORITY) as api_key:
+                params = {"api_key": api_key}
+                params.update(query)
+
+                try:
+                    with ApiSession().get(
+                        self.api_endpoint_url,
+                        params=params,
+                        timeout=(self.connect_timeout, self.read_timeout),
+                        stream=True,
+                    ) as response:
+                        self.check_status_code(response.status_code)
+
+                        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+                        archived_chunks = []
+                        if self._response_archive.enabled:
+                            chunks = self._tee(chunks, archived_chunks)
+
+                        items = parse(chunks)
+                        results = next(items)
+                        self.check_results(results)
+
+                        response_is_valid = True
+                        try:
+                            yield results
+                            yield from items
+                        except GeneratorExit:
+                            # the caller stopped early (e.g., keyset
+                            # pagination past the end of the time span)
+                            raise
+                        except BaseException:
+                            response_is_valid = False
+                            raise
+                        finally:
+                            if self._response_archive.enabled and response_is_valid:
+                                self._archive_remaining(query, chunks, archived_chunks)
+                except (
+                    ConnectionError,
+                    StopIteration,  # empty response
+                    ValueError,  # JSONDecodeError
+                    requests.exceptions.RequestException,
+                    urllib3.exceptions.HTTPError,
+                ) as exception:
+                    # API hicups, let’s consider this batch
+                    # unsuccessful and start over
+                    raise ApiResponseError() from exception
+        except GeneratorExit:
+            # (the API key and the connection are released)
+            retry_policy.after_call()
+            raise
+        except BaseException as exception:
+            retry_policy.after_call(exception)
+            raise
+        retry_policy.after_call()
+
+    def _archive_remaining(self, query, chunks, archived_chunks):
+        """Read the rest of a streamed response, and archive all of it."""
+        try:
+            for _ in chunks:
+                pass
+        except (
+            ConnectionError,
+            requests.exceptions.RequestException,
+            urllib3.exceptions.HTTPError,
+        ):
+            return  # incomplete, do not archive
+        self.archive(query, b"".join(archived_chunks))
+
+    @staticmethod
+    def _tee(chunks, copies):
+        for chunk in chunks:
+            copies.append(chunk)
+            yield chunk
+
+    @classmethod
+    def _shared_hedge_executor(cls):
+        with cls._lock:
+            if cls._hedge_executor is None:
+                ApiDownloader._hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_HEDGED_CALLS_IN_FLIGHT
+                )
+        return cls._hedge_executor
+
+    def hedge_after(self):
+        """
+        Return after how many seconds to hedge a call, or None not to.
+
+        Calls are hedged only if hedged requests are enabled, there is a
+        second API key to use, and enough latencies have been observed.
+        """
+        if not self.hedged_requests or self._api_key_manager.num_api_keys < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * HEDGE_PERCENTILE / 100)]
+
+    @classmethod
+    def record_latency(cls, seconds):
+        """Remember how long a successful API call took."""
+        with cls._lock:
+            cls._latencies.append(seconds)
+
+    @classmethod
+    def record_call(cls):
+        """Count an API call for the statistics."""
+        with cls._lock:
+            ApiDownloader._num_calls += 1
+
+    @classmethod
+    def record_hedge(cls):
+        """Count a hedged API call for the statistics."""
+        with cls._lock:
+            ApiDownloader._num_hedged_calls += 1
+
+    @classmethod
+    def record_hedge_won(cls):
+        """Count a hedged request that answered first for the statistics."""
+        with cls._lock:
+            ApiDownloader._num_hedges_won += 1
+
+    @classmethod
+    def statistics(cls):
+        """
+        Count API calls, and how many of them were hedged.
+
+        Returns:
+            tuple of int: (API calls, hedged calls, calls in which
+            the hedged request answered first)
+        """
+        with cls._lock:
+            return (cls._num_calls, cls._num_hedged_calls, cls._num_hedges_won)
+
+    def decode(self, content):
+        """Decode the body of an API response."""
+        return self._response_decoder.decode(content)
+
+    def archive(self, query, content):
+        """Archive the body of a successful API response (see ResponseArchive)."""
+        self._response_archive.append(query, content)
+
+    @staticmethod
+    def check_status_code(status_code):
+        """Raise an ApiResponseError if the API is throttling or failing."""
+        if status_code == 429 or status_code >= 500:
+            raise ApiResponseError(f"HTTP status {status_code}")
+
+    @staticmethod
+    def check_results(results):
+        """
+        Raise an error if results report an API-wide failure.
+
+        Errors specific to a method (e.g., “user not found”) are valid
+        answers, they are left to the downloaders to handle.
+
+        Raises:
+            InvalidApiKeyError: the API key is invalid
+            ApiResponseError: the API reported any other API-wide error
+        """
+        try:
+            if results.get("stat") != "fail":
+                return
+            code = int(results.get("code", FIRST_API_WIDE_ERROR_CODE))
+        except (AttributeError, TypeError, ValueError) as exception:
+            raise ApiResponseError(results) from exception
+
+        if code == INVALID_API_KEY:
+            raise InvalidApiKeyError(results.get("message"))
+        if code >= FIRST_API_WIDE_ERROR_CODE:
+            raise ApiResponseError(results.get("message"))
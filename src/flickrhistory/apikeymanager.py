@@ -8,17 +8,67 @@
 __all__ = ["ApiKeyManager"]
 
 
+import asyncio
+import collections
 import contextlib
-import queue
+import hashlib
+import threading
+import time
 
+from .cache import Cache
+from .exceptions import ApiResponseError, InvalidApiKeyError
 
-from .timeoutlock import TimeoutLock
 
+ONE_HOUR = 60 * 60
+ONE_MINUTE = 60
 
-class ApiKey(TimeoutLock):
-    """An API key that manages its own rate limit."""
+# share of the API key budget of each priority class,
+# see ApiKeyManager.get_api_key()
+DEFAULT_PRIORITIES = {
+    "search": 0.7,
+    "profiles": 0.2,
+    "photo_info": 0.1,
+}
 
-    def __init__(self, api_key, rate_limit_per_second):
+# adapting the rate limit of each key (AIMD): after each successful
+# call, add ADDITIVE_INCREASE calls/s (up to the configured rate limit),
+# after a failed call, multiply with MULTIPLICATIVE_DECREASE
+ADDITIVE_INCREASE = 0.05
+MULTIPLICATIVE_DECREASE = 0.5
+MIN_RATE_LIMIT_PER_SECOND = 1.0 / ONE_MINUTE
+
+# API keys the API rejects are quarantined, first for QUARANTINE seconds,
+# doubling each time the key is rejected again (up to MAX_QUARANTINE);
+# after the quarantine, one call probes whether the key is valid again
+QUARANTINE = ONE_MINUTE
+MAX_QUARANTINE = ONE_HOUR
+PROBE_TIMEOUT = ONE_MINUTE
+
+
+class ApiKey:
+    """
+    An API key that manages its own rate limit.
+
+    The rate limit is a token bucket: tokens are added at
+    `rate_limit_per_second` up to `burst` tokens, each API call
+    uses one token. On top of that, the key keeps track of how many
+    calls it made in the past hour (in one-minute bins), and does
+    not hand out more than `calls_per_hour` tokens per hour.
+
+    The rate limit adapts to how the API responds (additive increase,
+    multiplicative decrease), up to the configured `rate_limit_per_second`.
+    An API key the API rejects is quarantined, and re-admitted once a
+    probing call succeeds.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        rate_limit_per_second,
+        burst=1,
+        calls_per_hour=3600,
+        calls_per_minute=None,
+    ):
         """
         Initialise an API key.
 
@@ -26,43 +76,443 @@ class ApiKey(TimeoutLock):
             api_key: API key (mixed)
             rate_limit_per_second: How often this API key
                 can be used per second
+            burst: How many calls can be made at once
+                (after the API key has not been used for a while)
+            calls_per_hour: How often this API key can be used per hour
+            calls_per_minute: previous usage of this API key,
+                dict of {minute (seconds since epoch): number of calls}
         """
-        super().__init__(timeout=(1.0 / rate_limit_per_second))
-        self._api_key = api_key
+        self.api_key = api_key
+        self.max_rate_limit_per_second = rate_limit_per_second
+        self.rate_limit_per_second = rate_limit_per_second
+        self.burst = burst
+        self.calls_per_hour = calls_per_hour
+
+        self._tokens = burst
+        self._last_refill = time.time()
+        self._calls_per_minute = dict(calls_per_minute or {})
+
+        self._last_slow_down = 0
+        self._quarantined_until = None
+        self._quarantine = QUARANTINE
+
+    @property
+    def id(self):
+        """Return an identifier for this API key that does not reveal it."""
+        return self.id_of(self.api_key)
+
+    @staticmethod
+    def id_of(api_key):
+        """Return an identifier for api_key that does not reveal it."""
+        return hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst,
+            self._tokens + (now - self._last_refill) * self.rate_limit_per_second,
+        )
+        self._last_refill = now
+
+        # forget calls older than one hour
+        for minute in [
+            minute
+            for minute in self._calls_per_minute
+            if minute <= now - ONE_HOUR - ONE_MINUTE
+        ]:
+            del self._calls_per_minute[minute]
+
+    def next_token_time(self, now):
+        """Return when the next token becomes available (seconds since epoch)."""
+        self._refill(now)
+
+        if self._tokens >= 1:
+            next_token_time = now
+        else:
+            next_token_time = now + (1 - self._tokens) / self.rate_limit_per_second
+
+        if sum(self._calls_per_minute.values()) >= self.calls_per_hour:
+            # hourly budget used up, wait until the oldest minute expires
+            next_token_time = max(
+                next_token_time, min(self._calls_per_minute) + ONE_HOUR + ONE_MINUTE
+            )
+
+        if self._quarantined_until is not None:
+            next_token_time = max(next_token_time, self._quarantined_until)
+
+        return next_token_time
+
+    def take_token(self, now):
+        """Use one token (check next_token_time() first)."""
+        self._refill(now)
+        self._tokens -= 1
+
+        minute = int(now // ONE_MINUTE) * ONE_MINUTE
+        self._calls_per_minute[minute] = self._calls_per_minute.get(minute, 0) + 1
+
+        if self._quarantined_until is not None:
+            # this is the probing call, wait for its result
+            # (but not forever) before handing out the next token
+            self._quarantined_until = now + PROBE_TIMEOUT
+
+    @property
+    def quarantined(self):
+        """Return True while this API key is in quarantine or being probed."""
+        return self._quarantined_until is not None
 
-    def __enter__(self):
-        """Return the API key, after timeout if over rate limit."""
-        self.acquire()
-        return self._api_key
+    def speed_up(self):
+        """Increase the rate limit after a successful call."""
+        if self._quarantined_until is not None:
+            # the probing call succeeded, re-admit this key,
+            # but start slowly
+            self._quarantined_until = None
+            self._quarantine = QUARANTINE
+            self.rate_limit_per_second = max(
+                MIN_RATE_LIMIT_PER_SECOND,
+                self.max_rate_limit_per_second * MULTIPLICATIVE_DECREASE,
+            )
+            return
+
+        self.rate_limit_per_second = min(
+            self.max_rate_limit_per_second,
+            self.rate_limit_per_second + ADDITIVE_INCREASE,
+        )
+
+    def slow_down(self, started, now):
+        """
+        Decrease the rate limit after a failed call.
+
+        Args:
+            started: when the failed call was started
+            now: current time (seconds since epoch)
+        """
+        if self._quarantined_until is not None:
+            # the probing call failed, but not because the key is invalid:
+            # probe again after the same quarantine time
+            self._quarantined_until = now + self._quarantine
+            return
+
+        # calls that were in flight before the last decrease
+        # report the same congestion, do not decrease again
+        if started < self._last_slow_down:
+            return
+        self._last_slow_down = now
+
+        self._refill(now)
+        self.rate_limit_per_second = max(
+            MIN_RATE_LIMIT_PER_SECOND,
+            self.rate_limit_per_second * MULTIPLICATIVE_DECREASE,
+        )
+
+    def quarantine(self, now):
+        """Stop using this key for a while, it has been rejected by the API."""
+        self._quarantined_until = now + self._quarantine
+        self._quarantine = min(MAX_QUARANTINE, 2 * self._quarantine)
+
+    @property
+    def calls_per_minute(self):
+        """Return the calls in the past hour, per minute."""
+        return dict(self._calls_per_minute)
+
+
+class _Waiter:
+    """A thread or coroutine waiting for an API key."""
+
+    def __init__(self, priority, exclude=(), condition=None, loop=None):
+        self.priority = priority
+        self.exclude = exclude
+        self.condition = condition
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else None
+
+    def wake(self):
+        """Wake up the waiting thread or coroutine (hold the manager’s lock)."""
+        if self.condition is not None:
+            self.condition.notify()
+        else:
+            self.loop.call_soon_threadsafe(self.event.set)
 
 
 class ApiKeyManager:
-    """Manages API keys (and their rate limit)."""
+    """
+    Manages API keys (and their rate limit).
+
+    Threads and coroutines asking for an API key are served in priority
+    classes (e.g., photo search vs. profile updates), first-come-first-served
+    within each class. Between classes, tokens are shared according to the
+    classes’ weights, counting only classes that have someone waiting:
+    capacity a class does not use goes to the others.
+    """
+
+    CACHE_KEY = "api key usage"
+    CACHE_PER_REGION = False  # all regions draw from the same API keys
 
-    def __init__(self, api_keys=None, rate_limit_per_second=1.0):
-        """Intialize an API key manager."""
-        self._api_keys = queue.Queue()
+    def __init__(
+        self,
+        api_keys=None,
+        rate_limit_per_second=1.0,
+        burst=1,
+        calls_per_hour=3600,
+        priorities=None,
+    ):
+        """
+        Intialize an API key manager.
+
+        Args:
+            api_keys: list of API keys
+            rate_limit_per_second: How often each API key
+                can be used per second
+            burst: How many calls each API key can make at once
+            calls_per_hour: How often each API key can be used per hour
+            priorities: dict of {priority class: weight},
+                overrides the weights of DEFAULT_PRIORITIES
+        """
+        self._api_keys = []
         self.rate_limit_per_second = rate_limit_per_second
+        self.burst = burst
+        self.calls_per_hour = calls_per_hour
+
+        self._priorities = dict(DEFAULT_PRIORITIES)
+        if priorities is not None:
+            self._priorities.update(priorities)
+        for priority, weight in self._priorities.items():
+            if float(weight) <= 0:
+                raise ValueError(
+                    f"API key priority {priority!r} needs a weight greater than 0"
+                )
+            self._priorities[priority] = float(weight)
+
+        # protects the token buckets and the queues of waiters
+        self._lock = threading.Lock()
+
+        # who is waiting for an API key, and how many tokens (divided by
+        # its weight) each priority class received (“virtual time”)
+        self._waiters = {priority: collections.deque() for priority in self._priorities}
+        self._served = {priority: 0.0 for priority in self._priorities}
+
+        with Cache(per_region=self.CACHE_PER_REGION) as cache:
+            try:
+                self._usage = dict(cache[self.CACHE_KEY])
+            except KeyError:
+                self._usage = {}
 
-        self._has_api_keys = False
         if api_keys is not None:
             for api_key in api_keys:
                 self.add_api_key(api_key)
 
+    @property
+    def num_api_keys(self):
+        """Return the number of API keys."""
+        return len(self._api_keys)
+
     def add_api_key(self, api_key):
         """Add an API key to the manager."""
-        self._api_keys.put(ApiKey(api_key, self.rate_limit_per_second))
-        self._has_api_keys = True
+        api_key = ApiKey(
+            api_key,
+            self.rate_limit_per_second,
+            self.burst,
+            self.calls_per_hour,
+            self._usage.get(ApiKey.id_of(api_key)),
+        )
+        with self._lock:
+            self._api_keys.append(api_key)
+
+    def _enqueue(self, waiter):
+        """Add waiter to the queue of its priority class (hold self._lock)."""
+        try:
+            waiters = self._waiters[waiter.priority]
+        except KeyError:
+            raise ValueError(f"Unknown API key priority {waiter.priority!r}") from None
+
+        if not waiters:
+            # a class that was idle does not get to catch up
+            # on the tokens it did not use
+            served = [
+                self._served[priority]
+                for priority, other_waiters in self._waiters.items()
+                if other_waiters
+            ]
+            if served:
+                self._served[waiter.priority] = max(
+                    self._served[waiter.priority], min(served)
+                )
+
+        waiters.append(waiter)
+
+    def _next_waiter(self):
+        """Return who is served next (hold self._lock)."""
+        try:
+            priority = min(
+                [priority for priority, waiters in self._waiters.items() if waiters],
+                key=lambda priority: self._served[priority],
+            )
+        except ValueError:  # nobody waiting
+            return None
+        return self._waiters[priority][0]
+
+    def _dequeue(self, waiter):
+        """Remove waiter from its queue, wake up who is next (hold self._lock)."""
+        self._waiters[waiter.priority].remove(waiter)
+        next_waiter = self._next_waiter()
+        if next_waiter is not None:
+            next_waiter.wake()
+
+    def _take_next_token(self, waiter):
+        """
+        Take a token from the API key that has the earliest next token.
+
+        Only the waiter whose turn it is receives a token (hold self._lock).
+
+        Returns:
+            tuple (ApiKey or None, float or None): the API key, if a token
+            was available, and else how many seconds to wait for one
+            (None: wait until it is waiter’s turn)
+        """
+        if self._next_waiter() is not waiter:
+            return (None, None)
+
+        now = time.time()
+        api_keys = [
+            api_key
+            for api_key in self._api_keys
+            if api_key.api_key not in waiter.exclude
+        ] or self._api_keys
+        api_key, next_token_time = min(
+            [(api_key, api_key.next_token_time(now)) for api_key in api_keys],
+            key=lambda api_key_and_time: api_key_and_time[1],
+        )
+        if next_token_time > now:
+            return (None, next_token_time - now)
+
+        api_key.take_token(now)
+        self._served[waiter.priority] += 1.0 / self._priorities[waiter.priority]
+        self._dequeue(waiter)
+        return (api_key, 0)
+
+    def _report(self, api_key, started, exception):
+        """
+        Adapt api_key’s rate limit to how the API responded.
+
+        Args:
+            api_key: the ApiKey used
+            started: when the API call started (seconds since epoch)
+            exception: the exception raised while using api_key, or None
+        """
+        with self._lock:
+            now = time.time()
+            if exception is None:
+                api_key.speed_up()
+            elif isinstance(exception, InvalidApiKeyError):
+                api_key.quarantine(now)
+            elif isinstance(exception, ApiResponseError):
+                api_key.slow_down(started, now)
+            else:
+                return
+
+            # the next token might be available earlier (or later) now
+            next_waiter = self._next_waiter()
+            if next_waiter is not None:
+                next_waiter.wake()
 
     @contextlib.contextmanager
-    def get_api_key(self):
-        """Retrieve the next available API key."""
-        if not self._has_api_keys:
+    def get_api_key(self, priority="search", exclude=()):
+        """
+        Retrieve the next available API key.
+
+        Use the API key only inside the context: the manager adapts the
+        key’s rate limit to whether the context exits normally, or with
+        an ApiResponseError (slow down) or InvalidApiKeyError (quarantine).
+
+        Args:
+            priority: priority class of the API call,
+                one of the keys of DEFAULT_PRIORITIES
+            exclude: API keys not to use (unless there are no others)
+        """
+        if not self._api_keys:
             raise RuntimeError("No API keys configured")
 
-        api_key = self._api_keys.get()
-        with api_key as key:
+        with self._lock:
+            waiter = _Waiter(
+                priority, exclude, condition=threading.Condition(self._lock)
+            )
+            self._enqueue(waiter)
             try:
-                yield key
-            finally:
-                self._api_keys.put(api_key)
+                while True:
+                    api_key, wait_time = self._take_next_token(waiter)
+                    if api_key is not None:
+                        break
+                    waiter.condition.wait(wait_time)
+            except BaseException:
+                self._dequeue(waiter)
+                raise
+
+        started = time.time()
+        try:
+            yield api_key.api_key
+        except BaseException as exception:
+            self._report(api_key, started, exception)
+            raise
+        self._report(api_key, started, None)
+
+    @contextlib.asynccontextmanager
+    async def get_api_key_async(self, priority="search", exclude=()):
+        """
+        Retrieve the next available API key, without blocking the event loop.
+
+        Args:
+            priority: priority class of the API call,
+                one of the keys of DEFAULT_PRIORITIES
+            exclude: API keys not to use (unless there are no others)
+        """
+        if not self._api_keys:
+            raise RuntimeError("No API keys configured")
+
+        waiter = _Waiter(priority, exclude, loop=asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(waiter)
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    api_key, wait_time = self._take_next_token(waiter)
+                if api_key is not None:
+                    break
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                self._dequeue(waiter)
+            raise
+
+        started = time.time()
+        try:
+            yield api_key.api_key
+        except BaseException as exception:
+            self._report(api_key, started, exception)
+            raise
+        self._report(api_key, started, None)
+
+    @property
+    def statistics(self):
+        """
+        Report the current (adapted) rate limits.
+
+        Returns:
+            tuple: (calls per second all API keys allow in total,
+            number of quarantined API keys)
+        """
+        with self._lock:
+            return (
+                sum(
+                    api_key.rate_limit_per_second
+                    for api_key in self._api_keys
+                    if not api_key.quarantined
+                ),
+                len([api_key for api_key in self._api_keys if api_key.quarantined]),
+            )
+
+    def to_cache(self):
+        """Return the usage of all API keys in the past hour, for the cache."""
+        with self._lock:
+            return {api_key.id: api_key.calls_per_minute for api_key in self._api_keys}
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""A requests.Session sharing a pool of keep-alive connections to the API."""
+
+
+__all__ = ["ApiSession"]
+
+
+import multiprocessing
+import threading
+
+import requests
+import requests.adapters
+
+from .config import Config
+
+
+# one connection per worker thread (photo downloaders, profile updaters,
+# photo updaters), see BasicFlickrHistoryDownloader.NUM_WORKERS
+CONNECTIONS_PER_HOST = multiprocessing.cpu_count() * 3
+NUM_HOSTS = 4
+
+
+class ApiSession:
+    """
+    A requests.Session sharing a pool of keep-alive connections to the API.
+
+    Each thread receives its own requests.Session (they are not guaranteed
+    to be thread-safe), but all sessions of a process are mounted on the same
+    HTTPAdapter, i.e., they draw from the same urllib3 connection pool and
+    reuse already established (TCP+TLS) connections to api.flickr.com.
+    """
+
+    _adapter = None
+    _adapter_lock = threading.Lock()
+    _thread_local = threading.local()
+
+    def __new__(cls, *args, **kwargs):
+        """Return this thread’s requests.Session."""
+        try:
+            session = cls._thread_local.session
+        except AttributeError:
+            session = requests.Session()
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+            adapter = cls._shared_adapter()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            cls._thread_local.session = session
+        return session
+
+    @classmethod
+    def _shared_adapter(cls):
+        with cls._adapter_lock:
+            if cls._adapter is None:
+                with Config() as config:
+                    try:
+                        connections_per_host = int(config["api_connections_per_host"])
+                    except KeyError:
+                        connections_per_host = CONNECTIONS_PER_HOST
+                    try:
+                        num_hosts = int(config["api_connection_pools"])
+                    except KeyError:
+                        num_hosts = NUM_HOSTS
+
+                cls._adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=num_hosts,
+                    pool_maxsize=connections_per_host,
+                    pool_block=True,  # enforce the per-host limit
+                )
+        return cls._adapter
+
+    @classmethod
+    def statistics(cls):
+        """
+        Count requests, and how many of them reused an existing connection.
+
+        Returns:
+            tuple of int: (requests, new connections, reused connections)
+        """
+        num_requests = 0
+        num_connections = 0
+
+        if cls._adapter is not None:
+            pools = cls._adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                try:
+                    pool = pools[pool_key]
+                except KeyError:  # evicted in the meantime
+                    continue
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+
+        return (num_requests, num_connections, num_requests - num_connections)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Rebuild or repair the database from archived API responses."""
+
+
+__all__ = ["ArchiveReplayer"]
+
+
+import collections
+import datetime
+import sys
+
+from .database import PhotoSaver, Session, UserSaver
+from .licensedownloader import LicenseDownloader
+from .photoupdater import PhotoUpdater
+from .region import Region
+from .responsearchive import ResponseArchive
+from .responsedecoder import ResponseDecoder
+from .userprofiledownloader import UserProfileDownloader
+
+
+class ArchiveReplayer:
+    """
+    Rebuild or repair the database from archived API responses.
+
+    Reads the responses kept by a ResponseArchive, oldest first, and
+    saves their contents the same way downloading them does, without
+    calling the API. Photos outside the configured Region are skipped,
+    as they are when downloading.
+    """
+
+    # print progress every so many responses
+    STATUS_UPDATE_RESPONSES = 1000
+    STATUS_UPDATE_LINE_END = "\r" if sys.stderr.isatty() else "\n"
+
+    def __init__(self, response_archive=None):
+        """
+        Initialise an ArchiveReplayer.
+
+        Args:
+            response_archive: the ResponseArchive to read
+                (default: `response_archive` in the configuration)
+        """
+        if response_archive is None:
+            response_archive = ResponseArchive()
+        if not response_archive.enabled:
+            raise ValueError("No response_archive configured, nothing to replay")
+        self._response_archive = response_archive
+
+        self._response_decoder = ResponseDecoder()
+        self._region = Region()
+
+        # the downloaders know how to read their results,
+        # they do not call the API when given results
+        self._photo_updater = PhotoUpdater(api_key_manager=None)
+        self._user_profile_downloader = UserProfileDownloader(api_key_manager=None)
+        self._license_downloader = LicenseDownloader(api_key_manager=None)
+
+        self.count = collections.Counter()
+
+    def replay(self, timespan=None):
+        """
+        Save the contents of archived responses to the database.
+
+        Args:
+            timespan: only replay searches for photos uploaded in this
+                TimeSpan (default: replay all responses)
+        """
+        # create a session to initialise the database
+        _ = Session()
+
+        for record in self._response_archive.records(timespan):
+            try:
+                method = record["method"]
+                query = record["query"]
+                response = record["response"]
+            except (KeyError, TypeError):
+                continue
+
+            try:
+                if method == "flickr.photos.search":
+                    self._replay_search(query, response)
+                elif method == "flickr.photos.getInfo":
+                    PhotoSaver().save(
+                        self._photo_updater.data_from_results(
+                            query["photo_id"], self._response_decoder.decode(response)
+                        )
+                    )
+                    self.count["photo details"] += 1
+                elif method == "flickr.profile.getProfile":
+                    UserSaver().save(
+                        self._user_profile_downloader.profile_from_results(
+                            query["user_id"], self._response_decoder.decode(response)
+                        )
+                    )
+                    self.count["user profiles"] += 1
+                elif method == "flickr.photos.licenses.getInfo":
+                    self._license_downloader.save_licenses(
+                        self._response_decoder.decode(response)
+                    )
+                else:
+                    continue
+            except (KeyError, TypeError, ValueError):
+                # incomplete (or otherwise bogus) response, which the
+                # download did not save either
+                self.count["skipped"] += 1
+                continue
+
+            self.count["responses"] += 1
+            if self.count["responses"] % self.STATUS_UPDATE_RESPONSES == 0:
+                self.report_progress()
+
+        self.summarise_overall_progress()
+
+    def _replay_search(self, query, response):
+        results = self._response_decoder.decode_search_results(response)
+        end = datetime.datetime.fromtimestamp(
+            float(query["max_upload_date"]), tz=datetime.timezone.utc
+        )
+
+        for photo in results["photos"]["photo"]:
+            photo = PhotoSaver.normalise(photo)
+            # see PhotoDownloader.photos_in_results
+            if photo["date_posted"] <= end and self._region.contains(photo):
+                PhotoSaver().save(photo)
+                self.count["photos"] += 1
+
+    def report_progress(self):
+        """Report current progress."""
+        print(
+            (
+                f"Replayed {self.count['responses']: 8d} responses: "
+                f"{self.count['photos']: 8d} photos, "
+                f"{self.count['photo details']: 6d} photo details, "
+                f"{self.count['user profiles']: 6d} user profiles"
+            ),
+            file=sys.stderr,
+            end=self.STATUS_UPDATE_LINE_END,
+            flush=True,
+        )
+
+    def summarise_overall_progress(self):
+        """Summarise what we have done."""
+        print(
+            f"Replayed {self.count['responses']} archived responses, "
+            f"saved {self.count['photos']} photos, "
+            f"{self.count['photo details']} photo details, "
+            f"and {self.count['user profiles']} user profiles "
+            f"(skipped {self.count['skipped']} incomplete responses)",
+            file=sys.stderr,
+        )
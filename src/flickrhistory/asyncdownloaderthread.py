@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Download photos and update profiles as coroutines of one event loop."""
+
+
+__all__ = ["AsyncDownloaderThread"]
+
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import threading
+import time
+
+import aiohttp
+
+from .apidownloader import CONNECT_TIMEOUT, READ_TIMEOUT
+from .apisession import CONNECTIONS_PER_HOST
+from .config import Config
+from .database import PhotoSaver, UserSaver
+from .exceptions import ApiResponseError, DownloadBatchIsTooLargeError
+from .photodownloader import MAX_PAGES_IN_FLIGHT, PhotoDownloader
+from .photoupdater import PhotoUpdater
+from .photoupdaterthread import PhotoUpdaterThread
+from .retrypolicy import RetryPolicy
+from .userprofiledownloader import UserProfileDownloader
+from .userprofileupdaterthread import UserProfileUpdaterThread
+
+
+class AsyncDownloaderThread(threading.Thread):
+    """
+    Download photos and update profiles as coroutines of one event loop.
+
+    Does the work of PhotoDownloaderThreads, UserProfileUpdaterThreads and
+    PhotoUpdaterThreads, but runs it as coroutines sharing one thread and
+    one aiohttp connection pool. The number of coroutines can therefore
+    be much higher than the number of threads, and concurrency is bounded
+    by the budget of the ApiKeyManager rather than by the OS.
+
+    Database writes are blocking, they run in a small thread pool.
+    """
+
+    # how many coroutines per API key do each kind of work
+    WORKERS_PER_API_KEY = 4
+
+    # how many incomplete records to fetch from the database at once
+    ID_BATCH_SIZE = 100
+
+    def __init__(self, api_key_manager, todo_deque, done_queue, num_db_workers):
+        """
+        Intialize an AsyncDownloaderThread.
+
+        Args:
+            api_key_manager: instance of an ApiKeyManager
+            todo_deque: collections.deque that serves TimeSpans
+                        that need to be downloaded
+            done_queue: queue.Queue into which to put TimeSpans
+                        that have been downloaded
+            num_db_workers: how many threads write to the database
+
+        """
+        super().__init__()
+
+        self.photo_count = 0
+        self.profile_count = 0
+        self.photo_info_count = 0
+        self.num_workers = 0
+
+        self._api_key_manager = api_key_manager
+        self._todo_deque = todo_deque
+        self._done_queue = done_queue
+        self._num_db_workers = num_db_workers
+        self._retry_policy = RetryPolicy()
+
+        self.shutdown = threading.Event()
+
+        with Config() as config:
+            try:
+                self._num_api_workers = int(config["async_workers"])
+            except KeyError:
+                self._num_api_workers = self.WORKERS_PER_API_KEY * len(
+                    config["flickr_api_keys"]
+                )
+
+    def run(self):
+        """Run the event loop until all work is done (or shutdown)."""
+        asyncio.run(self._main())
+
+    async def _main(self):
+        with Config() as config:
+            try:
+                connections_per_host = int(config["api_connections_per_host"])
+            except KeyError:
+                connections_per_host = CONNECTIONS_PER_HOST
+            try:
+                connect_timeout = float(config["api_connect_timeout"])
+            except KeyError:
+                connect_timeout = CONNECT_TIMEOUT
+            try:
+                read_timeout = float(config["api_read_timeout"])
+            except KeyError:
+                read_timeout = READ_TIMEOUT
+
+        # (re-)use the database queries of the updater threads
+        profiles = UserProfileUpdaterThread(self._api_key_manager)
+        photos = PhotoUpdaterThread(self._api_key_manager)
+
+        self._db_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._num_db_workers
+        )
+        try:
+            async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=connections_per_host),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=connect_timeout, sock_read=read_timeout
+                ),
+                auto_decompress=True,
+            ) as self._session:
+                await asyncio.gather(
+                    *[self._download_photos() for _ in range(self._num_api_workers)],
+                    self._update_records(
+                        lambda: profiles.nsids_of_users_without_detailed_information,
+                        self._get_profile,
+                        UserSaver().save,
+                        "profile_count",
+                    ),
+                    self._update_records(
+                        lambda: photos.ids_of_photos_without_detailed_information,
+                        self._get_photo_info,
+                        PhotoSaver().save,
+                        "photo_info_count",
+                    ),
+                )
+        finally:
+            self._db_executor.shutdown()
+
+    async def _get(self, downloader, query):
+        """Query the API (with the next free key) and return decoded results."""
+        self._retry_policy.before_call()
+        try:
+            results = await self._get_hedged(downloader, query)
+        except BaseException as exception:
+            self._retry_policy.after_call(exception)
+            raise
+        self._retry_policy.after_call()
+        return results
+
+    async def _get_hedged(self, downloader, query):
+        """Query the API, and again with another API key if it takes too long."""
+        downloader.record_call()
+
+        hedge_after = downloader.hedge_after()
+        if hedge_after is None:
+            return await self._get_with_api_key(downloader, query)
+
+        api_keys_used = []
+        request_sent = asyncio.Event()
+        primary = asyncio.create_task(
+            self._get_with_api_key(downloader, query, api_keys_used, request_sent)
+        )
+        primary.add_done_callback(lambda _: request_sent.set())
+        calls = {primary}
+
+        try:
+            # count the time from sending the request, not from waiting for a key
+            await request_sent.wait()
+            done, _ = await asyncio.wait(calls, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            hedge = asyncio.create_task(
+                self._get_with_api_key(downloader, query, list(api_keys_used))
+            )
+            downloader.record_hedge()
+            calls.add(hedge)
+
+            first_exception = None
+            while calls:
+                done, calls = await asyncio.wait(
+                    calls, return_when=asyncio.FIRST_COMPLETED
+                )
+                for call in done:
+                    try:
+                        results = call.result()
+                    except ApiResponseError as exception:
+                        first_exception = first_exception or exception
+                        continue
+                    if call is hedge:
+                        downloader.record_hedge_won()
+                    return results
+            raise first_exception
+
+        finally:
+            # whichever request is still running lost
+            for call in calls:
+                call.cancel()
+
+    async def _get_with_api_key(
+        self, downloader, query, api_keys_used=None, request_sent=None
+    ):
+        if api_keys_used is None:
+            api_keys_used = []
+        async with self._api_key_manager.get_api_key_async(
+            downloader.API_KEY_PRIORITY, exclude=tuple(api_keys_used)
+        ) as api_key:
+            api_keys_used.append(api_key)
+            if request_sent is not None:
+                request_sent.set()
+
+            params = {"api_key": api_key}
+            params.update(query)
+
+            started = time.monotonic()
+            try:
+                async with self._session.get(
+                    downloader.api_endpoint_url, params=params
+                ) as response:
+                    downloader.check_status_code(response.status)
+                    content = await response.read()
+                    results = downloader.decode(content)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                ValueError,  # JSONDecodeError (or another JSON library’s)
+            ) as exception:
+                # API hicups, let’s consider this batch
+                # unsuccessful and start over
+                raise ApiResponseError() from exception
+
+            downloader.check_results(results)
+            downloader.record_latency(time.monotonic() - started)
+            downloader.archive(query, content)
+
+        return results
+
+    async def _sleep(self, seconds):
+        """Sleep, but wake up every 1/10 sec to check whether to shut down."""
+        for _ in range(int(seconds * 10)):
+            if self.shutdown.is_set():
+                break
+            await asyncio.sleep(0.1)
+
+    async def _in_db_executor(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db_executor, function, *args
+        )
+
+    async def _photos(self, photo_downloader):
+        """Iterate over downloaded photos (see PhotoDownloader.photos)."""
+        if photo_downloader.pagination == "keyset":
+            while not photo_downloader.keyset_exhausted:
+                results = await self._get(
+                    photo_downloader, photo_downloader.keyset_query()
+                )
+                for photo in photo_downloader.photos_in_keyset_results(results):
+                    yield photo
+            return
+
+        results = await self._get(photo_downloader, photo_downloader.query(1))
+
+        try:
+            for photo in photo_downloader.photos_in_results(results):
+                yield photo
+        except KeyError:
+            pass  # moving on to next page, if exists
+
+        remaining_pages = iter(range(2, int(results["photos"]["pages"]) + 1))
+
+        def _get_page(page):
+            return asyncio.create_task(
+                self._get(photo_downloader, photo_downloader.query(page))
+            )
+
+        pages_in_flight = collections.deque(
+            _get_page(page)
+            for page in itertools.islice(remaining_pages, MAX_PAGES_IN_FLIGHT)
+        )
+        try:
+            while pages_in_flight:
+                results = await pages_in_flight.popleft()
+
+                for page in itertools.islice(remaining_pages, 1):
+                    pages_in_flight.append(_get_page(page))
+
+                try:
+                    for photo in photo_downloader.photos_in_results(results):
+                        yield photo
+                except KeyError:
+                    pass  # moving on to next page, if exists
+        finally:
+            for task in pages_in_flight:
+                task.cancel()
+
+    async def _download_photos(self):
+        """Get TimeSpans off todo_deque and download photos."""
+        self.num_workers += 1
+
+        while not self.shutdown.is_set():
+            try:
+                timespan = self._todo_deque.pop()
+            except IndexError:
+                break
+
+            photo_downloader = PhotoDownloader(timespan, self._api_key_manager)
+            retry_key = (timespan.start, timespan.end)
+
+            try:
+                async with contextlib.aclosing(
+                    self._photos(photo_downloader)
+                ) as photos:
+                    async for photo in photos:
+                        photo = await self._in_db_executor(PhotoSaver().save, photo)
+
+                        self.photo_count += 1
+
+                        if self.shutdown.is_set():
+                            # let’s only report back on how much we
+                            # in fact downloaded, not what our quota was
+                            timespan.end = photo.date_posted
+                            break
+
+            except ApiResponseError:
+                # API returned some bogus/none-JSON data
+                # (or has been failing for a while), let’s
+                # wait a bit, then add this timespan to the other
+                # end of the todo deque and start over
+                # (unless we tried too often, then the next run will)
+                delay = self._retry_policy.delay(retry_key)
+                if delay is not None:
+                    await self._sleep(delay)
+                    self._todo_deque.appendleft(timespan)
+                continue
+
+            except DownloadBatchIsTooLargeError as exception:
+                # too many photos in this time span,
+                # let’s save the first page we already
+                # downloaded, split the rest of the time span
+                # into small enough pieces, and re-inject
+                # them to the todo deque
+                self._retry_policy.forget(retry_key)
+                downloaded, pieces = photo_downloader.split(exception)
+
+                for photo in exception.photos:
+                    await self._in_db_executor(PhotoSaver().save, photo)
+                    self.photo_count += 1
+                if downloaded is not None:
+                    self._done_queue.put(downloaded)
+
+                for piece in reversed(pieces):
+                    self._todo_deque.append(piece)
+                continue
+
+            # … report to parent thread how much we worked
+            self._retry_policy.forget(retry_key)
+            self._done_queue.put(timespan)
+
+        self.num_workers -= 1
+
+    async def _get_profile(self, nsid):
+        user_profile_downloader = UserProfileDownloader(self._api_key_manager)
+        results = await self._get(
+            user_profile_downloader,
+            user_profile_downloader.query(nsid),
+        )
+        return user_profile_downloader.profile_from_results(nsid, results)
+
+    async def _get_photo_info(self, photo_id):
+        photo_updater = PhotoUpdater(self._api_key_manager)
+        results = await self._get(
+            photo_updater,
+            photo_updater.query(photo_id),
+        )
+        return photo_updater.data_from_results(photo_id, results)
+
+    async def _update_records(self, incomplete_ids, download, save, counter):
+        """
+        Complete records with missing data.
+
+        Args:
+            incomplete_ids: function returning a generator of ids of
+                incomplete records (cf. UserProfileUpdaterThread,
+                PhotoUpdaterThread)
+            download: coroutine function that retrieves data for an id
+            save: function that saves the data to the database
+            counter: name of the attribute that counts updated records
+
+        """
+        ids = asyncio.Queue(maxsize=(2 * self.ID_BATCH_SIZE))
+
+        async def _worker():
+            self.num_workers += 1
+            while True:
+                id_ = await ids.get()
+                try:
+                    if id_ is None:
+                        break
+                    data = await download(id_)
+                    await self._in_db_executor(save, data)
+                    setattr(self, counter, getattr(self, counter) + 1)
+                    self._retry_policy.forget((counter, id_))
+                except ApiResponseError:
+                    # API returned some bogus/none-JSON data
+                    # (or has been failing for a while),
+                    # let’s wait a bit, and try again later
+                    delay = self._retry_policy.delay((counter, id_))
+                    if delay is not None:
+                        await self._sleep(delay)
+                finally:
+                    ids.task_done()
+            self.num_workers -= 1
+
+        workers = [asyncio.create_task(_worker()) for _ in range(self._num_api_workers)]
+
+        ids_of_incomplete_records = incomplete_ids()
+
+        while not self.shutdown.is_set():
+            # the generator holds a database cursor, get batches of ids
+            # in the thread pool rather than blocking the event loop
+            batch = await self._in_db_executor(
+                list, itertools.islice(ids_of_incomplete_records, self.ID_BATCH_SIZE)
+            )
+
+            for id_ in batch:
+                await ids.put(id_)
+                if self.shutdown.is_set():
+                    break
+
+            if not batch:
+                # once no incomplete records remain,
+                # wait for ten minutes before trying again;
+                # wake up every 1/10 sec to check whether we
+                # should shut down
+                for _ in range(10 * 60 * 10):
+                    if self.shutdown.is_set():
+                        break
+                    await asyncio.sleep(0.1)
+                ids_of_incomplete_records = incomplete_ids()
+
+        for _ in workers:
+            await ids.put(None)
+        await asyncio.gather(*workers)
@@ -11,30 +11,44 @@ __all__ = ["BasicFlickrHistoryDownloader"]
 import collections
 import datetime
 import queue
-import math
 import multiprocessing
 import sys
-import threading
 import time
 
+from .apidownloader import ApiDownloader
 from .apikeymanager import ApiKeyManager
+from .apisession import ApiSession
 from .cache import Cache
 from .cacheupdaterthread import CacheUpdaterThread
 from .config import Config
-from .database import Session
+from .database import RowCache, Session
+from .databasewriterthread import DatabaseWriterThread
 from .licensedownloader import LicenseDownloader
+from .photodownloader import MAX_PHOTOS_PER_BATCH
 from .photodownloaderthread import PhotoDownloaderThread
 from .photoupdaterthread import PhotoUpdaterThread
+from .remainingworkestimator import RemainingWorkEstimator
+from .responsearchive import ResponseArchive
+from .retrypolicy import RetryPolicy
 from .sigtermreceivedexception import SigTermReceivedException
 from .timespan import TimeSpan
+from .uploaddensitymodel import UploadDensityModel
 from .userprofileupdaterthread import UserProfileUpdaterThread
 
+try:
+    from .asyncdownloaderthread import AsyncDownloaderThread
+except ImportError:  # aiohttp not installed
+    AsyncDownloaderThread = None
+
 
 class BasicFlickrHistoryDownloader:
     """Download (all) georeferenced flickr posts."""
 
     NUM_WORKERS = multiprocessing.cpu_count()
-    NUM_MANAGERS = 2  # main thread + cache_updater
+
+    # plan time spans to contain this many photos (leaving some
+    # room for the upload density model to be wrong)
+    PHOTOS_PER_PLANNED_TIMESPAN = int(0.8 * MAX_PHOTOS_PER_BATCH)
 
     # if output into pipe (e.g. logger, systemd), then
     # print status every 10 minutes, else every 1/5 sec
@@ -42,6 +56,9 @@ class BasicFlickrHistoryDownloader:
     STATUS_UPDATE_SEC = 0.2 if sys.stderr.isatty() else 600
     STATUS_UPDATE_LINE_END = "\r" if sys.stderr.isatty() else "\n"
 
+    # how often to re-estimate the remaining download time
+    ETA_UPDATE_SEC = 10
+
     def __init__(self):
         """Intialise a FlickrHistory object."""
         self.started = datetime.datetime.now()
@@ -50,16 +67,71 @@ class BasicFlickrHistoryDownloader:
         self._done_queue = queue.Queue()
 
         self._worker_threads = []
-        self._cache_updater_thread = CacheUpdaterThread(self._done_queue)
+        self._database_writer_threads = []
+        self._async_downloader_thread = None
+        self._upload_density_model = UploadDensityModel()
+        self._remaining_work_estimator = None
+        self._last_eta = (0, None)
 
         with Config() as config:
-            self._api_key_manager = ApiKeyManager(config["flickr_api_keys"])
+            rate_limit = {}
+            for option, argument in (
+                ("api_rate_limit_per_second", "rate_limit_per_second"),
+                ("api_burst", "burst"),
+                ("api_calls_per_hour", "calls_per_hour"),
+                ("api_key_priorities", "priorities"),
+            ):
+                try:
+                    rate_limit[argument] = config[option]
+                except KeyError:
+                    pass
+            self._api_key_manager = ApiKeyManager(
+                config["flickr_api_keys"], **rate_limit
+            )
+            try:
+                self._engine = config["download_engine"]
+            except KeyError:
+                self._engine = "threads"
+
+            # downloaded pages of photos wait in a bounded queue
+            # for a separate pool of database writers
+            try:
+                self._num_database_writers = int(config["database_writer_threads"])
+            except KeyError:
+                self._num_database_writers = self.NUM_WORKERS
+            try:
+                write_queue_size = int(config["database_write_queue_size"])
+            except KeyError:
+                write_queue_size = 2 * self._num_database_writers
+
+        if self._engine not in ("threads", "asyncio"):
+            raise ValueError(
+                f"Unknown download_engine {self._engine!r}, "
+                "expected 'threads' or 'asyncio'"
+            )
+        if self._engine == "asyncio" and AsyncDownloaderThread is None:
+            raise RuntimeError(
+                "The asyncio download engine requires aiohttp, "
+                "install flickrhistory[asyncio]"
+            )
+
+        self._write_queue = queue.Queue(maxsize=write_queue_size)
+
+        self._cache_updater_thread = CacheUpdaterThread(
+            self._done_queue, [self._upload_density_model, self._api_key_manager]
+        )
 
     def download(self):
         """Download all georeferenced flickr posts."""
         # create a session to initialise the database
         _ = Session()
 
+        self._remaining_work_estimator = RemainingWorkEstimator(
+            self._api_key_manager.num_api_keys,
+            self._api_key_manager.rate_limit_per_second,
+            self.PHOTOS_PER_PLANNED_TIMESPAN,
+        )
+
         # download an updated list of possible licenses
         LicenseDownloader(self._api_key_manager).update_licenses()
 
@@ -67,35 +139,21 @@ class BasicFlickrHistoryDownloader:
             self._todo_deque.append(gap)
 
         try:
-            # start downloaders
-            for _ in range(self.NUM_WORKERS):
-                worker = PhotoDownloaderThread(
-                    self._api_key_manager, self._todo_deque, self._done_queue
-                )
-                worker.start()
-                self._worker_threads.append(worker)
-
-            # start user profile updaters
-            for i in range(self.NUM_WORKERS):
-                worker = UserProfileUpdaterThread(
-                    self._api_key_manager, (i + 1, self.NUM_WORKERS)
-                )
-                worker.start()
-                self._worker_threads.append(worker)
-
-            # start photo record updaters
-            for i in range(self.NUM_WORKERS):
-                worker = PhotoUpdaterThread(
-                    self._api_key_manager, (i + 1, self.NUM_WORKERS)
-                )
-                worker.start()
-                self._worker_threads.append(worker)
+            if self._engine == "asyncio":
+                self._start_async_downloader()
+            else:
+                self._start_worker_threads()
 
             # start cache updater
-            self._cache_updater_thread = CacheUpdaterThread(self._done_queue)
+            self._cache_updater_thread = CacheUpdaterThread(
+                self._done_queue, [self._upload_density_model, self._api_key_manager]
+            )
             self._cache_updater_thread.start()
 
-            while threading.active_count() > self.NUM_MANAGERS:
+            while any(worker.is_alive() for worker in self._worker_threads):
+                if not self._database_writers_alive:
+                    # nothing saves the downloaded photos any more
+                    raise RuntimeError("All database writer threads stopped")
                 self.report_progress()
                 time.sleep(self.STATUS_UPDATE_SEC)
 
@@ -104,28 +162,149 @@ class BasicFlickrHistoryDownloader:
             for worker in self._worker_threads:
                 worker.shutdown.set()
 
+        except RuntimeError:
+            for worker in self._worker_threads:
+                worker.shutdown.set()
+            raise
+
         finally:
             self.summarise_overall_progress()
             for worker in self._worker_threads:
-                worker.join()
+                while worker.is_alive():
+                    if not self._database_writers_alive:
+                        # unblock downloaders waiting for room in write_queue
+                        self._discard_write_queue()
+                    worker.join(timeout=0.1)
+            # no more pages to write, save the ones in the queue
+            for database_writer in self._database_writer_threads:
+                database_writer.shutdown.set()
+            for database_writer in self._database_writer_threads:
+                database_writer.join()
             self._cache_updater_thread.shutdown.set()
             self._cache_updater_thread.join()
+            ResponseArchive().close()
+
+    def _start_worker_threads(self):
+        """Start one thread per download/update worker."""
+        # start database writers
+        for _ in range(self._num_database_writers):
+            database_writer = DatabaseWriterThread(self._write_queue)
+            database_writer.start()
+            self._database_writer_threads.append(database_writer)
+
+        # start downloaders
+        for _ in range(self.NUM_WORKERS):
+            worker = PhotoDownloaderThread(
+                self._api_key_manager,
+                self._todo_deque,
+                self._done_queue,
+                self._write_queue,
+            )
+            worker.start()
+            self._worker_threads.append(worker)
+
+        # start user profile updaters
+        for i in range(self.NUM_WORKERS):
+            worker = UserProfileUpdaterThread(
+                self._api_key_manager, (i + 1, self.NUM_WORKERS)
+            )
+            worker.start()
+            self._worker_threads.append(worker)
+
+        # start photo record updaters
+        for i in range(self.NUM_WORKERS):
+            worker = PhotoUpdaterThread(
+                self._api_key_manager, (i + 1, self.NUM_WORKERS)
+            )
+            worker.start()
+            self._worker_threads.append(worker)
+
+    @property
+    def _database_writers_alive(self):
+        """Check whether database writers are saving photos (if there are any)."""
+        return not self._database_writer_threads or any(
+            database_writer.is_alive()
+            for database_writer in self._database_writer_threads
+        )
+
+    def _discard_write_queue(self):
+        """Empty write_queue, its time spans stay in the gaps of the download history."""
+        while True:
+            try:
+                _, pending_timespan = self._write_queue.get_nowait()
+            except queue.Empty:
+                break
+            pending_timespan.batch_failed()
+
+    def _start_async_downloader(self):
+        """Start one thread running all download/update work as coroutines."""
+        self._async_downloader_thread = AsyncDownloaderThread(
+            self._api_key_manager,
+            self._todo_deque,
+            self._done_queue,
+            self.NUM_WORKERS,
+        )
+        self._async_downloader_thread.start()
+        self._worker_threads.append(self._async_downloader_thread)
+
+    def plan(self):
+        """Estimate how many API calls and how much time the remaining work takes."""
+        # create a session to initialise the database
+        _ = Session()
+
+        gaps = list(self._gaps_in_download_history)
+
+        estimator = RemainingWorkEstimator(
+            self._api_key_manager.num_api_keys,
+            self._api_key_manager.rate_limit_per_second,
+            self.PHOTOS_PER_PLANNED_TIMESPAN,
+        )
+        forecast = estimator.estimate(
+            estimator.count_photos(
+                gaps, self._api_key_manager, self._api_key_manager.num_api_keys
+            ),
+            *estimator.incomplete_records_in_database(),
+        )
+        self.report_plan(len(gaps), forecast)
+
+    def report_plan(self, num_gaps, forecast):
+        """Report how much work remains."""
+        print(
+            (
+                f"{num_gaps} gaps in the download history, "
+                f"containing about {forecast['photos']} photos\n"
+                f"  {forecast['search_calls']: 12d} flickr.photos.search calls\n"
+                f"  {forecast['profile_calls']: 12d} flickr.profile.getProfile calls\n"
+                f"  {forecast['photo_info_calls']: 12d} flickr.photos.getInfo calls\n"
+                f"  {forecast['api_calls']: 12d} API calls in total, "
+                f"taking about {forecast['eta']} "
+                f"with {self._api_key_manager.num_api_keys} API keys "
+                f"at {self._api_key_manager.rate_limit_per_second} calls/s"
+            ),
+        )
 
     def report_progress(self):
-        """Report current progress."""
+        """Report current progress (in one line that fits 80 columns)."""
         photo_count, _, profile_count, _ = self._statistics
+        api_rate, _ = self._api_key_manager.statistics
         print(
             (
-                f"Downloaded metadata for {photo_count: 6d} photos "
-                f"and {profile_count: 4d} user profiles "
-                f"using {(threading.active_count() - self.NUM_MANAGERS)} workers, "
-                f"{len(self._todo_deque)} time slots to cover"
+                f"{photo_count:9d} photos, {profile_count:8d} profiles, "
+                f"{api_rate:6.1f} calls/s, ETA {self._short_eta:>10}, "
+                f"{self._write_queue.qsize():3d} queued"
             ),
             file=sys.stderr,
             end=self.STATUS_UPDATE_LINE_END,
             flush=True,
         )
 
+    @staticmethod
+    def _hit_rate(hits, misses):
+        try:
+            return hits / (hits + misses)
+        except ZeroDivisionError:
+            return 0.0
+
     def announce_shutdown(self):
         """Tell the user that we initiated shutdown."""
         print(
@@ -142,25 +321,45 @@ class BasicFlickrHistoryDownloader:
         (Called right before exit)
         """
         photo_count, _, profile_count, _ = self._statistics
+        num_requests, _, reused_connections = ApiSession.statistics()
+        hit_rate, planned_timespans, one_day_timespans = (
+            self._upload_density_model.statistics
+        )
+        retries, given_up, _ = RetryPolicy().statistics
+        api_calls, hedged_calls, hedges_won = ApiDownloader.statistics()
+        licenses, tags, users = (
+            self._hit_rate(*counts) for counts in RowCache().statistics
+        )
         print(
-            f"Downloaded {photo_count} photos and {profile_count} user profiles",
+            f"Downloaded {photo_count} photos and {profile_count} user profiles, "
+            f"{reused_connections} of {num_requests} API requests "
+            "reused an open connection, "
+            f"planned {planned_timespans} time slots "
+            f"(instead of {one_day_timespans} days), "
+            f"{hit_rate:.0%} of which were small enough, "
+            f"retried {retries} failed downloads "
+            f"(and gave up on {given_up} for this run), "
+            f"hedged {hedged_calls} of {api_calls} API calls "
+            f"({hedges_won} hedged requests answered first), "
+            f"found {licenses:.0%} of licenses, {tags:.0%} of tags, "
+            f"and {users:.0%} of users in the cache",
             file=sys.stderr,
         )
 
     @property
     def gaps_in_download_history(self):
-        """Find gaps in download history."""
+        """Find gaps in download history, cut into time spans of a good size."""
+        for gap in self._gaps_in_download_history:
+            yield from self._upload_density_model.plan(
+                gap, self.PHOTOS_PER_PLANNED_TIMESPAN
+            )
+
+    @property
+    def _gaps_in_download_history(self):
         already_downloaded = self.already_downloaded_timespans
-        one_day = datetime.timedelta(days=1)  # for comparison
 
         for i in range(len(already_downloaded) - 1):
-            gap = TimeSpan(already_downloaded[i].end, already_downloaded[i + 1].start)
-            if gap.duration > one_day:
-                divider = math.ceil(gap.duration / one_day)
-                for part_of_gap in gap / divider:
-                    yield part_of_gap
-            else:
-                yield gap
+            yield TimeSpan(already_downloaded[i].end, already_downloaded[i + 1].start)
 
     @property
     def already_downloaded_timespans(self):
@@ -197,16 +396,53 @@ class BasicFlickrHistoryDownloader:
 
         return sum(timespans)  # sum resolves overlaps
 
+    @property
+    def _eta(self):
+        """Estimate how long downloading the remaining time spans takes."""
+        if self._remaining_work_estimator is None:
+            return None
+
+        last_update, eta = self._last_eta
+        if time.time() - last_update > self.ETA_UPDATE_SEC:
+            photos_per_timespan = []
+            for timespan in tuple(self._todo_deque):
+                expected_photos = self._upload_density_model.expected_photos(timespan)
+                if expected_photos is None:
+                    expected_photos = self.PHOTOS_PER_PLANNED_TIMESPAN
+                photos_per_timespan.append(expected_photos)
+
+            eta = self._remaining_work_estimator.estimate(photos_per_timespan)["eta"]
+            self._last_eta = (time.time(), eta)
+
+        return eta
+
+    @property
+    def _short_eta(self):
+        """Format the ETA as days, hours and minutes."""
+        eta = self._eta
+        if eta is None:
+            return "?"
+        hours, seconds = divmod(eta.seconds, 3600)
+        if eta.days:
+            return f"{eta.days}d {hours:02d}:{seconds // 60:02d}"
+        return f"{hours}:{seconds // 60:02d}"
+
+    @property
+    def _num_workers(self):
+        if self._async_downloader_thread is not None:
+            return self._async_downloader_thread.num_workers
+        return sum(
+            worker.is_alive()
+            for worker in self._worker_threads + self._database_writer_threads
+        )
+
     @property
     def _statistics(self):
         runtime = float((datetime.datetime.now() - self.started).total_seconds())
 
+        # (photos saved, rather than downloaded)
         photo_count = sum(
-            [
-                worker.count
-                for worker in self._worker_threads
-                if isinstance(worker, PhotoDownloaderThread)
-            ]
+            [database_writer.count for database_writer in self._database_writer_threads]
         )
         photo_rate = photo_count / runtime
 
@@ -219,4 +455,10 @@ class BasicFlickrHistoryDownloader:
         )
         profile_rate = profile_count / runtime
 
+        if self._async_downloader_thread is not None:
+            photo_count += self._async_downloader_thread.photo_count
+            photo_rate = photo_count / runtime
+            profile_count += self._async_downloader_thread.profile_count
+            profile_rate = profile_count / runtime
+
         return (photo_count, photo_rate, profile_count, profile_rate)
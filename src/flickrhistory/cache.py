@@ -14,6 +14,8 @@ import warnings
 
 import yaml
 
+from .region import Region
+
 
 class YamlNoAliasDumper(yaml.SafeDumper):
     """YAML Dumper that does not write out aliases and anchors."""
@@ -30,14 +32,23 @@ class Cache:
     (/var/cache/{module}.yml, ~/.cache/{module}.yml,
     %LOCALAPPDATA%/{module}.yml, ${XDG_CACHE_HOME}/{module}.yml).
 
+    If a `region` is configured, it has its own cache file,
+    {module}-{region}.yml, see Region. Entries that concern all regions
+    alike (e.g., the usage of the API keys) stay in {module}.yml
+    (`per_region=False`).
+
     """
 
-    def __init__(self, cache=None, cache_file_basename=None):
+    def __init__(self, cache=None, cache_file_basename=None, per_region=True):
         """Initialise a Cache object, load cache from file."""
         self._cache = {}
+        self._in_context = False
 
         if cache_file_basename is None:
             cache_file_basename = self.__module__.split(".")[0]
+            region = Region().name if per_region else None
+            if region is not None:
+                cache_file_basename += f"-{region}"
 
         self._cache_file = os.path.abspath(
             os.path.join(
@@ -84,7 +95,8 @@ class Cache:
     def __setitem__(self, pos, value):
         """Set the value of a cache entry."""
         self._cache[pos] = value
-        self._save_cache()  # don’t rely on this!
+        if not self._in_context:  # (the context manager saves on exit)
+            self._save_cache()  # don’t rely on this!
         # if you update items inside a dict,
         # __setitem__ is not called
         #
@@ -96,7 +108,8 @@ class Cache:
     def __delitem__(self, pos):
         """Delete a cache entry."""
         del self._cache[pos]
-        self._save_cache()
+        if not self._in_context:
+            self._save_cache()
 
     def __iter__(self):
         """Iterate over all entries in the cache."""
@@ -105,8 +118,10 @@ class Cache:
     def __enter__(self):
         """Enter cache context."""
         self._load_cache()
+        self._in_context = True
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Exit cache context."""
+        self._in_context = False
         self._save_cache()
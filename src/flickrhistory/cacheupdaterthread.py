@@ -12,20 +12,27 @@ import queue
 import threading
 
 from .cache import Cache
+from .region import Region
 
 
 class CacheUpdaterThread(threading.Thread):
     """Wraps an ApiDownloader to run in a separate thread."""
 
-    def __init__(self, done_queue):
+    def __init__(self, done_queue, cached_objects=None):
         """
         Intialize a CacheUpdaterThread.
 
         Args:
             done_queue: queue.Queue with updated TimeSpans
+            cached_objects: objects whose state to save to the cache, too,
+                each with a `CACHE_KEY` attribute and a `to_cache()` method
+                (and optionally `CACHE_PER_REGION = False`, to save it to
+                the cache shared by all regions, see Cache)
         """
         super().__init__()
         self._done_queue = done_queue
+        self._cached_objects = cached_objects or []
+        self._region = Region().name
         self.shutdown = threading.Event()
         self.status = "init"
 
@@ -39,7 +46,34 @@ class CacheUpdaterThread(threading.Thread):
                         cache["already downloaded"] += newly_downloaded
                     except KeyError:
                         cache["already downloaded"] = newly_downloaded
-                    self.status = f"added {newly_downloaded}"
+                    self._update_cached_objects(cache)
+                self._update_shared_cached_objects()
+                self.status = f"added {newly_downloaded}"
             except queue.Empty:
                 if self.shutdown.is_set():
+                    with Cache() as cache:
+                        self._update_cached_objects(cache)
+                    self._update_shared_cached_objects()
                     break
+
+    def _is_shared(self, cached_object):
+        """Check whether cached_object belongs into the cache shared by all regions."""
+        return self._region is not None and not getattr(
+            cached_object, "CACHE_PER_REGION", True
+        )
+
+    def _update_cached_objects(self, cache):
+        for cached_object in self._cached_objects:
+            if not self._is_shared(cached_object):
+                cache[cached_object.CACHE_KEY] = cached_object.to_cache()
+
+    def _update_shared_cached_objects(self):
+        shared_objects = [
+            cached_object
+            for cached_object in self._cached_objects
+            if self._is_shared(cached_object)
+        ]
+        if shared_objects:
+            with Cache(per_region=False) as cache:
+                for cached_object in shared_objects:
+                    cache[cached_object.CACHE_KEY] = cached_object.to_cache()
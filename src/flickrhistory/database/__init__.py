@@ -5,15 +5,22 @@
 
 
 __all__ = [
+    "CopyWriter",
+    "FieldProfile",
     "License",
+    "NormalisedPhoto",
     "Photo",
     "PhotoSaver",
+    "RowCache",
     "Session",
     "User",
     "UserSaver",
 ]
 
+from .copy_writer import CopyWriter
+from .field_profile import FieldProfile
 from .models import License, Photo, User
-from .photo_saver import PhotoSaver
+from .photo_saver import NormalisedPhoto, PhotoSaver
+from .row_cache import RowCache
 from .session import Session
 from .user_saver import UserSaver
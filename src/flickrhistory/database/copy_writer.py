@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Save flickr photos to the database in bulk, using COPY."""
+
+
+__all__ = ["CopyWriter"]
+
+
+import datetime
+import io
+import itertools
+import os
+import time
+
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+
+from ..config import Config
+from .field_profile import FieldProfile
+from .models import Photo, User
+from .models.tag import TagPhotoAssociation
+from .photo_saver import PhotoSaver
+from .session import Session
+
+
+FLUSH_ROWS = 5000
+FLUSH_INTERVAL = 10  # seconds
+
+PHOTO_COLUMNS = (
+    "id",
+    "server",
+    "secret",
+    "title",
+    "description",
+    "date_taken",
+    "date_posted",
+    "geom",
+    "geo_accuracy",
+    "user_id",
+    "user_farm",
+    "license_id",
+)
+USER_COLUMNS = ("id", "farm", "name")
+TAG_COLUMNS = ("photo_id", "tag_tag")
+
+
+def _csv_value(value):
+    """Format a value for `COPY … WITH (FORMAT csv)`, None is NULL."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, bytes):
+        return f"\\x{value.hex()}"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        # (PostgreSQL does not accept NUL in text)
+        value = value.replace("\x00", "").replace('"', '""')
+        return f'"{value}"'
+    return str(value)
+
+
+class CopyWriter:
+    """
+    Save flickr photos to the database in bulk, using COPY.
+
+    Collects the rows of photos, users, and tags (see PhotoSaver.to_rows)
+    in memory. Every `copy_flush_rows` photos, or `copy_flush_interval`
+    seconds, streams them into UNLOGGED staging tables of its own with
+    `COPY … FROM STDIN`, and merges them into the photos, users, licenses,
+    tags, and tag_photo_associations tables with one set-based statement
+    each, all in one transaction.
+
+    Unlike `PhotoSaver.save`, NULL values do not overwrite existing
+    values (rows in the staging tables have all columns).
+
+    Not thread-safe: use one CopyWriter per worker thread.
+    """
+
+    # staging tables of different writers (and processes) must not collide
+    _writer_ids = itertools.count()
+
+    def __init__(self, field_profile=None, flush_rows=None, flush_interval=None):
+        """
+        Initialise a CopyWriter.
+
+        Args:
+            field_profile: the FieldProfile whose fields to save
+                (default: `field_profile` in the configuration)
+            flush_rows: write to the database once so many photos are
+                collected (default: `copy_flush_rows` in the configuration,
+                or 5000)
+            flush_interval: write to the database at least every so many
+                seconds (default: `copy_flush_interval` in the configuration,
+                or 10)
+        """
+        with Config() as config:
+            if flush_rows is None:
+                try:
+                    flush_rows = int(config["copy_flush_rows"])
+                except KeyError:
+                    flush_rows = FLUSH_ROWS
+            if flush_interval is None:
+                try:
+                    flush_interval = float(config["copy_flush_interval"])
+                except KeyError:
+                    flush_interval = FLUSH_INTERVAL
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self._photo_saver = PhotoSaver(field_profile or FieldProfile())
+
+        suffix = f"{os.getpid()}_{next(self._writer_ids)}"
+        self._staging_photos = f"staging_photos_{suffix}"
+        self._staging_users = f"staging_users_{suffix}"
+        self._staging_tags = f"staging_tags_{suffix}"
+        self._staging_tables_exist = False
+
+        self._photo_rows = {}
+        self._user_rows = {}
+        self._tags = {}
+        self._when_flushed = []
+        self._last_flush = time.monotonic()
+
+    def add(self, page):
+        """
+        Add a page of flickr photos, write to the database when it is time.
+
+        Args:
+            page: iterable of photo data as returned by the API,
+                or of NormalisedPhotos
+
+        Returns:
+            list of NormalisedPhoto: the photos added, in the order of page
+        """
+        photos = [PhotoSaver.normalise(data) for data in page]
+        photo_rows, user_rows, _, tags, photos_without_owner = (
+            self._photo_saver.to_rows(photos)
+        )
+
+        self._photo_rows.update(photo_rows)
+        for key, user_data in user_rows.items():
+            self._user_rows.setdefault(key, {}).update(user_data)
+        self._tags.update(tags)
+
+        for photo in photos_without_owner:
+            self._photo_saver.save(photo)
+
+        self.flush_if_due()
+        return photos
+
+    def when_flushed(self, on_success, on_failure=None):
+        """
+        Call on_success once the photos added so far are committed.
+
+        Args:
+            on_success: function to call once the photos are committed
+            on_failure: function to call if writing them fails, or if
+                they are discarded (see `discard()`)
+        """
+        if self._photo_rows:
+            self._when_flushed.append((on_success, on_failure))
+        else:
+            on_success()
+
+    def flush_if_due(self):
+        """Write all collected photos if there are enough, or it is time."""
+        if (
+            len(self._photo_rows) >= self.flush_rows
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Write all collected photos to the database.
+
+        If writing fails, the photos are discarded (see `discard()`),
+        and the exception is re-raised.
+        """
+        if self._photo_rows:
+            try:
+                with Session() as session, session.begin():
+                    self._create_staging_tables(session)
+                    self._copy_to_staging_tables(session)
+                    self._merge_staging_tables(session)
+                self._staging_tables_exist = True
+            except Exception:
+                self.discard()
+                raise
+
+        self._photo_rows = {}
+        self._user_rows = {}
+        self._tags = {}
+        self._last_flush = time.monotonic()
+
+        when_flushed, self._when_flushed = self._when_flushed, []
+        for on_success, _ in when_flushed:
+            on_success()
+
+    def discard(self):
+        """Forget all collected photos, call their `on_failure` functions."""
+        self._photo_rows = {}
+        self._user_rows = {}
+        self._tags = {}
+        self._last_flush = time.monotonic()
+
+        when_flushed, self._when_flushed = self._when_flushed, []
+        for _, on_failure in when_flushed:
+            if on_failure is not None:
+                on_failure()
+
+    def close(self):
+        """Write all collected photos to the database, drop the staging tables."""
+        self.flush()
+        if self._staging_tables_exist:
+            with Session() as session, session.begin():
+                session.execute(
+                    sqlalchemy.text(
+                        f"""
+                        DROP TABLE IF EXISTS
+                            {self._staging_photos},
+                            {self._staging_users},
+                            {self._staging_tags};
+                        """
+                    )
+                )
+            self._staging_tables_exist = False
+
+    def _create_staging_tables(self, session):
+        if self._staging_tables_exist:
+            return
+
+        dialect = sqlalchemy.dialects.postgresql.dialect()
+
+        def _columns(model, columns, extra=""):
+            return ", ".join(
+                [
+                    f"{column} {model.__table__.c[column].type.compile(dialect=dialect)}"
+                    for column in columns
+                ]
+                + ([extra] if extra else [])
+            )
+
+        for table, model, columns, extra in (
+            # (`tagged`: the photo’s tags are known, remove the others)
+            (self._staging_photos, Photo, PHOTO_COLUMNS, "tagged BOOLEAN"),
+            (self._staging_users, User, USER_COLUMNS, ""),
+            (self._staging_tags, TagPhotoAssociation, TAG_COLUMNS, ""),
+        ):
+            session.execute(
+                sqlalchemy.text(
+                    f"""
+                    CREATE UNLOGGED TABLE IF NOT EXISTS
+                        {table} ({_columns(model, columns, extra)});
+                    """
+                )
+            )
+
+    def _copy_to_staging_tables(self, session):
+        photos = (
+            [photo_data.get(column) for column in PHOTO_COLUMNS]
+            + [photo_id in self._tags]
+            for photo_id, photo_data in self._photo_rows.items()
+        )
+        users = (
+            [user_id, farm, user_data.get("name")]
+            for (user_id, farm), user_data in self._user_rows.items()
+        )
+        tags = (
+            [photo_id, tag]
+            for photo_id, photo_tags in self._tags.items()
+            for tag in photo_tags
+        )
+
+        # the DB-API connection of the session’s transaction
+        connection = session.connection().connection.driver_connection
+        with connection.cursor() as cursor:
+            for table, columns, rows in (
+                (self._staging_photos, PHOTO_COLUMNS + ("tagged",), photos),
+                (self._staging_users, USER_COLUMNS, users),
+                (self._staging_tags, TAG_COLUMNS, tags),
+            ):
+                data = io.StringIO()
+                for row in rows:
+                    data.write(",".join(_csv_value(value) for value in row))
+                    data.write("\n")
+                data.seek(0)
+
+                statement = (
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+                )
+                if hasattr(cursor, "copy_expert"):  # psycopg2
+                    cursor.copy_expert(statement, data)
+                else:  # psycopg (3)
+                    with cursor.copy(statement) as copy:
+                        copy.write(data.getvalue())
+
+    def _merge_staging_tables(self, session):
+        # (rows are unique already, sort them so that concurrent
+        # transactions do not deadlock each other)
+        updated_photo_columns = ", ".join(
+            f"{column} = COALESCE(EXCLUDED.{column}, photos.{column})"
+            for column in PHOTO_COLUMNS
+            if column != "id"
+        )
+        for statement in (
+            f"""
+            INSERT INTO licenses (id)
+                SELECT DISTINCT license_id
+                FROM {self._staging_photos}
+                WHERE license_id IS NOT NULL
+                ORDER BY license_id
+            ON CONFLICT (id) DO NOTHING;
+            """,
+            f"""
+            INSERT INTO users ({", ".join(USER_COLUMNS)})
+                SELECT {", ".join(USER_COLUMNS)}
+                FROM {self._staging_users}
+                ORDER BY id, farm
+            ON CONFLICT (id, farm) DO UPDATE
+                SET name = COALESCE(EXCLUDED.name, users.name);
+            """,
+            f"""
+            INSERT INTO photos ({", ".join(PHOTO_COLUMNS)})
+                SELECT {", ".join(PHOTO_COLUMNS)}
+                FROM {self._staging_photos}
+                ORDER BY id
+            ON CONFLICT (id) DO UPDATE
+                SET {updated_photo_columns};
+            """,
+            f"""
+            INSERT INTO tags (tag)
+                SELECT DISTINCT tag_tag
+                FROM {self._staging_tags}
+                ORDER BY tag_tag
+            ON CONFLICT (tag) DO NOTHING;
+            """,
+            f"""
+            INSERT INTO tag_photo_associations (photo_id, tag_tag)
+                SELECT photo_id, tag_tag
+                FROM {self._staging_tags}
+                ORDER BY photo_id, tag_tag
+            ON CONFLICT (tag_tag, photo_id) DO NOTHING;
+            """,
+            f"""
+            DELETE FROM tag_photo_associations AS a
+                USING {self._staging_photos} AS p
+                WHERE
+                    p.tagged
+                    AND a.photo_id = p.id
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM {self._staging_tags} AS t
+                        WHERE t.photo_id = a.photo_id AND t.tag_tag = a.tag_tag
+                    );
+            """,
+            f"""
+            TRUNCATE
+                {self._staging_photos},
+                {self._staging_users},
+                {self._staging_tags};
+            """,
+        ):
+            session.execute(sqlalchemy.text(statement))
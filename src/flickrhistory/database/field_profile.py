@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Which fields to download for each photo, and to save to the database."""
+
+
+import sqlalchemy
+
+from ..config import Config
+from .models import Photo
+
+
+__all__ = ["FieldProfile"]
+
+
+class FieldProfile:
+    """
+    Which fields to download for each photo, and to save to the database.
+
+    `field_profile` in the configuration selects one of PROFILES:
+    - "minimal": location and upload date only
+    - "standard": everything but the (often long) descriptions
+    - "full" (default): everything flickrhistory knows about photos
+
+    The profile decides which `extras` flickr.photos.search returns,
+    which fields PhotoSaver writes, and which missing fields make
+    a photo incomplete (see PhotoUpdaterThread).
+    """
+
+    # the `extras` of flickr.photos.search to request in each profile
+    # (the upload date is needed to page through search results)
+    PROFILES = {
+        "minimal": ("date_upload", "geo"),
+        "standard": (
+            "date_upload",
+            "date_taken",
+            "geo",
+            "owner_name",
+            "tags",
+            "license",
+        ),
+        "full": (
+            "description",
+            "date_upload",
+            "date_taken",
+            "geo",
+            "owner_name",
+            "tags",
+            "license",
+        ),
+    }
+
+    # the fields of a NormalisedPhoto each extra provides …
+    FIELDS = {
+        "description": ("description",),
+        "date_upload": ("date_posted",),
+        "date_taken": ("date_taken",),
+        "geo": ("geom", "geo_accuracy"),
+        "owner_name": ("ownername",),
+        "tags": ("tags",),
+        "license": ("license",),
+    }
+    # … and the ones flickr.photos.search always returns
+    BASE_FIELDS = ("id", "server", "secret", "title", "owner")
+
+    # columns that PhotoUpdaterThread completes from flickr.photos.getInfo,
+    # and the extra they belong to
+    BACKFILLED_COLUMNS = {
+        "geo_accuracy": "geo",
+        "license_id": "license",
+    }
+
+    def __init__(self, name=None):
+        """
+        Initialise a FieldProfile.
+
+        Args:
+            name: one of PROFILES (default: `field_profile` in the
+                configuration, or "full")
+        """
+        if name is None:
+            with Config() as config:
+                try:
+                    name = config["field_profile"]
+                except KeyError:
+                    name = "full"
+        if name not in self.PROFILES:
+            raise ValueError(
+                f"Unknown field_profile {name!r}, "
+                f"expected one of {', '.join(self.PROFILES)}"
+            )
+
+        self.name = name
+        self.extras = self.PROFILES[name]
+        self.fields = set(self.BASE_FIELDS)
+        for extra in self.extras:
+            self.fields.update(self.FIELDS[extra])
+
+    def select(self, photo_data):
+        """Return only the fields of photo_data this profile saves."""
+        return {
+            field: value for field, value in photo_data.items() if field in self.fields
+        }
+
+    @property
+    def incomplete_photos(self):
+        """Return an SQL condition matching photos that lack fields of this profile."""
+        columns = [
+            getattr(Photo, column)
+            for column, extra in self.BACKFILLED_COLUMNS.items()
+            if extra in self.extras
+        ]
+        if not columns:
+            return sqlalchemy.false()
+        return sqlalchemy.or_(*[column.is_(None) for column in columns])
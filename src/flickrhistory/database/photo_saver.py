@@ -5,23 +5,135 @@
 """Save a flickr photo to the database."""
 
 
+import collections
 import datetime
 
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
 
-from .models import License, Photo, Tag
+from .field_profile import FieldProfile
+from .models import License, Photo, Tag, User
+from .models.tag import TagPhotoAssociation
+from .row_cache import RowCache
 from .session import Session
 from .user_saver import UserSaver
 
 
-__all__ = ["PhotoSaver"]
+__all__ = ["NormalisedPhoto", "PhotoSaver"]
+
+
+# PostgreSQL accepts at most 65535 parameters per statement
+MAX_ROWS_PER_STATEMENT = 1000
+
+
+def _upsert(session, model, rows):
+    """
+    Insert rows into the table of model, update the ones that exist already.
+
+    Only the columns contained in a row are written: rows are grouped by
+    their columns, and each group is written with one (set-based)
+    `INSERT … ON CONFLICT DO UPDATE` statement. Rows have to be unique
+    by primary key.
+    """
+    table = model.__table__
+    primary_key = [column.name for column in table.primary_key]
+
+    groups = collections.defaultdict(list)
+    for row in rows:
+        groups[tuple(sorted(row))].append(row)
+
+    for columns, group in groups.items():
+        for i in range(0, len(group), MAX_ROWS_PER_STATEMENT):
+            statement = sqlalchemy.dialects.postgresql.insert(table).values(
+                group[i : i + MAX_ROWS_PER_STATEMENT]
+            )
+            update = {
+                column: statement.excluded[column]
+                for column in columns
+                if column not in primary_key
+            }
+            if update:
+                statement = statement.on_conflict_do_update(
+                    index_elements=primary_key, set_=update
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=primary_key)
+            session.execute(statement)
+
+
+def _save_tags(session, tags):
+    """
+    Save the tags of photos, and associate them with the photos.
+
+    Writes all tags with one `INSERT … ON CONFLICT DO NOTHING`, and so
+    the associations, too (no savepoints needed in case a concurrent
+    transaction inserted a tag first), then deletes the associations
+    the photos no longer have with one set difference.
+
+    Tags known to exist already (see RowCache) are not written again.
+
+    Args:
+        tags: dict {photo id: set of tags}, all tags of each photo
+
+    Returns:
+        set: the tags written, to remember once the transaction is committed
+    """
+    if not tags:
+        return set()
+
+    associations = sorted(
+        (photo_id, tag) for photo_id, photo_tags in tags.items() for tag in photo_tags
+    )
+
+    new_tags = RowCache().unknown_tags(set().union(*tags.values()))
+    _upsert(session, Tag, [{"tag": tag} for tag in sorted(new_tags)])
+    _upsert(
+        session,
+        TagPhotoAssociation,
+        [{"photo_id": photo_id, "tag_tag": tag} for photo_id, tag in associations],
+    )
+    session.execute(
+        sqlalchemy.delete(TagPhotoAssociation).where(
+            TagPhotoAssociation.photo_id.in_(tags),
+            sqlalchemy.tuple_(
+                TagPhotoAssociation.photo_id, TagPhotoAssociation.tag_tag
+            ).not_in(associations),
+        )
+    )
+    return new_tags
+
+
+class NormalisedPhoto(dict):
+    """Photo data cleaned up and converted, ready to save (see PhotoSaver)."""
 
 
 class PhotoSaver:
     """Save a flickr photo to the database."""
 
-    def save(self, data):
-        """Save a flickr photo to the database."""
+    def __init__(self, field_profile=None):
+        """
+        Initialise a PhotoSaver.
+
+        Args:
+            field_profile: the FieldProfile whose fields to save
+                (default: `field_profile` in the configuration)
+        """
+        self._field_profile = field_profile or FieldProfile()
+
+    @staticmethod
+    def normalise(data):
+        """
+        Clean up photo data as returned by the API.
+
+        Returns:
+            NormalisedPhoto: the fields of a Photo, already converted
+            to their types, plus `license`, `tags` (a list), and the
+            `owner` and `ownername` to save the user (see UserSaver),
+            as far as they are contained in data
+        """
+        if isinstance(data, NormalisedPhoto):
+            return data
+
         # the API does not always return all fields
         # we need to figure out which ones we can use
 
@@ -94,34 +206,204 @@ class PhotoSaver:
         ):
             pass
 
-        photo_data["geo_accuracy"] = int(data["accuracy"])
+        # the following depend on the extras requested (see FieldProfile)
+        try:
+            photo_data["geo_accuracy"] = int(data["accuracy"])
+        except KeyError:
+            pass
 
-        license = int(data["license"])
+        try:
+            photo_data["license"] = int(data["license"])
+        except KeyError:
+            pass
+
+        try:
+            photo_data["tags"] = data["tags"].split()
+        except KeyError:
+            pass
 
-        tags = data["tags"].split()
+        for field in ["owner", "ownername"]:
+            try:
+                photo_data[field] = data[field]
+            except KeyError:
+                pass
+
+        return NormalisedPhoto(photo_data)
+
+    def save(self, data):
+        """
+        Save a flickr photo to the database.
+
+        Only the fields of the FieldProfile are written, fields that
+        are missing from data are left as they are.
+
+        Args:
+            data: photo data as returned by the API, or a NormalisedPhoto
+        """
+        photo_data = self._field_profile.select(self.normalise(data))
+
+        license = photo_data.pop("license", None)
+        tags = photo_data.pop("tags", None)
+        user_data = {
+            field: photo_data.pop(field)
+            for field in ["owner", "ownername"]
+            if field in photo_data
+        }
+
+        row_cache = RowCache()
+
+        if user_data:
+            user_id, farm, user_fields = UserSaver.normalise(user_data)
+            if not row_cache.user_is_known(user_id, farm, user_fields):
+                UserSaver().save(user_data)
+
+        new_licenses = set()
+        new_tags = set()
 
         with Session() as session, session.begin():
 
             photo = session.get(Photo, photo_data["id"]) or Photo(id=photo_data["id"])
-            user = UserSaver().save(data)
-            photo.user = user
+            if user_data:
+                photo.user_id = user_id
+                photo.user_farm = farm
 
             photo = session.merge(photo)
             photo.update(**photo_data)
 
-            photo.tags = []
-            for tag in set(tags):
-                try:
-                    with session.begin_nested():
-                        photo.tags.append(session.merge(Tag(tag=tag)))
-                except sqlalchemy.exc.IntegrityError:
-                    photo.tags.append(session.get(Tag, tag))
-
-            license = session.merge(
-                session.get(License, license) or License(id=license)
-            )
-            photo.license = license
+            if license is not None:
+                new_licenses = row_cache.unknown_licenses({license})
+                _upsert(session, License, [{"id": license} for license in new_licenses])
+                photo.license_id = license
 
             session.flush()
+
+            if tags is not None:
+                new_tags = _save_tags(session, {photo.id: set(tags)})
+
             session.expunge(photo)
+
+        row_cache.remember_licenses(new_licenses)
+        row_cache.remember_tags(new_tags)
         return photo
+
+    def to_rows(self, photos):
+        """
+        Convert NormalisedPhotos to rows of the photos and users tables.
+
+        Only the fields of the FieldProfile are included.
+
+        Returns:
+            tuple (dict, dict, set, dict, list): the rows of photos by
+            photo id, the rows of users by (user id, farm), the license
+            ids, the sets of tags by photo id (for photos whose tags are
+            known), and the photos without an owner (which cannot be
+            inserted as rows, see `save`)
+        """
+        photo_rows = {}
+        user_rows = {}
+        licenses = set()
+        tags = {}
+        photos_without_owner = []
+
+        for photo in photos:
+            photo_data = self._field_profile.select(photo)
+
+            if "owner" not in photo_data:
+                # a new photo cannot be inserted without its user,
+                # let `save` figure out whether it exists
+                photos_without_owner.append(photo)
+                continue
+
+            user_id, farm, user_data = UserSaver.normalise(photo_data)
+            user_rows.setdefault((user_id, farm), {"id": user_id, "farm": farm})
+            user_rows[(user_id, farm)].update(user_data)
+
+            for field in ["owner", "ownername"]:
+                photo_data.pop(field, None)
+            photo_data["user_id"] = user_id
+            photo_data["user_farm"] = farm
+
+            license = photo_data.pop("license", None)
+            if license is not None:
+                photo_data["license_id"] = license
+                licenses.add(license)
+
+            photo_tags = photo_data.pop("tags", None)
+            if photo_tags is not None:
+                tags[photo_data["id"]] = set(photo_tags)
+
+            # (see Photo._drop_nul_from_strings, Core statements skip it)
+            for field in ["title", "description"]:
+                if photo_data.get(field) is not None:
+                    photo_data[field] = photo_data[field].replace("\x00", "")
+
+            photo_rows[photo_data["id"]] = photo_data
+
+        return photo_rows, user_rows, licenses, tags, photos_without_owner
+
+    def save_many(self, page):
+        """
+        Save a page of flickr photos to the database, in one transaction.
+
+        Rather than reading and merging each photo, its user, license
+        and tags one at a time (see `save`), writes each table with one
+        set-based `INSERT … ON CONFLICT DO UPDATE` for the entire page.
+        As with `save`, only the fields of the FieldProfile are written,
+        and fields that are missing from data are left as they are.
+
+        Args:
+            page: iterable of photo data as returned by the API,
+                or of NormalisedPhotos
+
+        Returns:
+            list of NormalisedPhoto: the photos saved, in the order of page
+        """
+        photos = [self.normalise(data) for data in page]
+        photo_rows, user_rows, licenses, tags, photos_without_owner = self.to_rows(
+            photos
+        )
+
+        if photo_rows:
+            # skip licenses and users known to be saved already (see RowCache)
+            row_cache = RowCache()
+            new_licenses = row_cache.unknown_licenses(licenses)
+            user_rows = {
+                (user_id, farm): user_data
+                for (user_id, farm), user_data in user_rows.items()
+                if not row_cache.user_is_known(
+                    user_id,
+                    farm,
+                    {
+                        field: value
+                        for field, value in user_data.items()
+                        if field not in ("id", "farm")
+                    },
+                )
+            }
+
+            with Session() as session, session.begin():
+                # (write rows in a deterministic order, so that
+                # concurrent transactions do not deadlock each other)
+                _upsert(
+                    session,
+                    License,
+                    [{"id": license} for license in sorted(new_licenses)],
+                )
+                _upsert(session, User, [user_rows[key] for key in sorted(user_rows)])
+                _upsert(
+                    session,
+                    Photo,
+                    [photo_rows[photo_id] for photo_id in sorted(photo_rows)],
+                )
+
+                new_tags = _save_tags(session, tags)
+
+            row_cache.remember_licenses(new_licenses)
+            for (user_id, farm), user_data in user_rows.items():
+                row_cache.remember_user(user_id, farm, user_data)
+            row_cache.remember_tags(new_tags)
+
+        for photo in photos_without_owner:
+            self.save(photo)
+
+        return photos
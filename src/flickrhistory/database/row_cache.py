@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Remember which licenses, tags, and users exist in the database."""
+
+
+__all__ = ["LruCache", "RowCache"]
+
+
+import collections
+import threading
+
+import sqlalchemy
+
+from .models import License
+from .session import Session
+
+
+class LruCache:
+    """A thread-safe mapping of limited size that forgets the least recently used entries."""
+
+    def __init__(self, max_size):
+        """
+        Initialise an LruCache.
+
+        Args:
+            max_size: how many entries to keep at most
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value of key (or default), count a hit (or miss)."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        """Set the value of key, forget the oldest entries if full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self._entries)
+
+
+class RowCache:
+    """
+    Remember which licenses, tags, and users exist in the database.
+
+    Lets PhotoSaver skip reading rows it knows exist already, and
+    writing rows that would not change: licenses (only a handful) are
+    loaded once, the most recently used tags and users (with the name
+    last written) are kept in LruCaches.
+
+    Shared by all threads of a process. Only remember rows once their
+    transaction is committed.
+    """
+
+    # implementing RowCache() as a pseudo-singleton:
+    # the caches are class attributes, shared between instances
+
+    MAX_TAGS = 100000
+    MAX_USERS = 100000
+
+    _licenses = None
+    _license_hits = 0
+    _license_misses = 0
+    _tags = LruCache(MAX_TAGS)
+    _users = LruCache(MAX_USERS)
+    _lock = threading.Lock()
+
+    _NO_USER = object()
+    _UNKNOWN_NAME = object()
+
+    def unknown_licenses(self, licenses):
+        """Return those of licenses (ids) that are not in the database."""
+        with self._lock:
+            if self._licenses is None:
+                with Session() as session:
+                    RowCache._licenses = set(
+                        session.scalars(sqlalchemy.select(License.id))
+                    )
+            unknown = set(licenses) - self._licenses
+            RowCache._license_hits += len(licenses) - len(unknown)
+            RowCache._license_misses += len(unknown)
+            return unknown
+
+    def remember_licenses(self, licenses):
+        """Remember that licenses (ids) are in the database."""
+        with self._lock:
+            if self._licenses is not None:
+                self._licenses.update(licenses)
+
+    def unknown_tags(self, tags):
+        """Return those of tags that are not known to be in the database."""
+        return {tag for tag in tags if not self._tags.get(tag, False)}
+
+    def remember_tags(self, tags):
+        """Remember that tags are in the database."""
+        for tag in tags:
+            self._tags[tag] = True
+
+    def user_is_known(self, user_id, farm, user_data):
+        """
+        Check whether saving a user would not change anything.
+
+        True if the user is known to be in the database, and user_data
+        (see UserSaver.normalise) contains nothing but the name last
+        written, if any.
+        """
+        name = self._users.get((user_id, farm), self._NO_USER)
+        if name is self._NO_USER:
+            return False
+        return set(user_data) <= {"name"} and user_data.get("name", name) == name
+
+    def remember_user(self, user_id, farm, user_data):
+        """Remember that a user is in the database, and the name last written."""
+        # (a user written without a name keeps the name it had,
+        # which we do not know)
+        self._users[(user_id, farm)] = user_data.get("name", self._UNKNOWN_NAME)
+
+    @property
+    def statistics(self):
+        """
+        Report how often the caches saved a round-trip to the database.
+
+        Returns:
+            tuple of (int, int): (hits, misses) of the licenses, tags,
+            and users caches
+        """
+        with self._lock:
+            licenses = (self._license_hits, self._license_misses)
+        return (
+            licenses,
+            (self._tags.hits, self._tags.misses),
+            (self._users.hits, self._users.misses),
+        )
@@ -8,6 +8,7 @@
 import datetime
 
 from .models import User
+from .row_cache import RowCache
 from .session import Session
 
 
@@ -17,8 +18,15 @@ __all__ = ["UserSaver"]
 class UserSaver:
     """Save a flickr user to the database."""
 
-    def save(self, data):
-        """Save a flickr user to the database."""
+    @staticmethod
+    def normalise(data):
+        """
+        Clean up user data as returned by the API.
+
+        Returns:
+            tuple (str, str, dict): user id, farm, and the other
+            fields of a User
+        """
         # We accept raw data from two different API endpoints
         # that return different data in different ontologies
         user_data = {}
@@ -26,12 +34,14 @@ class UserSaver:
             # -> from photos.search
             user_id, farm = data["owner"].split("@N0")
 
-            user_data["name"] = data["ownername"]
+            # (unless the field profile leaves it out)
+            if "ownername" in data:
+                user_data["name"] = data["ownername"]
         else:
             # from profile.getprofile
             user_id, farm = data["id"].split("@N0")
 
-            data["join_date"] = datetime.datetime.fromtimestamp(
+            user_data["join_date"] = datetime.datetime.fromtimestamp(
                 int(data["join_date"]), tz=datetime.timezone.utc
             )
 
@@ -39,7 +49,6 @@ class UserSaver:
                 "first_name",
                 "last_name",
                 "name",
-                "join_date",
                 "city",
                 "country",
                 "hometown",
@@ -57,6 +66,12 @@ class UserSaver:
                 except KeyError:
                     pass
 
+        return user_id, farm, user_data
+
+    def save(self, data):
+        """Save a flickr user to the database."""
+        user_id, farm, user_data = self.normalise(data)
+
         with Session() as session, session.begin():
             user = session.get(User, (user_id, farm)) or User(id=user_id, farm=farm)
             user = session.merge(user)
@@ -64,4 +79,6 @@ class UserSaver:
 
             session.flush()
             session.expunge(user)
+
+        RowCache().remember_user(user_id, farm, user_data)
         return user
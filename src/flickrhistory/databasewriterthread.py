@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Worker threads writing downloaded photos to the database."""
+
+
+__all__ = ["DatabaseWriterThread", "PendingTimeSpan"]
+
+
+import logging
+import queue
+import threading
+
+from .config import Config
+from .database import CopyWriter, PhotoSaver
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingTimeSpan:
+    """
+    A TimeSpan whose photos are (partly) still being written to the database.
+
+    Reports the TimeSpan to the done_queue (see CacheUpdaterThread) once
+    it is complete (all its photos are downloaded) and all its batches of
+    photos are committed, or never, if one of them fails.
+    """
+
+    def __init__(self, timespan, done_queue):
+        """
+        Initialise a PendingTimeSpan.
+
+        Args:
+            timespan: the TimeSpan the photos belong to (None: do not
+                report anything)
+            done_queue: queue.Queue into which to put the TimeSpan
+        """
+        self.timespan = timespan
+        self._done_queue = done_queue
+        self._batches = 0
+        self._complete = False
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def add_batch(self):
+        """Count a batch of photos to wait for."""
+        with self._lock:
+            self._batches += 1
+
+    def batch_written(self):
+        """Count a batch of photos as committed."""
+        with self._lock:
+            self._batches -= 1
+            self._report_if_done()
+
+    def batch_failed(self):
+        """Count a batch of photos as failed, never report the TimeSpan."""
+        with self._lock:
+            self._batches -= 1
+            self._failed = True
+
+    def complete(self):
+        """Mark that all batches of photos have been added."""
+        with self._lock:
+            self._complete = True
+            self._report_if_done()
+
+    def _report_if_done(self):
+        if (
+            self._complete
+            and self._batches == 0
+            and not self._failed
+            and self.timespan is not None
+        ):
+            self._done_queue.put(self.timespan)
+            self.timespan = None  # report only once
+
+
+class DatabaseWriterThread(threading.Thread):
+    """
+    Write pages of photos from a queue to the database.
+
+    Takes (page, PendingTimeSpan) tuples off write_queue, which the
+    PhotoDownloaderThreads fill; write_queue is bounded, so downloading
+    slows down when the database falls behind.
+    """
+
+    DATABASE_WRITERS = ("orm", "copy")
+
+    def __init__(self, write_queue):
+        """
+        Initialise a DatabaseWriterThread.
+
+        Args:
+            write_queue: queue.Queue that serves (page of photos,
+                PendingTimeSpan) tuples
+
+        """
+        super().__init__()
+
+        self.count = 0
+
+        self._write_queue = write_queue
+
+        # "orm" (default): save each page in a transaction (PhotoSaver),
+        # "copy": collect pages, and write them in bulk (CopyWriter)
+        with Config() as config:
+            try:
+                database_writer = config["database_writer"]
+            except KeyError:
+                database_writer = "orm"
+        if database_writer not in self.DATABASE_WRITERS:
+            raise ValueError(
+                f"Unknown database_writer {database_writer!r}, "
+                f"expected one of {', '.join(self.DATABASE_WRITERS)}"
+            )
+        self._copy_writer = CopyWriter() if database_writer == "copy" else None
+
+        # set once no more pages are added to write_queue,
+        # the thread finishes once it has written all of them
+        self.shutdown = threading.Event()
+
+    def run(self):
+        """Get pages of photos off write_queue and save them."""
+        self._write()
+        if self._copy_writer is not None:
+            try:
+                self._copy_writer.close()
+            except Exception:
+                # close() discarded the remaining photos, their time
+                # spans stay in the gaps of the download history
+                logger.exception("Could not write the last photos to the database")
+
+    def _write(self):
+        while True:
+            try:
+                item = self._write_queue.get(timeout=0.1)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                if self._copy_writer is not None:
+                    try:
+                        self._copy_writer.flush_if_due()
+                    except Exception:
+                        logger.exception("Could not write photos to the database")
+                if self.shutdown.is_set():
+                    break
+                continue
+
+            page, pending_timespan = item
+
+            try:
+                if self._copy_writer is not None:
+                    photos = self._copy_writer.add(page)
+                    self._copy_writer.when_flushed(
+                        pending_timespan.batch_written, pending_timespan.batch_failed
+                    )
+                else:
+                    # one transaction per page of photos
+                    photos = PhotoSaver().save_many(page)
+                    pending_timespan.batch_written()
+            except Exception:
+                # the time spans stay in the gaps of the download
+                # history, and will be downloaded again next time
+                logger.exception("Could not write photos to the database")
+                pending_timespan.batch_failed()
+                if self._copy_writer is not None:
+                    # the photos collected so far might be incomplete
+                    self._copy_writer.discard()
+                continue
+
+            self.count += len(photos)
@@ -5,12 +5,37 @@
 """Custom exceptions."""
 
 
-__all__ = ["ApiResponseError", "DownloadBatchIsTooLargeError"]
+__all__ = [
+    "ApiResponseError",
+    "CircuitOpenError",
+    "DownloadBatchIsTooLargeError",
+    "InvalidApiKeyError",
+]
 
 
 class ApiResponseError(BaseException):
     """Raised when API returns bogus data."""
 
 
+class CircuitOpenError(ApiResponseError):
+    """Raised instead of calling the API while it has been failing."""
+
+
+class InvalidApiKeyError(ApiResponseError):
+    """Raised when the API does not accept an API key."""
+
+
 class DownloadBatchIsTooLargeError(BaseException):
     """Raised when batch larger than usual flickr download limit."""
+
+    def __init__(self, *args, total=0, photos=None):
+        """
+        Raise a DownloadBatchIsTooLargeError.
+
+        Args:
+            total: how many photos the API reported for the batch
+            photos: the photos (of the first page) downloaded already
+        """
+        super().__init__(*args)
+        self.total = total
+        self.photos = photos or []
@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""A local stand-in for the flickr API, serving synthetic data."""
+
+
+__all__ = ["FakeFlickrApi", "UploadDensityCurve"]
+
+
+import argparse
+import bisect
+import collections
+import datetime
+import http.server
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+
+from .sigtermreceivedexception import SigTermReceivedException
+
+
+# flickr.photos.search returns at most this many photos per page …
+MAX_PER_PAGE = 500
+DEFAULT_PER_PAGE = 100
+# … and at most this many different photos per search, later pages
+# repeat the first one
+MAX_RESULTS = 4000
+
+# photo ids of synthetic photos start here
+ID_OFFSET = 1000000000
+
+# uploads per day of geotagged photos, roughly shaped like flickr’s history
+DEFAULT_DENSITY_CURVE = (
+    ("2004-02-10", 10.0),
+    ("2008-01-01", 50000.0),
+    ("2012-01-01", 100000.0),
+    ("2018-01-01", 30000.0),
+    ("2024-01-01", 10000.0),
+)
+
+LICENSES = (
+    (0, "All Rights Reserved", ""),
+    (
+        1,
+        "Attribution-NonCommercial-ShareAlike License",
+        "https://creativecommons.org/licenses/by-nc-sa/2.0/",
+    ),
+    (
+        2,
+        "Attribution-NonCommercial License",
+        "https://creativecommons.org/licenses/by-nc/2.0/",
+    ),
+    (
+        3,
+        "Attribution-NonCommercial-NoDerivs License",
+        "https://creativecommons.org/licenses/by-nc-nd/2.0/",
+    ),
+    (4, "Attribution License", "https://creativecommons.org/licenses/by/2.0/"),
+    (
+        5,
+        "Attribution-ShareAlike License",
+        "https://creativecommons.org/licenses/by-sa/2.0/",
+    ),
+    (
+        6,
+        "Attribution-NoDerivs License",
+        "https://creativecommons.org/licenses/by-nd/2.0/",
+    ),
+    (7, "No known copyright restrictions", "https://www.flickr.com/commons/usage/"),
+    (8, "United States Government Work", "http://www.usa.gov/copyright.shtml"),
+    (
+        9,
+        "Public Domain Dedication (CC0)",
+        "https://creativecommons.org/publicdomain/zero/1.0/",
+    ),
+    (10, "Public Domain Mark", "https://creativecommons.org/publicdomain/mark/1.0/"),
+)
+
+WORDS = (
+    "beach bridge building car cat city cloud dog flower forest harbour lake "
+    "landscape light mountain museum night park people portrait river road "
+    "sea sky snow square station street summer sun sunset travel tree winter"
+).split()
+
+
+class UploadDensityCurve:
+    """
+    How many photos are uploaded per second, over time.
+
+    Piecewise linear between the given points, no uploads before the first,
+    and as many as at the last one after it. Photos are numbered in order of
+    upload, photo k is uploaded when the integral of the curve reaches k + ½:
+    counting the photos in a time span, and finding the photos of one page,
+    never has to look at the photos outside of them.
+    """
+
+    def __init__(self, points=DEFAULT_DENSITY_CURVE):
+        """
+        Initialise an UploadDensityCurve.
+
+        Args:
+            points: iterable of (date, photos per day), the date as a
+                datetime.datetime, an ISO 8601 string, or a POSIX timestamp
+        """
+        points = sorted(
+            (self._timestamp(date), float(photos_per_day) / (24 * 60 * 60))
+            for date, photos_per_day in points
+        )
+        if not points:
+            raise ValueError("An UploadDensityCurve needs at least one point")
+        if any(rate < 0 for _, rate in points) or points[-1][1] <= 0:
+            raise ValueError("Upload rates must not be negative (nor end at 0)")
+
+        self._times = [time_ for time_, _ in points]
+        self._rates = [rate for _, rate in points]
+
+        self._cumulative = [0.0]
+        for i in range(1, len(points)):
+            self._cumulative.append(
+                self._cumulative[-1]
+                + (self._times[i] - self._times[i - 1])
+                * (self._rates[i] + self._rates[i - 1])
+                / 2
+            )
+
+    @staticmethod
+    def _timestamp(date):
+        if isinstance(date, str):
+            date = datetime.datetime.fromisoformat(date)
+        if isinstance(date, datetime.datetime):
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=datetime.timezone.utc)
+            date = date.timestamp()
+        return float(date)
+
+    def cumulative(self, timestamp):
+        """Return how many photos have been uploaded before timestamp."""
+        if timestamp <= self._times[0]:
+            return 0.0
+
+        i = bisect.bisect_right(self._times, timestamp) - 1
+        elapsed = timestamp - self._times[i]
+        if i == len(self._times) - 1:
+            return self._cumulative[i] + elapsed * self._rates[i]
+
+        slope = (self._rates[i + 1] - self._rates[i]) / (
+            self._times[i + 1] - self._times[i]
+        )
+        return self._cumulative[i] + elapsed * self._rates[i] + slope * elapsed**2 / 2
+
+    def upload_time(self, photo):
+        """Return when the photo-th photo was uploaded (a POSIX timestamp)."""
+        target = photo + 0.5
+
+        i = bisect.bisect_right(self._cumulative, target) - 1
+        remaining = target - self._cumulative[i]
+        if i == len(self._times) - 1:
+            return int(self._times[i] + remaining / self._rates[i])
+
+        slope = (self._rates[i + 1] - self._rates[i]) / (
+            self._times[i + 1] - self._times[i]
+        )
+        if abs(slope) < 1e-15:
+            elapsed = remaining / self._rates[i]
+        else:
+            # solve rate * t + slope * t² / 2 = remaining
+            elapsed = (
+                -self._rates[i] + math.sqrt(self._rates[i] ** 2 + 2 * slope * remaining)
+            ) / slope
+        return int(self._times[i] + elapsed)
+
+    def photos_between(self, start, end):
+        """
+        Return the range of photos uploaded between start and end.
+
+        Args:
+            start, end: POSIX timestamps (whole seconds, both inclusive)
+        """
+        return range(
+            math.ceil(self.cumulative(start) - 0.5),
+            math.ceil(self.cumulative(end + 1) - 0.5),
+        )
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        status_code, results = self.server.api.respond(query)
+
+        body = json.dumps(results).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeFlickrApi:
+    """
+    A local stand-in for the flickr API, serving synthetic data.
+
+    Answers flickr.photos.search, flickr.photos.getInfo,
+    flickr.profile.getProfile, and flickr.photos.licenses.getInfo, the
+    way api.flickr.com/services/rest/ does (format=json,
+    nojsoncallback=1), including some of its quirks:
+    - searches match max_upload_date fuzzily, and return photos
+      uploaded up to `fuzz` seconds later
+    - at most MAX_PER_PAGE photos per page, and MAX_RESULTS per search
+      (later pages repeat the first page)
+    - searches with more than MAX_RESULTS results sometimes report a
+      `total` of 0 (`bogus_total_rate`)
+
+    The photos follow an UploadDensityCurve, and the same settings
+    always produce the same photos and users. Each response takes a
+    log-normally distributed time, `error_rate` of them fail (half with
+    HTTP 500, half with “service unavailable”), and each API key is
+    limited to `rate_limit_per_second` calls (HTTP 429 beyond).
+
+    Point flickrhistory at it with `flickr_api_endpoint_url` in the
+    configuration, or run `python -m flickrhistory.fakeflickrapi`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        density_curve=None,
+        num_users=100000,
+        latency_median=0.0,
+        latency_sigma=0.5,
+        error_rate=0.0,
+        bogus_total_rate=0.0,
+        fuzz=60,
+        api_keys=None,
+        rate_limit_per_second=None,
+        burst=1,
+        seed=0,
+    ):
+        """
+        Initialise a FakeFlickrApi.
+
+        Args:
+            host, port: where to listen (port 0 picks a free port)
+            density_curve: UploadDensityCurve (default: roughly
+                flickr’s history, see DEFAULT_DENSITY_CURVE)
+            num_users: how many different users upload the photos
+            latency_median, latency_sigma: median (seconds) and shape
+                of the log-normal distribution of response times
+            error_rate: share of calls that fail
+            bogus_total_rate: share of searches with too many results
+                that report a total of 0
+            fuzz: seconds after max_upload_date searches still match
+            api_keys: valid API keys (default: any key is valid)
+            rate_limit_per_second, burst: calls per API key (default:
+                unlimited)
+            seed: seed of the synthetic data and of the randomness of
+                latencies and errors
+        """
+        self.density_curve = density_curve or UploadDensityCurve()
+        self.num_users = num_users
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.bogus_total_rate = bogus_total_rate
+        self.fuzz = fuzz
+        self.api_keys = None if api_keys is None else set(api_keys)
+        self.rate_limit_per_second = rate_limit_per_second
+        self.burst = burst
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._token_buckets = {}
+        self.calls = collections.Counter()
+
+        self._server = http.server.ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Return the endpoint URL (cf. `flickr_api_endpoint_url`)."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/services/rest/"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve requests until interrupted."""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving requests."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        """Start serving requests in the background."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Stop serving requests."""
+        self.stop()
+
+    def respond(self, query):
+        """
+        Answer an API call.
+
+        Args:
+            query: dict of the query parameters
+
+        Returns:
+            tuple (int, dict): HTTP status code, and results
+        """
+        method = query.get("method")
+
+        with self._lock:
+            self.calls[method] += 1
+            latency = self._random.lognormvariate(
+                math.log(max(self.latency_median, 1e-9)), self.latency_sigma
+            )
+            error = self._random.random()
+            bogus_total = self._random.random() < self.bogus_total_rate
+
+            api_key = query.get("api_key")
+            if api_key is None or (
+                self.api_keys is not None and api_key not in self.api_keys
+            ):
+                return (200, self._error(100, "Invalid API Key (Key not found)"))
+
+            if self.rate_limit_per_second is not None:
+                if api_key not in self._token_buckets:
+                    self._token_buckets[api_key] = _TokenBucket(
+                        self.rate_limit_per_second, self.burst
+                    )
+                if not self._token_buckets[api_key].take():
+                    self.calls["rate limited"] += 1
+                    return (429, self._error(105, "Too many requests"))
+
+        if self.latency_median > 0:
+            time.sleep(latency)
+
+        if error < self.error_rate / 2:
+            return (500, {})
+        if error < self.error_rate:
+            return (200, self._error(105, "Service currently unavailable"))
+
+        try:
+            if method == "flickr.photos.search":
+                return (200, self.search(query, bogus_total))
+            if method == "flickr.photos.getInfo":
+                return (200, self.photo_info(query["photo_id"]))
+            if method == "flickr.profile.getProfile":
+                return (200, self.profile(query["user_id"]))
+            if method == "flickr.photos.licenses.getInfo":
+                return (200, self.licenses())
+        except (KeyError, ValueError):
+            return (200, self._error(1, "Required arguments missing"))
+        return (200, self._error(112, f"Method “{method}” not found"))
+
+    @staticmethod
+    def _error(code, message):
+        return {"stat": "fail", "code": code, "message": message}
+
+    def search(self, query, bogus_total=False):
+        """Answer flickr.photos.search queries, sorted by upload date."""
+        start = int(float(query.get("min_upload_date", 0)))
+        end = int(float(query.get("max_upload_date", time.time()))) + self.fuzz
+        per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+        page = max(1, int(query.get("page", 1)))
+        extras = {extra.strip() for extra in query.get("extras", "").split(",")}
+
+        photos = self.density_curve.photos_between(start, end)
+        total = len(photos)
+
+        offset = (page - 1) * per_page
+        if offset >= MAX_RESULTS:
+            offset = 0
+        photos = photos[offset : min(offset + per_page, MAX_RESULTS)]
+
+        if total > MAX_RESULTS and bogus_total:
+            total = 0
+
+        return {
+            "photos": {
+                "page": page,
+                "pages": math.ceil(total / per_page),
+                "perpage": per_page,
+                "total": total,
+                "photo": [self._search_result(photo, extras) for photo in photos],
+            },
+            "stat": "ok",
+        }
+
+    def _photo(self, photo):
+        """Return the synthetic data of the photo-th photo."""
+        random_ = random.Random(self.seed * 1000003 + photo)
+        date_posted = self.density_curve.upload_time(photo)
+        user = random_.randrange(self.num_users)
+        tags = random_.sample(WORDS, random_.randint(0, 12))
+        return {
+            "id": str(ID_OFFSET + photo),
+            "owner": self._nsid(user),
+            "ownername": f"User {user}",
+            "secret": f"{random_.getrandbits(40):010x}",
+            "server": str(random_.randint(1, 65535)),
+            "farm": random_.randint(1, 66),
+            "title": " ".join(random_.sample(WORDS, random_.randint(0, 4))),
+            "description": " ".join(random_.choices(WORDS, k=random_.randint(0, 60))),
+            "dateupload": date_posted,
+            "datetaken": (
+                "0000-01-01 00:00:00"
+                if random_.random() < 0.01
+                else time.strftime(
+                    "%Y-%m-%d %H:%M:%S",
+                    time.gmtime(date_posted - random_.randint(0, 30 * 24 * 60 * 60)),
+                )
+            ),
+            "latitude": round(random_.uniform(-60, 75), 6),
+            "longitude": round(random_.uniform(-180, 180), 6),
+            "accuracy": random_.randint(1, 16),
+            "license": random_.choice(LICENSES)[0],
+            "tags": tags,
+        }
+
+    def _search_result(self, photo, extras):
+        data = self._photo(photo)
+        result = {
+            "id": data["id"],
+            "owner": data["owner"],
+            "secret": data["secret"],
+            "server": data["server"],
+            "farm": data["farm"],
+            "title": data["title"],
+            "ispublic": 1,
+            "isfriend": 0,
+            "isfamily": 0,
+        }
+        if "license" in extras:
+            result["license"] = str(data["license"])
+        if "description" in extras:
+            result["description"] = {"_content": data["description"]}
+        if "date_upload" in extras:
+            result["dateupload"] = str(data["dateupload"])
+        if "date_taken" in extras:
+            result["datetaken"] = data["datetaken"]
+            result["datetakengranularity"] = 0
+            result["datetakenunknown"] = "0"
+        if "owner_name" in extras:
+            result["ownername"] = data["ownername"]
+        if "tags" in extras:
+            result["tags"] = " ".join(data["tags"])
+        if "geo" in extras:
+            result["latitude"] = str(data["latitude"])
+            result["longitude"] = str(data["longitude"])
+            result["accuracy"] = str(data["accuracy"])
+            result["context"] = 0
+        return result
+
+    def photo_info(self, photo_id):
+        """Answer flickr.photos.getInfo."""
+        photo = int(photo_id) - ID_OFFSET
+        if photo < 0 or photo >= self.density_curve.cumulative(time.time()):
+            return self._error(1, "Photo not found")
+
+        data = self._photo(photo)
+        return {
+            "photo": {
+                "id": data["id"],
+                "secret": data["secret"],
+                "server": data["server"],
+                "farm": data["farm"],
+                "dateuploaded": str(data["dateupload"]),
+                "license": str(data["license"]),
+                "owner": {
+                    "nsid": data["owner"],
+                    "username": data["ownername"],
+                    "realname": data["ownername"],
+                    "location": "",
+                },
+                "title": {"_content": data["title"]},
+                "description": {"_content": data["description"]},
+                "dates": {
+                    "posted": str(data["dateupload"]),
+                    "taken": data["datetaken"],
+                    "takengranularity": 0,
+                    "takenunknown": "0",
+                },
+                "tags": {
+                    "tag": [
+                        {
+                            "id": f"{data['id']}-{tag}",
+                            "author": data["owner"],
+                            "raw": tag,
+                            "_content": tag,
+                            "machine_tag": 0,
+                        }
+                        for tag in data["tags"]
+                    ]
+                },
+                "location": {
+                    "latitude": str(data["latitude"]),
+                    "longitude": str(data["longitude"]),
+                    "accuracy": str(data["accuracy"]),
+                    "context": "0",
+                },
+            },
+            "stat": "ok",
+        }
+
+    @staticmethod
+    def _nsid(user):
+        return f"{10000000 + user}@N0{user % 9}"
+
+    def profile(self, nsid):
+        """Answer flickr.profile.getProfile."""
+        try:
+            user_id, farm = nsid.split("@N0")
+            user = int(user_id) - 10000000
+            assert 0 <= user < self.num_users and self._nsid(user) == nsid
+        except (AssertionError, ValueError):
+            return self._error(2, "Unknown user")
+
+        random_ = random.Random(self.seed * 1000003 - user - 1)
+        return {
+            "profile": {
+                "id": nsid,
+                "nsid": nsid,
+                "join_date": str(
+                    int(self.density_curve.upload_time(0))
+                    + random_.randint(0, 15 * 365 * 24 * 60 * 60)
+                ),
+                "occupation": random_.choice(["", "photographer", "student"]),
+                "hometown": random_.choice(["", "Helsinki", "Lisbon", "Osaka"]),
+                "first_name": "User",
+                "last_name": str(user),
+                "name": f"User {user}",
+                "description": " ".join(
+                    random_.choices(WORDS, k=random_.randint(0, 20))
+                ),
+                "website": "",
+                "city": "",
+                "country": random_.choice(["", "Finland", "Portugal", "Japan"]),
+                "facebook": "",
+                "twitter": "",
+                "tumblr": "",
+                "instagram": "",
+                "pinterest": "",
+            },
+            "stat": "ok",
+        }
+
+    @staticmethod
+    def licenses():
+        """Answer flickr.photos.licenses.getInfo."""
+        return {
+            "licenses": {
+                "license": [
+                    {"id": id_, "name": name, "url": url} for id_, name, url in LICENSES
+                ]
+            },
+            "stat": "ok",
+        }
+
+
+def _density_point(value):
+    date, photos_per_day = value.rsplit("=", 1)
+    return (date, float(photos_per_day))
+
+
+def main():
+    """Run a FakeFlickrApi until interrupted."""
+    argparser = argparse.ArgumentParser(
+        prog="python -m flickrhistory.fakeflickrapi",
+        description="A local stand-in for the flickr API, serving synthetic data.",
+    )
+    argparser.add_argument("--host", default="127.0.0.1")
+    argparser.add_argument("--port", type=int, default=8080)
+    argparser.add_argument(
+        "--density",
+        type=_density_point,
+        action="append",
+        metavar="DATE=PHOTOS_PER_DAY",
+        help="a point of the upload density curve (repeat for more)",
+    )
+    argparser.add_argument("--users", type=int, default=100000)
+    argparser.add_argument("--latency-median", type=float, default=0.0)
+    argparser.add_argument("--latency-sigma", type=float, default=0.5)
+    argparser.add_argument("--error-rate", type=float, default=0.0)
+    argparser.add_argument("--bogus-total-rate", type=float, default=0.0)
+    argparser.add_argument("--fuzz", type=int, default=60)
+    argparser.add_argument("--api-key", action="append", dest="api_keys")
+    argparser.add_argument("--rate-limit-per-second", type=float)
+    argparser.add_argument("--burst", type=int, default=1)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    api = FakeFlickrApi(
+        args.host,
+        args.port,
+        density_curve=(
+            UploadDensityCurve(args.density) if args.density is not None else None
+        ),
+        num_users=args.users,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        bogus_total_rate=args.bogus_total_rate,
+        fuzz=args.fuzz,
+        api_keys=args.api_keys,
+        rate_limit_per_second=args.rate_limit_per_second,
+        burst=args.burst,
+        seed=args.seed,
+    )
+    print(f"Serving a fake flickr API at {api.url}")
+    try:
+        api.serve_forever()
+    except (KeyboardInterrupt, SigTermReceivedException):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,10 @@ Overloaded to provide fancy console output
 __all__ = ["FancyFlickrHistoryDownloader"]
 
 
-import threading
-
 import blessed
 
+from .apidownloader import ApiDownloader
+from .apisession import ApiSession
 from .basicflickrhistorydownloader import BasicFlickrHistoryDownloader
 from . import __version__ as version
 
@@ -43,8 +43,15 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
         "{t.bold}{t.red}{profiles: 9d} 👱 user profiles "
         "{t.normal}{t.red}{profile_rate: 3.1f}/s\n"
         "{t.normal} using                   "
-        "{t.bold}{t.green}{workers: 9d} 💪 workers\n"
-        "{t.normal}{t.bold} TODO:                {todo: 12d} 🚧 time slots"
+        "{t.bold}{t.green}{workers: 9d} 💪 workers "
+        "{t.normal}{t.green}at {api_rate:.1f} API calls/s, "
+        "{quarantined} API keys quarantined\n"
+        "{t.normal}{t.bold} TODO:                {todo: 12d} 🚧 time slots "
+        "{t.normal}ETA {eta}\n"
+        "{t.normal} planned as              "
+        "{t.bold}{t.blue}{planned_timespans: 9d} 📐 time slots "
+        "{t.normal}{t.blue}instead of {one_day_timespans} days, "
+        "{hit_rate:.0%} small enough"
         "{t.normal}"
     )
     STATUS_LINES = len(STATUS.splitlines())
@@ -56,6 +63,9 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
         "{t.normal}{t.magenta}{photo_rate: 11.1f}/s\n"
         "{t.normal}and updated {t.bold}{t.red}{profiles: 9d} 👱 user profiles "
         "{t.normal}{t.red}{profile_rate: 3.1f}/s\n"
+        "{t.normal}reusing     {t.bold}{t.green}{reused_connections: 9d} 🔗 connections "
+        "{t.normal}{t.green}for {num_requests} API requests, "
+        "{hedge_rate:.1%} hedged\n"
         "{t.normal}"
     )
 
@@ -77,6 +87,10 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
     def report_progress(self):
         """Report current progress."""
         photo_count, photo_rate, profile_count, profile_rate = self._statistics
+        hit_rate, planned_timespans, one_day_timespans = (
+            self._upload_density_model.statistics
+        )
+        api_rate, quarantined = self._api_key_manager.statistics
 
         with self.terminal.location(0, (self.pos_y - self.STATUS_LINES)):
             print(
@@ -86,8 +100,14 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
                     photo_rate=photo_rate,
                     profiles=profile_count,
                     profile_rate=profile_rate,
-                    workers=(threading.active_count() - self.NUM_MANAGERS),
+                    workers=self._num_workers,
+                    api_rate=api_rate,
+                    quarantined=quarantined,
                     todo=len(self._todo_deque),
+                    eta=self._eta,
+                    hit_rate=hit_rate,
+                    planned_timespans=planned_timespans,
+                    one_day_timespans=one_day_timespans,
                 )
             )
 
@@ -108,6 +128,8 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
         (Called right before exit)
         """
         photo_count, photo_rate, profile_count, profile_rate = self._statistics
+        num_requests, _, reused_connections = ApiSession.statistics()
+        api_calls, hedged_calls, _ = ApiDownloader.statistics()
         with self.terminal.location(0, (self.pos_y - self.STATUS_LINES)):
             print(
                 self.SUMMARY.format(
@@ -116,5 +138,8 @@ class FancyFlickrHistoryDownloader(BasicFlickrHistoryDownloader):
                     photo_rate=photo_rate,
                     profiles=profile_count,
                     profile_rate=profile_rate,
+                    num_requests=num_requests,
+                    reused_connections=reused_connections,
+                    hedge_rate=(hedged_calls / api_calls if api_calls else 0.0),
                 )
             )
@@ -8,24 +8,13 @@
 __all__ = ["LicenseDownloader"]
 
 
-import json
-
-import requests
-import urllib3
-
+from .apidownloader import ApiDownloader
 from .database import License, Session
-from .exceptions import ApiResponseError
 
 
-class LicenseDownloader:
+class LicenseDownloader(ApiDownloader):
     """Update the list of licenses."""
 
-    API_ENDPOINT_URL = "https://api.flickr.com/services/rest/"
-
-    def __init__(self, api_key_manager):
-        """Update the list of licenses."""
-        self._api_key_manager = api_key_manager
-
     def update_licenses(self):
         """Update the list of licenses."""
         query = {
@@ -34,21 +23,10 @@ class LicenseDownloader:
             "nojsoncallback": True,
         }
 
-        with self._api_key_manager.get_api_key() as api_key:
-            params = {"api_key": api_key}
-            params.update(query)
-
-            try:
-                with requests.get(self.API_ENDPOINT_URL, params=params) as response:
-                    results = response.json()
-            except (
-                ConnectionError,
-                json.decoder.JSONDecodeError,
-                requests.exceptions.RequestException,
-                urllib3.exceptions.HTTPError,
-            ) as exception:
-                raise ApiResponseError() from exception
+        self.save_licenses(self._get(query))
 
+    def save_licenses(self, results):
+        """Save the licenses from flickr.photos.licenses.getInfo results."""
         with Session() as session, session.begin():
             for license in results["licenses"]["license"]:
                 license_id = license["id"]
@@ -8,107 +8,350 @@
 __all__ = ["PhotoDownloader"]
 
 
+import collections
+import concurrent.futures
 import datetime
-import json
-
-import requests
-import urllib3
+import itertools
+import math
 
+from .apidownloader import ApiDownloader
+from .config import Config
+from .database import FieldProfile, PhotoSaver
 from .exceptions import ApiResponseError, DownloadBatchIsTooLargeError
+from .region import Region
+from .timespan import TimeSpan
+from .uploaddensitymodel import UploadDensityModel
 
 
 MAX_PHOTOS_PER_BATCH = 3000
+MAX_PAGES_IN_FLIGHT = 4
+PHOTOS_PER_PAGE = 500
 ONE_SECOND = datetime.timedelta(seconds=1)
 
 
-class PhotoDownloader:
+class PhotoDownloader(ApiDownloader):
     """Download all data covering a time span from the flickr API."""
 
-    API_ENDPOINT_URL = "https://api.flickr.com/services/rest/"
+    API_KEY_PRIORITY = "search"
+
+    PAGINATION_MODES = ("pages", "keyset")
+
+    def __init__(self, timespan, api_key_manager, pagination=None, streaming=None):
+        """
+        Intialize an PhotoDownloader.
+
+        Args:
+            timespan: TimeSpan to download photos for
+            api_key_manager: instance of an ApiKeyManager
+            pagination: "pages" (default) to request page after page of one
+                search, "keyset" to repeat the search, each time for the
+                first page of photos uploaded after the last photo seen
+                (default: `pagination` in the configuration, or "pages")
+            streaming: parse the photos of a page while it is still
+                downloading (pages prefetched in parallel are read
+                completely), default: `stream_search_results` in the
+                configuration, or False
 
-    def __init__(self, timespan, api_key_manager):
-        """Intialize an PhotoDownloader."""
+        """
+        super().__init__(api_key_manager)
         self._timespan = timespan
-        self._api_key_manager = api_key_manager
+        self._field_profile = FieldProfile()
+        self._region = Region()
+
+        if pagination is None:
+            with Config() as config:
+                try:
+                    pagination = config["pagination"]
+                except KeyError:
+                    pagination = "pages"
+        if pagination not in self.PAGINATION_MODES:
+            raise ValueError(
+                f"Unknown pagination {pagination!r}, "
+                f"expected one of {', '.join(self.PAGINATION_MODES)}"
+            )
+        self.pagination = pagination
+
+        if streaming is None:
+            with Config() as config:
+                try:
+                    streaming = bool(config["stream_search_results"])
+                except KeyError:
+                    streaming = False
+        self.streaming = streaming
+
+        # keyset pagination state
+        self._min_upload_date = self._timespan.start.timestamp()
+        self._last_date_posted = self._min_upload_date
+        self._ids_seen_at_last_date_posted = set()
+        self._keyset_page = 1
+        self.keyset_exhausted = False
+
+        self._upload_density_observed = False
 
     @property
     def photos(self):
         """Iterate over downloaded photos."""
-        query = {
+        for page in self.pages:
+            yield from page
+
+    @property
+    def pages(self):
+        """Iterate over downloaded photos, one list per page of search results."""
+        if self.pagination == "keyset":
+            yield from self._pages_by_keyset()
+        else:
+            yield from self._pages_by_page()
+
+    @property
+    def num_photos(self):
+        """Ask the API how many photos this time span contains."""
+        query = self.query(1)
+        query["per_page"] = 1
+        results = self._get(query)
+
+        try:
+            return int(results["photos"]["total"])
+        except (KeyError, TypeError, ValueError) as exception:
+            raise ApiResponseError() from exception
+
+    def _pages_by_keyset(self):
+        """Iterate over pages of downloaded photos, advancing min_upload_date."""
+        while not self.keyset_exhausted:
+            results = self._get_search_results(self.keyset_query())
+            try:
+                page = list(self.photos_in_keyset_results(results))
+            finally:
+                self._close_search_results(results)
+            yield page
+
+    def _pages_by_page(self):
+        """Iterate over pages of downloaded photos, page by page."""
+        # the first page tells us how many pages there are,
+        # then download the remaining pages in parallel (using
+        # whichever API keys are free), but yield the photos in order
+        results = self._get_search_results(self.query(1))
+
+        try:
+            yield list(self.photos_in_results(results))
+        except KeyError:
+            pass  # moving on to next page, if exists
+        finally:
+            self._close_search_results(results)
+
+        remaining_pages = iter(range(2, int(results["photos"]["pages"]) + 1))
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_PAGES_IN_FLIGHT
+        )
+        try:
+            pages_in_flight = collections.deque(
+                executor.submit(self._get, self.query(page))
+                for page in itertools.islice(remaining_pages, MAX_PAGES_IN_FLIGHT)
+            )
+            while pages_in_flight:
+                results = pages_in_flight.popleft().result()
+
+                for page in itertools.islice(remaining_pages, 1):
+                    pages_in_flight.append(executor.submit(self._get, self.query(page)))
+
+                try:
+                    yield list(self.photos_in_results(results))
+                except KeyError:
+                    pass  # moving on to next page, if exists
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _get_search_results(self, query):
+        """
+        Query the API for a page of search results.
+
+        If `streaming` is enabled, `results["photos"]["photo"]` is an
+        iterator over the photos as they arrive, which has to be consumed
+        before the other fields are all there is to rely on.
+        """
+        if not self.streaming:
+            return self._get(query)
+
+        stream = self._get_streaming(query, self._response_decoder.iter_search_results)
+        results = next(stream)
+        try:
+            if "photo" not in results["photos"]:
+                results["photos"]["photo"] = stream
+        except (KeyError, TypeError):
+            pass  # not search results, leave it to photos_in_results
+        return results
+
+    @staticmethod
+    def _close_search_results(results):
+        """Stop streaming search results, release their API key and connection."""
+        try:
+            results["photos"]["photo"].close()
+        except (AttributeError, KeyError, TypeError):
+            pass  # not streamed
+
+    def decode(self, content):
+        """Decode a page of search results (photos may be normalised already)."""
+        return self._response_decoder.decode_search_results(content)
+
+    def query(self, page):
+        """Return the API query for one page of this time span."""
+        return {
             "method": "flickr.photos.search",
             "format": "json",
             "nojsoncallback": 1,
-            "per_page": 500,
+            "per_page": PHOTOS_PER_PAGE,
             "has_geo": 1,
-            "extras": ", ".join(
-                [
-                    "description",
-                    "date_upload",
-                    "date_taken",
-                    "geo",
-                    "owner_name",
-                    "tags",
-                    "license",
-                ]
-            ),
+            "extras": ", ".join(self._field_profile.extras),
             "min_upload_date": self._timespan.start.timestamp(),
             "max_upload_date": self._timespan.end.timestamp(),
             "sort": "date-posted-asc",
+            "page": page,
+            **self._region.query,
         }
 
-        page = 1
+    def _observe_upload_density(self, results, num_photos_in_page):
+        """Report the number of photos in this time span to the density model."""
+        if self._upload_density_observed:
+            return
+        self._upload_density_observed = True
 
-        while True:
-            query["page"] = page
-            params = {}
-            with self._api_key_manager.get_api_key() as api_key:
-                params["api_key"] = api_key
-                params.update(query)
+        try:
+            num_photos = int(results["photos"]["total"])
+            # flickr sometimes reports 0 (or nothing) instead of “too many”
+            assert num_photos >= num_photos_in_page
+        except (AssertionError, KeyError, TypeError, ValueError):
+            return
 
-                try:
-                    with requests.get(self.API_ENDPOINT_URL, params=params) as response:
-                        results = response.json()
-                except (
-                    ConnectionError,
-                    json.decoder.JSONDecodeError,
-                    requests.exceptions.RequestException,
-                    urllib3.exceptions.HTTPError,
-                ) as exception:
-                    # API hicups, let’s consider this batch
-                    # unsuccessful and start over
-                    raise ApiResponseError() from exception
+        UploadDensityModel().observe(self._timespan, num_photos, MAX_PHOTOS_PER_BATCH)
 
-            try:
-                try:
-                    num_photos = int(results["photos"]["total"])
-                except TypeError:
-                    num_photos = 0
-
-                if (
-                    num_photos > MAX_PHOTOS_PER_BATCH
-                    and self._timespan.duration > ONE_SECOND
-                ):
-                    raise DownloadBatchIsTooLargeError(
-                        f"More than {MAX_PHOTOS_PER_BATCH} rows returned ({num_photos}), "
-                        "please specify a shorter time span."
-                    )
-
-                for photo in results["photos"]["photo"]:
-                    # the flickr API is matching date_posted very fuzzily,
-                    # let’s not waste time with duplicates
-                    if (
-                        datetime.datetime.fromtimestamp(
-                            int(photo["dateupload"]), tz=datetime.timezone.utc
-                        )
-                        > self._timespan.end
-                    ):
-                        continue
-
-                    yield photo
-
-            except KeyError:
-                pass  # moving on to next page, if exists
-
-            page += 1
-            if page > int(results["photos"]["pages"]):
-                break
+    def photos_in_results(self, results):
+        """
+        Iterate over the photos in one page of API results.
+
+        Photos are normalised one at a time, so that streamed results
+        (see `streaming`) are processed while they arrive.
+        """
+        try:
+            num_photos = int(results["photos"]["total"])
+        except TypeError:
+            num_photos = 0
+
+        photos = (
+            photo
+            for photo in map(PhotoSaver.normalise, results["photos"]["photo"])
+            # the flickr API is matching date_posted very fuzzily,
+            # let’s not waste time with duplicates
+            if photo["date_posted"] <= self._timespan.end
+            and self._region.contains(photo)
+        )
+
+        if num_photos > MAX_PHOTOS_PER_BATCH and self._timespan.duration > ONE_SECOND:
+            photos = list(photos)
+            self._observe_upload_density(results, len(photos))
+            raise DownloadBatchIsTooLargeError(
+                f"More than {MAX_PHOTOS_PER_BATCH} rows returned ({num_photos}), "
+                "please specify a shorter time span.",
+                total=num_photos,
+                photos=photos,
+            )
+
+        num_photos_in_page = 0
+        for photo in photos:
+            num_photos_in_page += 1
+            yield photo
+
+        self._observe_upload_density(results, num_photos_in_page)
+
+    def split(self, exception):
+        """
+        Split a time span that is too large, keeping the photos downloaded already.
+
+        The photos of the first page (sorted by upload date) cover the time
+        span up to the upload date of their last photo. Divide the rest of
+        the time span into as many pieces as needed to stay below
+        MAX_PHOTOS_PER_BATCH, assuming the remaining photos are spread evenly.
+
+        Args:
+            exception: the DownloadBatchIsTooLargeError raised for this
+                time span
+
+        Returns:
+            tuple (TimeSpan or None, list of TimeSpan): the part covered
+            by `exception.photos` (if any), and the pieces of the rest
+        """
+        downloaded = None
+        remaining = self._timespan
+        num_remaining_photos = exception.total
+
+        if exception.photos:
+            last_date_posted = exception.photos[-1]["date_posted"]
+            if self._timespan.start < last_date_posted < self._timespan.end:
+                # (photos uploaded at the very last second
+                # might continue on the next page)
+                downloaded = TimeSpan(self._timespan.start, last_date_posted)
+                remaining = TimeSpan(last_date_posted, self._timespan.end)
+                num_remaining_photos -= len(exception.photos)
+
+        num_pieces = max(1, math.ceil(num_remaining_photos / MAX_PHOTOS_PER_BATCH))
+        # … but don’t cut it into pieces shorter than a second
+        num_pieces = max(1, min(num_pieces, int(remaining.duration / ONE_SECOND)))
+
+        return (downloaded, remaining / num_pieces)
+
+    def keyset_query(self):
+        """Return the API query for the next page (keyset pagination)."""
+        query = self.query(self._keyset_page)
+        query["min_upload_date"] = self._min_upload_date
+        return query
+
+    def photos_in_keyset_results(self, results):
+        """
+        Iterate over the new photos in one page of API results (keyset pagination).
+
+        Then advance `min_upload_date` to the upload date of the last photo:
+        the next query will return photos uploaded at or after that second.
+        Photos from that second we have already seen are skipped.
+        """
+        try:
+            photos = results["photos"]["photo"]
+        except (KeyError, TypeError) as exception:
+            # API hicups, let’s consider this batch
+            # unsuccessful and start over
+            raise ApiResponseError() from exception
+
+        end = self._timespan.end.timestamp()
+
+        num_photos_in_page = 0
+        for photo in photos:
+            num_photos_in_page += 1
+            photo = PhotoSaver.normalise(photo)
+            date_posted = int(photo["date_posted"].timestamp())
+
+            if date_posted > end:
+                # sorted by date_posted, all remaining photos are newer
+                self.keyset_exhausted = True
+                self._observe_upload_density(results, num_photos_in_page)
+                return
+
+            if photo["id"] in self._ids_seen_at_last_date_posted:
+                continue
+
+            if date_posted > self._last_date_posted:
+                self._last_date_posted = date_posted
+                self._ids_seen_at_last_date_posted = set()
+            self._ids_seen_at_last_date_posted.add(photo["id"])
+
+            if self._region.contains(photo):
+                yield photo
+
+        self._observe_upload_density(results, num_photos_in_page)
+
+        if num_photos_in_page < PHOTOS_PER_PAGE:
+            self.keyset_exhausted = True
+        elif self._last_date_posted > self._min_upload_date:
+            self._min_upload_date = self._last_date_posted
+            self._keyset_page = 1
+        else:
+            # an entire page of photos uploaded in the same second,
+            # we cannot advance min_upload_date, use the next page
+            self._keyset_page += 1
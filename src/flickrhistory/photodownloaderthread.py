@@ -10,15 +10,16 @@ __all__ = ["PhotoDownloaderThread"]
 
 import threading
 
-from .database import PhotoSaver
+from .databasewriterthread import PendingTimeSpan
 from .exceptions import ApiResponseError, DownloadBatchIsTooLargeError
 from .photodownloader import PhotoDownloader
+from .retrypolicy import RetryPolicy
 
 
 class PhotoDownloaderThread(threading.Thread):
     """Wraps an PhotoDownloader to run in a separate thread."""
 
-    def __init__(self, api_key_manager, todo_deque, done_queue):
+    def __init__(self, api_key_manager, todo_deque, done_queue, write_queue):
         """
         Intialize an PhotoDownloaderThread.
 
@@ -27,7 +28,9 @@ class PhotoDownloaderThread(threading.Thread):
             todo_deque: collections.deque that serves TimeSpans
                         that need to be downloaded
             done_queue: queue.Queue into which to put TimeSpans
-                        that have been downloaded
+                        that have been downloaded (and saved)
+            write_queue: bounded queue.Queue into which to put pages
+                        of photos to save (see DatabaseWriterThread)
 
         """
         super().__init__()
@@ -37,9 +40,19 @@ class PhotoDownloaderThread(threading.Thread):
         self._api_key_manager = api_key_manager
         self._todo_deque = todo_deque
         self._done_queue = done_queue
+        self._write_queue = write_queue
+        self._retry_policy = RetryPolicy()
 
         self.shutdown = threading.Event()
 
+    def _save(self, page, pending_timespan):
+        """Hand a page of photos to the DatabaseWriterThreads."""
+        if page:
+            pending_timespan.add_batch()
+            # (blocks while the database writers are behind)
+            self._write_queue.put((page, pending_timespan))
+            self.count += len(page)
+
     def run(self):
         """Get TimeSpans off todo_deque and download photos."""
         while not self.shutdown.is_set():
@@ -49,37 +62,53 @@ class PhotoDownloaderThread(threading.Thread):
                 break
 
             photo_downloader = PhotoDownloader(timespan, self._api_key_manager)
+            pending_timespan = PendingTimeSpan(timespan, self._done_queue)
+            retry_key = (timespan.start, timespan.end)
 
             try:
-                for photo in photo_downloader.photos:
-                    photo = PhotoSaver().save(photo)
-
-                    self.count += 1
+                for page in photo_downloader.pages:
+                    self._save(page, pending_timespan)
 
-                    if self.shutdown.is_set():
+                    if self.shutdown.is_set() and page:
                         # let’s only report back on how much we
                         # in fact downloaded, not what our quota was
-                        timespan.end = photo.date_posted
+                        timespan.end = page[-1]["date_posted"]
                         break
 
             except ApiResponseError:
                 # API returned some bogus/none-JSON data
-                # let’s add this timespan to the other end
-                # of the todo deque and start over
+                # (or has been failing for a while), let’s
+                # wait a bit, then add this timespan to the other
+                # end of the todo deque and start over
+                # (unless we tried too often, then the next run will)
                 # TODO: implement logging and log the
                 # data (which is in the exception’s message)
-                self._todo_deque.appendleft(timespan)
+                delay = self._retry_policy.delay(retry_key)
+                if delay is not None:
+                    self.shutdown.wait(delay)
+                    self._todo_deque.appendleft(timespan)
                 continue
 
-            except DownloadBatchIsTooLargeError:
+            except DownloadBatchIsTooLargeError as exception:
                 # too many photos in this time span,
-                # let’s split it in half and re-inject
-                # it to the todo deque
-                for half_timespan in timespan / 2:
-                    self._todo_deque.append(half_timespan)
+                # let’s save the first page we already
+                # downloaded, split the rest of the time span
+                # into small enough pieces, and re-inject
+                # them to the todo deque
+                self._retry_policy.forget(retry_key)
+                downloaded, pieces = photo_downloader.split(exception)
+
+                pending_downloaded = PendingTimeSpan(downloaded, self._done_queue)
+                self._save(exception.photos, pending_downloaded)
+                pending_downloaded.complete()
+
+                for piece in reversed(pieces):
+                    self._todo_deque.append(piece)
 
                 # get a new timespan from the deque :)
                 continue
 
-            # … report to parent thread how much we worked
-            self._done_queue.put(timespan)
+            # … report to parent thread how much we worked,
+            # once the database writers have saved it
+            self._retry_policy.forget(retry_key)
+            pending_timespan.complete()
@@ -8,15 +8,10 @@
 __all__ = ["PhotoUpdater"]
 
 
-import json
+from .apidownloader import ApiDownloader
 
-import requests
-import urllib3
 
-from .exceptions import ApiResponseError
-
-
-class PhotoUpdater:
+class PhotoUpdater(ApiDownloader):
     """
     Download photo data from the flickr API.
 
@@ -24,51 +19,37 @@ class PhotoUpdater:
     geo accuracy, license, tags. This re-fetches that information.
     """
 
-    API_ENDPOINT_URL = "https://api.flickr.com/services/rest/"
-
-    def __init__(self, api_key_manager):
-        """Intialize an PhotoUpdater."""
-        self._api_key_manager = api_key_manager
+    API_KEY_PRIORITY = "photo_info"
 
     def get_info_for_photo_id(self, photo_id):
         """Get profile data by photo_id."""
-        query = {
+        results = self._get(self.query(photo_id))
+        return self.data_from_results(photo_id, results)
+
+    def query(self, photo_id):
+        """Return the API query for the details of photo_id."""
+        return {
             "method": "flickr.photos.getInfo",
             "format": "json",
-            "nojsoncallback": True,
+            "nojsoncallback": 1,
             "photo_id": photo_id,
         }
 
-        params = {}
-        with self._api_key_manager.get_api_key() as api_key:
-            params["api_key"] = api_key
-            params.update(query)
-
+    def data_from_results(self, photo_id, results):
+        """Extract a photo data dict from flickr.photos.getInfo results."""
         try:
-            with requests.get(self.API_ENDPOINT_URL, params=params) as response:
-                results = response.json()
-                assert "photo" in results
-
-                data = {
-                    "id": photo_id,
-                    "tags": " ".join(
-                        [tag["_content"] for tag in results["photo"]["tags"]["tag"]]
-                    ),
-                    "license": int(results["photo"]["license"]),
-                    "accuracy": int(results["photo"]["location"]["accuracy"]),
-                    "owner": results["photo"]["owner"]["nsid"],
-                    "ownername": results["photo"]["owner"]["realname"],
-                }
-
-        except (
-            ConnectionError,
-            json.decoder.JSONDecodeError,
-            requests.exceptions.RequestException,
-            urllib3.exceptions.HTTPError,
-        ) as exception:
-            # API hicups, let’s consider this batch
-            # unsuccessful and start over
-            raise ApiResponseError() from exception
+            assert "photo" in results
+
+            data = {
+                "id": photo_id,
+                "tags": " ".join(
+                    [tag["_content"] for tag in results["photo"]["tags"]["tag"]]
+                ),
+                "license": int(results["photo"]["license"]),
+                "accuracy": int(results["photo"]["location"]["accuracy"]),
+                "owner": results["photo"]["owner"]["nsid"],
+                "ownername": results["photo"]["owner"]["realname"],
+            }
 
         except AssertionError:
             # if API hicups, return a stub data dict
@@ -14,9 +14,10 @@ import time
 import sqlalchemy
 
 from .config import Config
-from .database import Photo, PhotoSaver, Session
+from .database import FieldProfile, Photo, PhotoSaver, Session
 from .exceptions import ApiResponseError
 from .photoupdater import PhotoUpdater
+from .retrypolicy import RetryPolicy
 
 
 class PhotoUpdaterThread(threading.Thread):
@@ -47,6 +48,9 @@ class PhotoUpdaterThread(threading.Thread):
         except (AssertionError, TypeError):
             self._bounds = None
 
+        self._retry_policy = RetryPolicy()
+        self._field_profile = FieldProfile()
+
         self.shutdown = threading.Event()
 
         with Config() as config:
@@ -58,12 +62,14 @@ class PhotoUpdaterThread(threading.Thread):
     def ids_of_photos_without_detailed_information(self):
         """Find ids of incomplete photo profiles."""
         # Find id of incomplete photo records
-        # We use geo_accuracy IS NULL
+        # We use geo_accuracy IS NULL (or, depending on the field
+        # profile, another field flickr.photos.getInfo returns)
+        incomplete_photos = self._field_profile.incomplete_photos
         with Session() as session:
             if self._bounds is None:
                 ids_of_photos_without_detailed_information = session.query(
                     Photo.id
-                ).filter_by(geo_accuracy=None)
+                ).filter(incomplete_photos)
             else:
                 bounds = (
                     sqlalchemy.select(
@@ -75,12 +81,12 @@ class PhotoUpdaterThread(threading.Thread):
                         .label("upper"),
                     )
                     .select_from(Photo)
-                    .filter_by(geo_accuracy=None)
+                    .filter(incomplete_photos)
                     .cte()
                 )
                 ids_of_photos_without_detailed_information = (
                     session.query(Photo.id)
-                    .filter_by(geo_accuracy=None)
+                    .filter(incomplete_photos)
                     .where(Photo.id.between(bounds.c.lower, bounds.c.upper))
                     .yield_per(1000)
                 )
@@ -97,10 +103,15 @@ class PhotoUpdaterThread(threading.Thread):
                 try:
                     PhotoSaver().save(photo_updater.get_info_for_photo_id(photo_id))
                     self.count += 1
+                    self._retry_policy.forget(("photo", photo_id))
 
                 except ApiResponseError:
-                    # API returned some bogus/none-JSON data,
-                    # let’s try again later
+                    # API returned some bogus/none-JSON data
+                    # (or has been failing for a while),
+                    # let’s wait a bit, and try again later
+                    delay = self._retry_policy.delay(("photo", photo_id))
+                    if delay is not None:
+                        self.shutdown.wait(delay)
                     continue
 
                 if self.shutdown.is_set():
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""A geographic area to restrict downloads to."""
+
+
+__all__ = ["Region"]
+
+
+import re
+
+from .config import Config
+
+
+class Region:
+    """
+    A geographic area to restrict downloads to.
+
+    `region` in the configuration (or `flickrhistory --region`) names one
+    of the `regions` defined in the configuration, each by one of:
+    - bbox: [min_longitude, min_latitude, max_longitude, max_latitude]
+    - polygon: [[longitude, latitude], …], searches its bounding box,
+      and discards photos outside the polygon
+    - woe_id: a Where On Earth ID
+    - place_id: a flickr place ID
+
+    Each region keeps its own cache (see Cache), i.e., its own record of
+    which time spans have been downloaded, so that downloads of several
+    regions can run side by side, and resume independently.
+
+    Without a `region`, the whole world is downloaded.
+    """
+
+    # region names end up in file names
+    VALID_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+    def __init__(self, name=None):
+        """
+        Initialise a Region.
+
+        Args:
+            name: one of the `regions` in the configuration
+                (default: `region` in the configuration, or the whole world)
+        """
+        if name is None:
+            with Config() as config:
+                try:
+                    name = config["region"]
+                except KeyError:
+                    name = None
+
+        self.name = name
+        self.bbox = None
+        self.polygon = None
+        self.woe_id = None
+        self.place_id = None
+
+        if name is None:
+            return
+
+        if not self.VALID_NAME.match(str(name)):
+            raise ValueError(
+                f"Invalid region name {name!r}, "
+                "use only letters, digits, hyphens and underscores"
+            )
+
+        with Config() as config:
+            try:
+                definition = config["regions"][name]
+            except (KeyError, TypeError) as exception:
+                raise ValueError(
+                    f"Unknown region {name!r}, define it in `regions` "
+                    "in the configuration"
+                ) from exception
+
+        try:
+            if "polygon" in definition:
+                self.polygon = [
+                    (float(longitude), float(latitude))
+                    for longitude, latitude in definition["polygon"]
+                ]
+                longitudes, latitudes = zip(*self.polygon)
+                self.bbox = (
+                    min(longitudes),
+                    min(latitudes),
+                    max(longitudes),
+                    max(latitudes),
+                )
+            elif "bbox" in definition:
+                self.bbox = tuple(float(value) for value in definition["bbox"])
+                assert len(self.bbox) == 4
+            elif "woe_id" in definition:
+                self.woe_id = str(definition["woe_id"])
+            elif "place_id" in definition:
+                self.place_id = str(definition["place_id"])
+            else:
+                raise KeyError()
+        except (AssertionError, KeyError, TypeError, ValueError) as exception:
+            raise ValueError(
+                f"Invalid definition of region {name!r}, expected one of "
+                "bbox, polygon, woe_id, or place_id"
+            ) from exception
+
+    @property
+    def query(self):
+        """Return the parameters of flickr.photos.search that restrict it to this region."""
+        if self.bbox is not None:
+            return {"bbox": ",".join(f"{value:f}" for value in self.bbox)}
+        if self.woe_id is not None:
+            return {"woe_id": self.woe_id}
+        if self.place_id is not None:
+            return {"place_id": self.place_id}
+        return {}
+
+    def contains(self, photo):
+        """Check whether a (normalised) photo lies within this region."""
+        if self.polygon is None:
+            # flickr.photos.search filtered already
+            return True
+
+        try:
+            # "SRID=4326;POINT(longitude latitude)"
+            longitude, latitude = (
+                float(coordinate)
+                for coordinate in photo["geom"]
+                .partition("POINT(")[2]
+                .rstrip(")")
+                .split()
+            )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return False
+
+        # even-odd rule: count the polygon’s edges a ray from the point crosses
+        inside = False
+        for (x1, y1), (x2, y2) in zip(self.polygon, self.polygon[-1:] + self.polygon):
+            if (y1 > latitude) != (y2 > latitude) and longitude < (
+                x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+            ):
+                inside = not inside
+        return inside
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Estimate the API calls and time the remaining downloads take."""
+
+
+__all__ = ["RemainingWorkEstimator"]
+
+
+import concurrent.futures
+import datetime
+import math
+
+import sqlalchemy
+
+from .database import FieldProfile, Photo, Session, User
+from .exceptions import ApiResponseError, CircuitOpenError
+from .photodownloader import MAX_PHOTOS_PER_BATCH, PHOTOS_PER_PAGE, PhotoDownloader
+
+
+# used if the database does not contain any data, yet
+DEFAULT_USERS_PER_PHOTO = 0.05
+
+# if the API cannot count the photos of a gap,
+# split it in halves (at most this many times)
+MAX_PROBE_SPLITS = 8
+
+
+class RemainingWorkEstimator:
+    """Estimate the API calls and time the remaining downloads take."""
+
+    def __init__(
+        self,
+        num_api_keys,
+        rate_limit_per_second,
+        photos_per_timespan=MAX_PHOTOS_PER_BATCH,
+        users_per_photo=None,
+    ):
+        """
+        Initialise a RemainingWorkEstimator.
+
+        Args:
+            num_api_keys: how many API keys are used
+            rate_limit_per_second: how often each API key can be used per second
+            photos_per_timespan: how many photos each time span is planned
+                to contain (see BasicFlickrHistoryDownloader)
+            users_per_photo: how many new user profiles each new photo
+                brings (default: ratio of users to photos in the database)
+        """
+        self.api_calls_per_second = num_api_keys * rate_limit_per_second
+        self.photos_per_timespan = photos_per_timespan
+
+        if users_per_photo is None:
+            users_per_photo = self.users_per_photo_in_database()
+        self.users_per_photo = users_per_photo
+
+    @staticmethod
+    def users_per_photo_in_database():
+        """Return the ratio of users to photos in the database."""
+        # PostgreSQL’s table statistics are much cheaper than COUNT(*)
+        with Session() as session:
+            num_photos, num_users = [
+                session.execute(
+                    sqlalchemy.text(
+                        """
+                            SELECT
+                                reltuples
+                            FROM
+                                pg_class
+                            WHERE
+                                relname = :table;
+                        """
+                    ),
+                    {"table": table},
+                ).scalar_one_or_none()
+                or 0
+                for table in (Photo.__table__.name, User.__table__.name)
+            ]
+
+        if num_photos > 0 and num_users > 0:
+            return num_users / num_photos
+        return DEFAULT_USERS_PER_PHOTO
+
+    @staticmethod
+    def incomplete_records_in_database():
+        """
+        Count the records the updater threads still have to complete.
+
+        Returns:
+            tuple of int: (incomplete user profiles, incomplete photos)
+        """
+        with Session() as session:
+            incomplete_profiles = (
+                session.query(User.id).filter_by(join_date=None).count()
+            )
+            incomplete_photos = (
+                session.query(Photo.id).filter(FieldProfile().incomplete_photos).count()
+            )
+        return (incomplete_profiles, incomplete_photos)
+
+    @staticmethod
+    def count_photos(gaps, api_key_manager, max_workers=4):
+        """
+        Ask the API how many photos each gap contains.
+
+        Uses one cheap query (`per_page=1`) per gap.
+
+        Args:
+            gaps: list of TimeSpans
+            api_key_manager: instance of an ApiKeyManager
+            max_workers: how many queries to run in parallel
+
+        Returns:
+            list of int: number of photos in each gap
+        """
+
+        def _count_photos(gap, splits=0):
+            try:
+                return PhotoDownloader(gap, api_key_manager).num_photos
+            except CircuitOpenError:
+                raise
+            except ApiResponseError:
+                # flickr does not (always) count very large result sets
+                if splits >= MAX_PROBE_SPLITS:
+                    raise
+                return sum(_count_photos(half, splits + 1) for half in gap / 2)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(_count_photos, gaps))
+
+    def search_calls(self, num_photos):
+        """Estimate how many flickr.photos.search calls num_photos take."""
+        num_timespans = max(1, math.ceil(num_photos / self.photos_per_timespan))
+        pages_per_timespan = max(
+            1, math.ceil(num_photos / num_timespans / PHOTOS_PER_PAGE)
+        )
+        return num_timespans * pages_per_timespan
+
+    def estimate(self, photos_per_timespan, incomplete_profiles=0, incomplete_photos=0):
+        """
+        Estimate the API calls and time the remaining downloads take.
+
+        Args:
+            photos_per_timespan: list of the (expected) number of photos
+                in each time span still to download
+            incomplete_profiles: user profiles still to complete
+            incomplete_photos: photo records still to complete
+
+        Returns:
+            dict: expected number of photos, of flickr.photos.search,
+            flickr.profile.getProfile, and flickr.photos.getInfo calls,
+            of API calls in total, and the time they take
+            (a datetime.timedelta)
+        """
+        photos = sum(photos_per_timespan)
+        search_calls = sum(
+            self.search_calls(num_photos) for num_photos in photos_per_timespan
+        )
+        profile_calls = round(photos * self.users_per_photo) + incomplete_profiles
+        photo_info_calls = incomplete_photos
+
+        api_calls = search_calls + profile_calls + photo_info_calls
+
+        return {
+            "photos": round(photos),
+            "search_calls": search_calls,
+            "profile_calls": profile_calls,
+            "photo_info_calls": photo_info_calls,
+            "api_calls": api_calls,
+            "eta": datetime.timedelta(
+                seconds=round(api_calls / self.api_calls_per_second)
+            ),
+        }
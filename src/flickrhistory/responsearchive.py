@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Archive raw API responses, and read them back."""
+
+
+__all__ = ["ResponseArchive"]
+
+
+import datetime
+import gzip
+import json
+import os
+import os.path
+import threading
+import warnings
+import zlib
+
+from .config import Config
+
+
+class ResponseArchive:
+    """
+    Archive raw API responses, and read them back.
+
+    If `response_archive` in the configuration names a directory, every
+    successful API response is appended to it, together with the query
+    (minus the API key), as a line of JSON in gzip-compressed segments,
+    one per hour (and run): `{year}/{month}/{day}/{hour}-{run}.jsonl.gz`.
+    Segments are never rewritten, and a segment cut short by a crash
+    can still be read up to where it ends.
+
+    When a segment is closed, a line is added to `index.jsonl` with the
+    span of upload dates the searches in it covered, so that reading
+    back the searches for a time span can skip most segments.
+
+    Implemented as a pseudo-singleton (cf. Config): all instances
+    share the segment currently written to.
+    """
+
+    INDEX_FILE = "index.jsonl"
+    SEGMENT_SUFFIX = ".jsonl.gz"
+
+    # flush compressed data to disk after this many records
+    FLUSH_EVERY = 100
+
+    SEARCH_METHOD = "flickr.photos.search"
+
+    _lock = threading.Lock()
+    _run = f"{datetime.datetime.now(datetime.timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}"
+
+    _partition = None
+    _segment = None
+    _segment_file = None
+    _num_records = 0
+    _span = None
+
+    def __init__(self, directory=None):
+        """
+        Initialise a ResponseArchive.
+
+        Args:
+            directory: where to keep the archive (default:
+                `response_archive` in the configuration, or None to
+                not archive responses)
+        """
+        if directory is None:
+            with Config() as config:
+                try:
+                    directory = config["response_archive"]
+                except KeyError:
+                    pass
+        if directory is not None:
+            directory = os.path.abspath(os.path.expanduser(directory))
+        self.directory = directory
+
+    @property
+    def enabled(self):
+        """Return True if responses are archived."""
+        return self.directory is not None
+
+    def append(self, query, content):
+        """
+        Archive an API response.
+
+        Args:
+            query: the query parameters sent to the API
+            content: the body of the response (bytes)
+        """
+        if not self.enabled:
+            return
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        query = {
+            parameter: value
+            for parameter, value in query.items()
+            if parameter != "api_key"
+        }
+        line = json.dumps(
+            {
+                "archived": now.timestamp(),
+                "method": query.get("method"),
+                "query": query,
+                "response": content.decode("utf-8", errors="replace"),
+            },
+            ensure_ascii=False,
+        )
+
+        with self._lock:
+            self._open_segment(now)
+            self._segment_file.write(line.encode("utf-8") + b"\n")
+
+            ResponseArchive._num_records += 1
+            if self._num_records % self.FLUSH_EVERY == 0:
+                self._segment_file.flush()
+
+            if query.get("method") == self.SEARCH_METHOD:
+                try:
+                    start = float(query["min_upload_date"])
+                    end = float(query["max_upload_date"])
+                except (KeyError, TypeError, ValueError):
+                    return
+                if self._span is not None:
+                    start = min(start, self._span[0])
+                    end = max(end, self._span[1])
+                ResponseArchive._span = (start, end)
+
+    def close(self):
+        """Close the segment currently written to, and index it."""
+        with self._lock:
+            self._close_segment()
+
+    def _open_segment(self, now):
+        partition = f"{now:%Y/%m/%d/%H}"
+        if partition == self._partition:
+            return
+
+        self._close_segment()
+
+        segment = f"{partition}-{self._run}{self.SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        ResponseArchive._partition = partition
+        ResponseArchive._segment = segment
+        ResponseArchive._segment_file = gzip.open(path, "ab")
+        ResponseArchive._num_records = 0
+        ResponseArchive._span = None
+
+    def _close_segment(self):
+        if self._segment_file is None:
+            return
+
+        self._segment_file.close()
+
+        start, end = self._span if self._span is not None else (None, None)
+        with open(
+            os.path.join(self.directory, self.INDEX_FILE), "a", encoding="utf-8"
+        ) as index:
+            index.write(
+                json.dumps(
+                    {
+                        "segment": self._segment,
+                        "records": self._num_records,
+                        "start": start,
+                        "end": end,
+                    }
+                )
+                + "\n"
+            )
+
+        ResponseArchive._partition = None
+        ResponseArchive._segment = None
+        ResponseArchive._segment_file = None
+
+    @property
+    def _index(self):
+        index = {}
+        try:
+            with open(
+                os.path.join(self.directory, self.INDEX_FILE), encoding="utf-8"
+            ) as index_file:
+                for line in index_file:
+                    try:
+                        entry = json.loads(line)
+                        index[entry["segment"]] = entry
+                    except (KeyError, ValueError):
+                        pass  # cut short by a crash
+        except FileNotFoundError:
+            pass
+        return index
+
+    def segments(self, timespan=None):
+        """
+        Iterate over the segments of the archive, oldest first.
+
+        Args:
+            timespan: only segments that (might) contain searches for
+                photos uploaded in this TimeSpan (default: all segments)
+        """
+        index = self._index
+
+        segments = []
+        for directory, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(self.SEGMENT_SUFFIX):
+                    segments.append(
+                        os.path.relpath(os.path.join(directory, file), self.directory)
+                    )
+
+        for segment in sorted(segments):
+            if timespan is not None and segment in index:
+                # (segments not in the index, e.g., after a crash,
+                # might contain anything)
+                entry = index[segment]
+                if (
+                    entry["start"] is None
+                    or entry["end"] < timespan.start.timestamp()
+                    or entry["start"] > timespan.end.timestamp()
+                ):
+                    continue
+            yield os.path.join(self.directory, segment)
+
+    def records(self, timespan=None):
+        """
+        Iterate over the archived responses, oldest first.
+
+        Args:
+            timespan: only searches for photos uploaded in this TimeSpan
+                (default: all responses)
+
+        Yields:
+            dict: `method`, `query`, `response` (a str), and when it
+            was `archived` (a POSIX timestamp)
+        """
+        for segment in self.segments(timespan):
+            try:
+                with gzip.open(segment, "rt", encoding="utf-8") as segment_file:
+                    for line in segment_file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # cut short by a crash
+
+                        if timespan is not None and not self._overlaps(
+                            record, timespan
+                        ):
+                            continue
+
+                        yield record
+
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                warnings.warn(f"Archive segment {segment} is incomplete")
+
+    @classmethod
+    def _overlaps(cls, record, timespan):
+        """Check whether record is a search covering part of timespan."""
+        if record.get("method") != cls.SEARCH_METHOD:
+            return False
+        try:
+            return (
+                float(record["query"]["min_upload_date"]) <= timespan.end.timestamp()
+                and float(record["query"]["max_upload_date"])
+                >= timespan.start.timestamp()
+            )
+        except (KeyError, TypeError, ValueError):
+            return False
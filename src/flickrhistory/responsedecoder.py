@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Decode API responses, optionally with a faster JSON library."""
+
+
+__all__ = ["ResponseDecoder"]
+
+
+import codecs
+import datetime
+import json
+import re
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .config import Config
+from .database import NormalisedPhoto
+
+
+PHOTO_ARRAY = re.compile(r'"photo"\s*:\s*\[')
+WHITESPACE_AND_COMMAS = re.compile(r"[\s,]*")
+
+
+if msgspec is not None:
+
+    class _Content(msgspec.Struct):
+        content: str = msgspec.field(default="", name="_content")
+
+    # fields that depend on the extras requested (see FieldProfile) are None
+    # if the response does not contain them
+    class _SearchPhoto(msgspec.Struct, kw_only=True):
+        id: str
+        owner: str
+        ownername: str | None = None
+        server: str = ""
+        secret: str = ""
+        title: str = ""
+        description: _Content | None = None
+        dateupload: int
+        datetaken: str | None = None
+        latitude: float | None = None
+        longitude: float | None = None
+        accuracy: int | None = None
+        license: int | None = None
+        tags: str | None = None
+
+    class _SearchPage(msgspec.Struct):
+        page: int = 1
+        pages: int = 0
+        perpage: int = 0
+        total: int = 0
+        photo: list[_SearchPhoto] = []
+
+    class _SearchResults(msgspec.Struct):
+        photos: _SearchPage
+        stat: str = "ok"
+
+
+class ResponseDecoder:
+    """
+    Decode API responses, optionally with a faster JSON library.
+
+    `json_decoder` in the configuration selects the library:
+    - "json" (default): the standard library
+    - "orjson": orjson, a faster drop-in replacement
+    - "msgspec": msgspec, which decodes search results straight into typed
+      records (cf. NormalisedPhoto), converting the fields while parsing
+    """
+
+    DECODERS = ("json", "orjson", "msgspec")
+
+    def __init__(self, decoder=None):
+        """
+        Initialise a ResponseDecoder.
+
+        Args:
+            decoder: one of DECODERS
+                (default: `json_decoder` in the configuration, or "json")
+        """
+        if decoder is None:
+            with Config() as config:
+                try:
+                    decoder = config["json_decoder"]
+                except KeyError:
+                    decoder = "json"
+        if decoder not in self.DECODERS:
+            raise ValueError(
+                f"Unknown json_decoder {decoder!r}, "
+                f"expected one of {', '.join(self.DECODERS)}"
+            )
+        if (decoder == "orjson" and orjson is None) or (
+            decoder == "msgspec" and msgspec is None
+        ):
+            raise RuntimeError(
+                f"The {decoder} json_decoder requires {decoder}, "
+                "install flickrhistory[fastjson]"
+            )
+        self.decoder = decoder
+
+    def decode(self, content):
+        """Decode a JSON response (bytes or str) into dicts and lists."""
+        if self.decoder == "msgspec":
+            return msgspec.json.decode(content)
+        if self.decoder == "orjson":
+            return orjson.loads(content)
+        return json.loads(content)
+
+    def decode_search_results(self, content):
+        """
+        Decode a flickr.photos.search response.
+
+        With msgspec, the photos are NormalisedPhotos already. Otherwise,
+        and if the response does not look like search results (e.g., an
+        error), the same as decode().
+        """
+        if self.decoder != "msgspec":
+            return self.decode(content)
+
+        try:
+            results = msgspec.json.decode(content, type=_SearchResults, strict=False)
+        except msgspec.ValidationError:
+            return self.decode(content)
+
+        return {
+            "photos": {
+                "page": results.photos.page,
+                "pages": results.photos.pages,
+                "perpage": results.photos.perpage,
+                "total": results.photos.total,
+                "photo": [self._normalise(photo) for photo in results.photos.photo],
+            },
+            "stat": results.stat,
+        }
+
+    def iter_search_results(self, chunks):
+        """
+        Parse a flickr.photos.search response while it arrives.
+
+        Yields the results without the photos first (`{"photos": {"page":
+        …, "pages": …, "total": …}}`, flickr sends these before the photos),
+        then each photo as soon as it has been received completely. Only
+        about one chunk and one photo are held in memory at a time.
+
+        If the response does not contain a list of photos (e.g., an error
+        message), yields the complete decoded response only.
+
+        Args:
+            chunks: iterable of bytes, the response body
+        """
+        chunks = iter(chunks)
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        json_decoder = json.JSONDecoder()
+        buffer = ""
+
+        def _read():
+            nonlocal buffer
+            for chunk in chunks:
+                text = text_decoder.decode(chunk)
+                if text:
+                    buffer += text
+                    return True
+            return False
+
+        while (photo_array := PHOTO_ARRAY.search(buffer)) is None:
+            if not _read():
+                yield self.decode(buffer)
+                return
+
+        # close the objects opened before the list of photos
+        yield json.loads(buffer[: photo_array.start()].rstrip().rstrip(",") + "}}")
+
+        position = photo_array.end()
+        while True:
+            position = WHITESPACE_AND_COMMAS.match(buffer, position).end()
+            if position == len(buffer):
+                if not _read():
+                    raise ValueError("Response ended in the middle of the photos")
+                continue
+
+            if buffer[position] == "]":
+                break
+
+            try:
+                photo, position = json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # not received completely, yet
+                if not _read():
+                    raise
+                continue
+
+            yield photo
+
+            buffer = buffer[position:]
+            position = 0
+
+        # read (and discard) the rest of the response
+        for _ in chunks:
+            pass
+
+    @staticmethod
+    def _normalise(photo):
+        """Convert a _SearchPhoto to a NormalisedPhoto (cf. PhotoSaver.normalise)."""
+        photo_data = NormalisedPhoto(
+            id=photo.id,
+            title=photo.title,
+            date_posted=datetime.datetime.fromtimestamp(
+                photo.dateupload, tz=datetime.timezone.utc
+            ),
+            owner=photo.owner,
+        )
+
+        if photo.accuracy is not None:
+            photo_data["geo_accuracy"] = photo.accuracy
+
+        if photo.license is not None:
+            photo_data["license"] = photo.license
+
+        if photo.tags is not None:
+            photo_data["tags"] = photo.tags.split()
+
+        if photo.ownername is not None:
+            photo_data["ownername"] = photo.ownername
+
+        if photo.server:
+            photo_data["server"] = photo.server
+
+        if photo.secret:
+            try:
+                photo_data["secret"] = bytes.fromhex(photo.secret)
+            except ValueError:  # some non-hex character
+                pass
+
+        if photo.description is not None:
+            photo_data["description"] = photo.description.content
+
+        if photo.datetaken is not None:
+            try:
+                photo_data["date_taken"] = datetime.datetime.fromisoformat(
+                    photo.datetaken
+                ).astimezone(datetime.timezone.utc)
+            except ValueError:
+                # “0000-01-01 00:00:00”, see PhotoSaver.normalise
+                photo_data["date_taken"] = None
+
+        if photo.longitude and photo.latitude:
+            photo_data["geom"] = (
+                f"SRID=4326;POINT({photo.longitude:f} {photo.latitude:f})"
+            )
+
+        return photo_data
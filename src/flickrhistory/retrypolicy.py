@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Decide when to retry failed API calls, and stop calling a failing API."""
+
+
+__all__ = ["RetryPolicy"]
+
+
+import random
+import threading
+import time
+
+from .exceptions import ApiResponseError, CircuitOpenError, InvalidApiKeyError
+
+
+class RetryPolicy:
+    """
+    Decide when to retry failed API calls, and stop calling a failing API.
+
+    Each work item (a TimeSpan, a user profile, a photo) that failed is
+    retried after an exponentially growing, randomised delay (“full
+    jitter”), at most MAX_ATTEMPTS times in this run (items not completed
+    are picked up again by the next run).
+
+    On top of that, a circuit breaker watches all API calls: after
+    FAILURE_THRESHOLD consecutive failures, it opens, and API calls fail
+    immediately (CircuitOpenError), without using an API key. After a
+    while, one trial call is let through: if it succeeds, the circuit
+    closes again, otherwise it stays open for twice as long.
+
+    Implemented as a pseudo-singleton (cf. Config): all instances
+    share the same state.
+    """
+
+    MAX_ATTEMPTS = 10
+    BASE_DELAY = 1.0  # seconds
+    MAX_DELAY = 5 * 60
+
+    FAILURE_THRESHOLD = 20
+    OPEN_DURATION = 10.0
+    MAX_OPEN_DURATION = 10 * 60
+
+    _lock = threading.Lock()
+
+    _attempts = {}
+
+    _consecutive_failures = 0
+    _open_until = None
+    _open_duration = OPEN_DURATION
+    _trial_in_flight = False
+
+    # statistics
+    _retries = 0
+    _given_up = 0
+    _times_opened = 0
+
+    def delay(self, item):
+        """
+        Count a failed attempt at item, return how long to wait until the next.
+
+        Args:
+            item: a hashable identifier of the work item
+
+        Returns:
+            float or None: seconds to wait before retrying item, or None
+            if item should not be retried in this run
+        """
+        with self._lock:
+            attempts = self._attempts.get(item, 0) + 1
+            if attempts >= self.MAX_ATTEMPTS:
+                self._attempts.pop(item, None)
+                RetryPolicy._given_up += 1
+                return None
+            self._attempts[item] = attempts
+            RetryPolicy._retries += 1
+
+            delay = random.uniform(
+                0, min(self.MAX_DELAY, self.BASE_DELAY * 2**attempts)
+            )
+
+            # do not retry before the circuit breaker lets calls through
+            if self._open_until is not None:
+                delay = max(delay, self._open_until - time.time()) + random.uniform(
+                    0, self.BASE_DELAY
+                )
+
+            return delay
+
+    def forget(self, item):
+        """Forget the failed attempts at item (it succeeded)."""
+        with self._lock:
+            self._attempts.pop(item, None)
+
+    def before_call(self):
+        """
+        Check whether the circuit breaker lets an API call through.
+
+        Raises:
+            CircuitOpenError: the API has been failing, do not call it
+        """
+        with self._lock:
+            if self._open_until is None:
+                return
+            if time.time() < self._open_until or self._trial_in_flight:
+                raise CircuitOpenError()
+            # half open: let exactly one trial call through
+            RetryPolicy._trial_in_flight = True
+
+    def after_call(self, exception=None):
+        """
+        Report the outcome of an API call to the circuit breaker.
+
+        Args:
+            exception: the exception the call raised, or None
+        """
+        with self._lock:
+            trial = self._trial_in_flight
+            RetryPolicy._trial_in_flight = False
+
+            if exception is None:
+                RetryPolicy._consecutive_failures = 0
+                RetryPolicy._open_until = None
+                RetryPolicy._open_duration = self.OPEN_DURATION
+
+            elif isinstance(exception, InvalidApiKeyError) or not isinstance(
+                exception, ApiResponseError
+            ):
+                # not a failure of the API (the ApiKeyManager deals
+                # with invalid keys), try another trial call
+                pass
+
+            elif trial:
+                RetryPolicy._open_duration = min(
+                    self.MAX_OPEN_DURATION, 2 * self._open_duration
+                )
+                RetryPolicy._open_until = time.time() + self._open_duration
+
+            else:
+                RetryPolicy._consecutive_failures += 1
+                if (
+                    self._open_until is None
+                    and self._consecutive_failures >= self.FAILURE_THRESHOLD
+                ):
+                    RetryPolicy._open_until = time.time() + self._open_duration
+                    RetryPolicy._times_opened += 1
+
+    @property
+    def circuit_open(self):
+        """Return True while the circuit breaker stops API calls."""
+        with self._lock:
+            return self._open_until is not None
+
+    @property
+    def statistics(self):
+        """
+        Report how often API calls have been retried.
+
+        Returns:
+            tuple of int: (retries, work items given up for this run,
+            how often the circuit breaker opened)
+        """
+        with self._lock:
+            return (self._retries, self._given_up, self._times_opened)
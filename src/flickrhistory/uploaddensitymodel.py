@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Learn how many photos are uploaded per second, to plan time spans."""
+
+
+__all__ = ["UploadDensityModel"]
+
+
+import datetime
+import math
+import threading
+
+from .cache import Cache
+from .timespan import TimeSpan
+
+
+ONE_DAY = datetime.timedelta(days=1)
+ONE_SECOND = datetime.timedelta(seconds=1)
+
+
+class UploadDensityModel:
+    """
+    Learn how many photos are uploaded per second, to plan time spans.
+
+    The model keeps, per calendar month, how many photos the API reported
+    (`photos.total`) for how many seconds of upload time. From these
+    densities, it plans time spans that are expected to contain
+    a target number of photos.
+
+    Months for which no data have been observed, yet, are planned
+    in one-day time spans.
+
+    Implemented as a pseudo-singleton (cf. Config): all instances
+    share the same data.
+    """
+
+    CACHE_KEY = "upload density"
+
+    _months = None
+    _lock = threading.RLock()
+
+    # statistics (per run, not cached)
+    _hits = 0
+    _misses = 0
+    _planned_timespans = 0
+    _one_day_timespans = 0
+
+    def __init__(self):
+        """Initialise an UploadDensityModel, load observations from the cache."""
+        with self._lock:
+            if self._months is None:
+                with Cache() as cache:
+                    try:
+                        months = dict(cache[self.CACHE_KEY])
+                    except KeyError:
+                        months = {}
+                UploadDensityModel._months = months
+
+    @staticmethod
+    def _months_in(timespan):
+        """Iterate over (month, seconds of timespan in month)."""
+        start = timespan.start
+        while start < timespan.end:
+            if start.month == 12:
+                next_month = start.replace(
+                    year=(start.year + 1),
+                    month=1,
+                    day=1,
+                    hour=0,
+                    minute=0,
+                    second=0,
+                    microsecond=0,
+                )
+            else:
+                next_month = start.replace(
+                    month=(start.month + 1),
+                    day=1,
+                    hour=0,
+                    minute=0,
+                    second=0,
+                    microsecond=0,
+                )
+            end = min(next_month, timespan.end)
+            yield (f"{start:%Y-%m}", (end - start).total_seconds(), end)
+            start = end
+
+    def observe(self, timespan, num_photos, max_photos_per_timespan):
+        """
+        Learn from the number of photos the API reported for a time span.
+
+        Args:
+            timespan: the TimeSpan that was queried
+            num_photos: `photos.total` as reported by the API
+            max_photos_per_timespan: the limit the time span should stay
+                below (counts as a hit or a miss of the model)
+        """
+        duration = timespan.duration.total_seconds()
+        if duration <= 0:
+            return
+
+        with self._lock:
+            if num_photos > max_photos_per_timespan:
+                UploadDensityModel._misses += 1
+            else:
+                UploadDensityModel._hits += 1
+
+            for month, seconds, _ in self._months_in(timespan):
+                photos, observed_seconds = self._months.get(month, (0, 0))
+                self._months[month] = [
+                    photos + num_photos * (seconds / duration),
+                    observed_seconds + seconds,
+                ]
+
+    def photos_per_second(self, month):
+        """Return the observed density of uploads in month, or None."""
+        with self._lock:
+            try:
+                photos, seconds = self._months[month]
+                return photos / seconds
+            except (KeyError, ZeroDivisionError):
+                return None
+
+    def expected_photos(self, timespan):
+        """Estimate how many photos were uploaded in timespan (or None)."""
+        expected_photos = 0
+        for month, seconds, _ in self._months_in(timespan):
+            density = self.photos_per_second(month)
+            if density is None:
+                return None
+            expected_photos += density * seconds
+        return expected_photos
+
+    def plan(self, gap, target):
+        """
+        Cut a gap into TimeSpans that each contain about target photos.
+
+        Args:
+            gap: TimeSpan to cut into pieces
+            target: how many photos each piece is expected to contain
+        """
+        start = gap.start
+        num_timespans = 0
+
+        while start < gap.end:
+            end = self._end_of_timespan(start, gap.end, target)
+            yield TimeSpan(start, end)
+            num_timespans += 1
+            start = end
+
+        with self._lock:
+            UploadDensityModel._planned_timespans += num_timespans
+            UploadDensityModel._one_day_timespans += max(
+                1, math.ceil(gap.duration / ONE_DAY)
+            )
+
+    def _end_of_timespan(self, start, limit, target):
+        """Find the end of a time span from start to contain target photos."""
+        expected_photos = 0
+        position = start
+
+        for month, seconds, end_of_month in self._months_in(TimeSpan(start, limit)):
+            density = self.photos_per_second(month)
+
+            if density is None:
+                # no data, yet: plan one day, but stop
+                # at the beginning of the unknown month
+                if position == start:
+                    return min(start + ONE_DAY, limit)
+                return position
+
+            if expected_photos + density * seconds >= target:
+                end = position + datetime.timedelta(
+                    seconds=((target - expected_photos) / density)
+                )
+                return min(max(end, start + ONE_SECOND), limit)
+
+            expected_photos += density * seconds
+            position = end_of_month
+
+        return limit
+
+    @property
+    def statistics(self):
+        """
+        Report how well the planned time spans fit.
+
+        Returns:
+            tuple: (hit rate, number of planned time spans, number of
+            one-day time spans the same gaps would have been cut into)
+        """
+        with self._lock:
+            try:
+                hit_rate = self._hits / (self._hits + self._misses)
+            except ZeroDivisionError:
+                hit_rate = 0.0
+            return (hit_rate, self._planned_timespans, self._one_day_timespans)
+
+    def to_cache(self):
+        """Return the observations in a form that can be cached."""
+        with self._lock:
+            return {
+                month: [float(photos), float(seconds)]
+                for month, (photos, seconds) in self._months.items()
+            }
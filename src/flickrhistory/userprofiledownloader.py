@@ -8,22 +8,13 @@
 __all__ = ["UserProfileDownloader"]
 
 
-import json
+from .apidownloader import ApiDownloader
 
-import requests
-import urllib3
 
-from .exceptions import ApiResponseError
-
-
-class UserProfileDownloader:
+class UserProfileDownloader(ApiDownloader):
     """Download user profile data from the flickr API."""
 
-    API_ENDPOINT_URL = "https://api.flickr.com/services/rest/"
-
-    def __init__(self, api_key_manager):
-        """Intialize an PhotoDownloader."""
-        self._api_key_manager = api_key_manager
+    API_KEY_PRIORITY = "profiles"
 
     def get_profile_for_id_and_farm(self, user_id, farm):
         """Retrieve profile data by user_id and farm identifier."""
@@ -31,34 +22,21 @@ class UserProfileDownloader:
 
     def get_profile_for_nsid(self, nsid):
         """Get profile data by nsid."""
-        query = {
+        results = self._get(self.query(nsid))
+        return self.profile_from_results(nsid, results)
+
+    def query(self, nsid):
+        """Return the API query for the profile of nsid."""
+        return {
             "method": "flickr.profile.getProfile",
             "format": "json",
             "nojsoncallback": 1,
             "user_id": nsid,
         }
 
-        params = {}
-        with self._api_key_manager.get_api_key() as api_key:
-            params["api_key"] = api_key
-            params.update(query)
-
-        try:
-            with requests.get(self.API_ENDPOINT_URL, params=params) as response:
-                results = response.json()
-                assert "profile" in results
-
-        except (
-            ConnectionError,
-            json.decoder.JSONDecodeError,
-            requests.exceptions.RequestException,
-            urllib3.exceptions.HTTPError,
-        ) as exception:
-            # API hicups, let’s consider this batch
-            # unsuccessful and start over
-            raise ApiResponseError() from exception
-
-        except AssertionError:
+    def profile_from_results(self, nsid, results):
+        """Extract the profile data dict from flickr.profile.getProfile results."""
+        if "profile" not in results:
             # TODO: implement logging and report the response text + headers
             # if API hicups, return a stub data dict
             results = {"profile": {"id": nsid}}
@@ -16,6 +16,7 @@ import sqlalchemy
 from .config import Config
 from .database import User, UserSaver
 from .exceptions import ApiResponseError
+from .retrypolicy import RetryPolicy
 from .userprofiledownloader import UserProfileDownloader
 
 
@@ -47,6 +48,8 @@ class UserProfileUpdaterThread(threading.Thread):
         except (AssertionError, TypeError):
             self._bounds = None
 
+        self._retry_policy = RetryPolicy()
+
         self.shutdown = threading.Event()
 
         with Config() as config:
@@ -99,10 +102,15 @@ class UserProfileUpdaterThread(threading.Thread):
                 try:
                     UserSaver().save(user_profile_downloader.get_profile_for_nsid(nsid))
                     self.count += 1
+                    self._retry_policy.forget(("profile", nsid))
 
                 except ApiResponseError:
-                    # API returned some bogus/none-JSON data,
-                    # let’s try again later
+                    # API returned some bogus/none-JSON data
+                    # (or has been failing for a while),
+                    # let’s wait a bit, and try again later
+                    delay = self._retry_policy.delay(("profile", nsid))
+                    if delay is not None:
+                        self.shutdown.wait(delay)
                     continue
 
                 if self.shutdown.is_set():
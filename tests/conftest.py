@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Fixtures shared by the tests of flickrhistory."""
+
+
+import datetime
+import io
+import json
+import math
+import threading
+import time
+import urllib.parse
+
+import pytest
+import requests
+import requests.adapters
+
+from flickrhistory.apikeymanager import ApiKeyManager
+from flickrhistory.config import Config
+from flickrhistory.database import RowCache
+from flickrhistory.database.row_cache import LruCache
+from flickrhistory.fakeflickrapi import FakeFlickrApi
+from flickrhistory.retrypolicy import RetryPolicy
+from flickrhistory.timespan import TimeSpan
+
+
+API_KEY = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch, tmp_path):
+    """Start with a minimal configuration, and an empty cache in tmp_path."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.delenv("LOCALAPPDATA", raising=False)
+    monkeypatch.delenv("APPDATA", raising=False)
+
+    # Config is a pseudo-singleton, replace its shared state
+    monkeypatch.setattr(
+        Config,
+        "_config",
+        {
+            "flickr_api_keys": [API_KEY],
+            "database_connection_string": "postgresql://localhost/flickrhistory",
+        },
+    )
+    return Config()
+
+
+@pytest.fixture(autouse=True)
+def retry_policy(monkeypatch):
+    """Reset the circuit breaker and the failed attempts of RetryPolicy."""
+    for attribute, value in (
+        ("_attempts", {}),
+        ("_consecutive_failures", 0),
+        ("_open_until", None),
+        ("_open_duration", RetryPolicy.OPEN_DURATION),
+        ("_trial_in_flight", False),
+        ("_retries", 0),
+        ("_given_up", 0),
+        ("_times_opened", 0),
+    ):
+        monkeypatch.setattr(RetryPolicy, attribute, value)
+    return RetryPolicy()
+
+
+@pytest.fixture(autouse=True)
+def row_cache(monkeypatch):
+    """Forget which licenses, tags, and users RowCache has seen."""
+    for attribute, value in (
+        ("_licenses", None),
+        ("_license_hits", 0),
+        ("_license_misses", 0),
+        ("_tags", LruCache(RowCache.MAX_TAGS)),
+        ("_users", LruCache(RowCache.MAX_USERS)),
+    ):
+        monkeypatch.setattr(RowCache, attribute, value)
+    return RowCache()
+
+
+class FakeSearchApi:
+    """
+    Answer flickr.photos.search requests instead of the flickr API.
+
+    Every `interval` seconds, starting in March 2015, `photos_per_upload`
+    photos are uploaded; searches return them sorted by upload date.
+    """
+
+    def __init__(self, interval=2, photos_per_upload=1, latency=0.0):
+        """Initialise a FakeSearchApi."""
+        self.interval = interval
+        self.photos_per_upload = photos_per_upload
+        self.latency = latency
+        self.calls = 0
+        self.max_calls_in_flight = 0
+        self._calls_in_flight = 0
+        self._lock = threading.Lock()
+
+    def photos(self, timespan):
+        """Return the photos uploaded in timespan, in order."""
+        start = math.ceil(timespan.start.timestamp() / self.interval) * self.interval
+        return [
+            {
+                "id": f"{timestamp}{photo:03d}",
+                "dateupload": str(timestamp),
+                "accuracy": "0",
+                "license": "0",
+                "tags": "",
+            }
+            for timestamp in range(
+                int(start), int(timespan.end.timestamp()) + 1, self.interval
+            )
+            for photo in range(self.photos_per_upload)
+        ]
+
+    def photo_ids(self, timespan):
+        """Return the ids of the photos uploaded in timespan, in order."""
+        return [photo["id"] for photo in self.photos(timespan)]
+
+    def search(self, query):
+        """Return the body of the response to a search."""
+        timespan = TimeSpan(
+            datetime.datetime.fromtimestamp(
+                float(query["min_upload_date"]), tz=datetime.timezone.utc
+            ),
+            datetime.datetime.fromtimestamp(
+                float(query["max_upload_date"]), tz=datetime.timezone.utc
+            ),
+        )
+        photos = self.photos(timespan)
+        per_page = int(query.get("per_page", 100))
+        page = int(query.get("page", 1))
+        return {
+            "photos": {
+                "page": page,
+                "pages": max(math.ceil(len(photos) / per_page), 1),
+                "perpage": per_page,
+                "total": len(photos),
+                "photo": photos[(page - 1) * per_page : page * per_page],
+            },
+            "stat": "ok",
+        }
+
+    def send(self, request, **kwargs):
+        """Answer a request (replaces HTTPAdapter.send)."""
+        with self._lock:
+            self.calls += 1
+            self._calls_in_flight += 1
+            self.max_calls_in_flight = max(
+                self.max_calls_in_flight, self._calls_in_flight
+            )
+        time.sleep(self.latency)
+
+        query = {
+            parameter: values[-1]
+            for parameter, values in urllib.parse.parse_qs(
+                urllib.parse.urlsplit(request.url).query
+            ).items()
+        }
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.raw = io.BytesIO(json.dumps(self.search(query)).encode("utf-8"))
+        response.request = request
+        response.url = request.url
+
+        with self._lock:
+            self._calls_in_flight -= 1
+        return response
+
+
+@pytest.fixture
+def fake_search_api(monkeypatch):
+    """Answer the searches of PhotoDownloaders with a FakeSearchApi."""
+    fake_search_api = FakeSearchApi(latency=0.02)
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", fake_search_api.send)
+    return fake_search_api
+
+
+@pytest.fixture
+def api_key_manager():
+    """Return an ApiKeyManager that does not slow the tests down."""
+    return ApiKeyManager(["a", "b"], rate_limit_per_second=1000)
+
+
+@pytest.fixture
+def fake_flickr_api(config):
+    """Serve a FakeFlickrApi, and point the configuration at it."""
+    with FakeFlickrApi(api_keys=["a", "b"]) as fake_flickr_api:
+        config["flickr_api_endpoint_url"] = fake_flickr_api.url
+        yield fake_flickr_api
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test querying the flickr API, and checking its responses."""
+
+
+import collections
+import io
+import json
+import time
+import urllib.parse
+
+import pytest
+import requests
+import requests.adapters
+
+from flickrhistory.apidownloader import (
+    LATENCY_SAMPLES,
+    MIN_LATENCY_SAMPLES,
+    ApiDownloader,
+)
+from flickrhistory.apikeymanager import ApiKeyManager
+from flickrhistory.exceptions import ApiResponseError, InvalidApiKeyError
+
+
+@pytest.fixture(autouse=True)
+def api_downloader_statistics(monkeypatch):
+    """Start without observed latencies, and without statistics."""
+    # latencies and statistics are shared by all ApiDownloaders
+    for attribute, value in (
+        ("_latencies", collections.deque(maxlen=LATENCY_SAMPLES)),
+        ("_num_calls", 0),
+        ("_num_hedged_calls", 0),
+        ("_num_hedges_won", 0),
+    ):
+        monkeypatch.setattr(ApiDownloader, attribute, value)
+
+
+@pytest.fixture
+def slow_api_key(monkeypatch):
+    """Answer all API calls with `{"stat": "ok"}`, slowly for API keys "slow…"."""
+    calls = []
+
+    def _send(adapter, request, **kwargs):
+        api_key = urllib.parse.parse_qs(urllib.parse.urlsplit(request.url).query)[
+            "api_key"
+        ][0]
+        calls.append((api_key, kwargs.get("timeout")))
+        if api_key.startswith("slow"):
+            time.sleep(0.5)
+
+        response = requests.Response()
+        response.status_code = 500 if api_key == "slow-failing" else 200
+        response.raw = io.BytesIO(json.dumps({"stat": "ok"}).encode("utf-8"))
+        response.request = request
+        return response
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", _send)
+    return calls
+
+
+def _api_downloader(api_keys):
+    """Return an ApiDownloader that has seen enough fast calls to hedge."""
+    api_downloader = ApiDownloader(
+        ApiKeyManager(api_keys, rate_limit_per_second=1000, burst=10)
+    )
+    for _ in range(MIN_LATENCY_SAMPLES):
+        api_downloader.record_latency(0.01)
+    return api_downloader
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_throttling_and_server_errors_raise_an_error(status_code):
+    """Raise an ApiResponseError if the API throttles or fails."""
+    with pytest.raises(ApiResponseError):
+        ApiDownloader.check_status_code(status_code)
+
+
+def test_other_status_codes_are_left_to_the_response():
+    """Do not raise for successful (or client error) status codes."""
+    for status_code in (200, 404):
+        ApiDownloader.check_status_code(status_code)
+
+
+def test_invalid_api_keys_raise_an_error():
+    """Raise InvalidApiKeyError if the API rejects the API key."""
+    with pytest.raises(InvalidApiKeyError):
+        ApiDownloader.check_results(
+            {"stat": "fail", "code": 100, "message": "Invalid API Key"}
+        )
+
+
+def test_api_wide_errors_raise_an_error():
+    """Raise ApiResponseError if the API reports an error of all methods."""
+    with pytest.raises(ApiResponseError):
+        ApiDownloader.check_results(
+            {"stat": "fail", "code": 105, "message": "Service currently unavailable"}
+        )
+
+
+def test_errors_of_a_method_are_valid_answers():
+    """Leave errors specific to a method, e.g., “user not found”, to the caller."""
+    ApiDownloader.check_results({"stat": "fail", "code": 1, "message": "not found"})
+    ApiDownloader.check_results({"stat": "ok"})
+
+
+def test_api_calls_have_deadlines(config, slow_api_key):
+    """Send API calls with the configured connect and read timeouts."""
+    config["api_connect_timeout"] = 1.5
+    config["api_read_timeout"] = 10
+
+    ApiDownloader(ApiKeyManager(["a"], rate_limit_per_second=1000))._get({})
+
+    assert slow_api_key == [("a", (1.5, 10.0))]
+
+
+def test_calls_are_hedged_only_if_enabled_and_possible(config):
+    """Hedge only with hedged_requests, two API keys, and enough latencies."""
+    assert _api_downloader(["a", "b"]).hedge_after() is None
+
+    config["api_hedged_requests"] = True
+    assert _api_downloader(["a"]).hedge_after() is None
+    assert _api_downloader(["a", "b"]).hedge_after() == 0.01
+
+    ApiDownloader._latencies.clear()
+    assert ApiDownloader(ApiKeyManager(["a", "b"])).hedge_after() is None
+
+
+def test_hedge_after_the_95th_percentile_of_recent_latencies(config):
+    """Wait as long as 95% of the recent calls took before hedging."""
+    config["api_hedged_requests"] = True
+    api_downloader = ApiDownloader(ApiKeyManager(["a", "b"]))
+
+    for latency in range(1, 201):
+        api_downloader.record_latency(latency / 100)
+
+    assert api_downloader.hedge_after() == 1.91
+
+
+def test_slow_calls_that_fail_are_answered_by_the_hedged_request(config, slow_api_key):
+    """Send a slow call again with another API key, use it if the first fails."""
+    config["api_hedged_requests"] = True
+    api_downloader = _api_downloader(["slow-failing", "fast"])
+    _prefer_api_key(api_downloader, "slow-failing", "fast")
+
+    results = api_downloader._get({"method": "flickr.test.echo"})
+
+    assert results == {"stat": "ok"}
+    assert [api_key for api_key, _ in slow_api_key] == ["slow-failing", "fast"]
+    assert ApiDownloader.statistics() == (1, 1, 1)
+
+
+def _prefer_api_key(api_downloader, api_key, other_api_key):
+    """Make api_downloader use api_key first, unless it is excluded."""
+    get_api_key = api_downloader._api_key_manager.get_api_key
+
+    def _get_api_key(priority="search", exclude=()):
+        if api_key not in exclude:
+            return get_api_key(priority, exclude=(other_api_key,))
+        return get_api_key(priority, exclude=exclude)
+
+    api_downloader._api_key_manager.get_api_key = _get_api_key
+
+
+def test_api_keys_the_api_rejects_raise_an_error(fake_flickr_api):
+    """Raise InvalidApiKeyError if the API does not know the API key."""
+    api_downloader = ApiDownloader(ApiKeyManager(["c"], rate_limit_per_second=1000))
+
+    with pytest.raises(InvalidApiKeyError):
+        api_downloader._get({"method": "flickr.photos.licenses.getInfo"})
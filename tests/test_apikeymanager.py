@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test the rate limits of API keys, and how they are handed out."""
+
+
+import asyncio
+import collections
+import threading
+import time
+
+import pytest
+
+from flickrhistory.apikeymanager import (
+    MIN_RATE_LIMIT_PER_SECOND,
+    ONE_HOUR,
+    ONE_MINUTE,
+    PROBE_TIMEOUT,
+    QUARANTINE,
+    ApiKey,
+    ApiKeyManager,
+)
+from flickrhistory.cache import Cache
+from flickrhistory.exceptions import InvalidApiKeyError
+
+
+NOW = 1500000000.0
+
+
+def test_token_bucket_allows_a_burst_then_the_rate_limit():
+    """Hand out `burst` tokens at once, then one every 1/rate seconds."""
+    api_key = ApiKey("key", rate_limit_per_second=2, burst=3)
+    api_key._last_refill = NOW
+
+    for _ in range(3):
+        assert api_key.next_token_time(NOW) == NOW
+        api_key.take_token(NOW)
+
+    assert api_key.next_token_time(NOW) == NOW + 0.5
+
+
+def test_token_bucket_does_not_save_up_more_than_a_burst():
+    """Refill at most `burst` tokens, however long the key was idle."""
+    api_key = ApiKey("key", rate_limit_per_second=2, burst=3)
+    api_key._last_refill = NOW
+
+    later = NOW + ONE_HOUR
+    for _ in range(3):
+        api_key.take_token(later)
+
+    assert api_key.next_token_time(later) == later + 0.5
+
+
+def test_hourly_budget_waits_for_the_oldest_calls_to_expire():
+    """Stop handing out tokens once calls_per_hour are used up."""
+    api_key = ApiKey("key", rate_limit_per_second=100, burst=10, calls_per_hour=5)
+    api_key._last_refill = NOW
+
+    for _ in range(5):
+        api_key.take_token(NOW)
+
+    minute = NOW // ONE_MINUTE * ONE_MINUTE
+    assert api_key.next_token_time(NOW) == minute + ONE_HOUR + ONE_MINUTE
+
+
+def test_manager_uses_the_key_with_the_next_free_token():
+    """Use the other API key while one has to wait for a token."""
+    api_key_manager = ApiKeyManager(["a", "b"], rate_limit_per_second=0.01)
+
+    api_keys = []
+    for _ in range(2):
+        with api_key_manager.get_api_key() as api_key:
+            api_keys.append(api_key)
+
+    assert sorted(api_keys) == ["a", "b"]
+
+
+def test_manager_remembers_the_usage_of_the_past_hour():
+    """Restore how often each API key was used from the cache."""
+    api_key_manager = ApiKeyManager(["a"], rate_limit_per_second=1000, burst=10)
+    for _ in range(3):
+        with api_key_manager.get_api_key():
+            pass
+    with Cache(per_region=False) as cache:
+        cache[ApiKeyManager.CACHE_KEY] = api_key_manager.to_cache()
+
+    restored = ApiKeyManager(["a"], rate_limit_per_second=1000, calls_per_hour=3)
+
+    (api_key,) = restored._api_keys
+    assert api_key.next_token_time(time.time()) > time.time() + ONE_HOUR / 2
+
+
+def test_coroutines_wait_for_tokens_without_blocking_the_loop():
+    """Hand out tokens to coroutines at the rate limit."""
+    api_key_manager = ApiKeyManager(["a"], rate_limit_per_second=20)
+    api_keys = []
+
+    async def _call():
+        async with api_key_manager.get_api_key_async() as api_key:
+            api_keys.append(api_key)
+
+    async def _calls():
+        await asyncio.gather(*(_call() for _ in range(5)))
+
+    start = time.monotonic()
+    asyncio.run(_calls())
+
+    assert api_keys == ["a"] * 5
+    assert time.monotonic() - start >= 4 / 20 - 0.02
+
+
+def _share_of_api_calls(priorities, num_calls=600):
+    """Let two threads per priority class call the API, count their calls."""
+    api_key_manager = ApiKeyManager(["a"], rate_limit_per_second=2000)
+    calls = collections.Counter()
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def _call(priority):
+        while not done.is_set():
+            with api_key_manager.get_api_key(priority):
+                with lock:
+                    calls[priority] += 1
+                    if sum(calls.values()) >= num_calls:
+                        done.set()
+
+    threads = [
+        threading.Thread(target=_call, args=(priority,))
+        for priority in priorities
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = sum(calls.values())
+    return {priority: calls[priority] / total for priority in priorities}
+
+
+def test_priority_classes_share_the_api_keys_by_weight():
+    """Serve the priority classes in proportion to their weights."""
+    share = _share_of_api_calls(("search", "profiles", "photo_info"))
+
+    assert share["search"] == pytest.approx(0.7, abs=0.05)
+    assert share["profiles"] == pytest.approx(0.2, abs=0.05)
+    assert share["photo_info"] == pytest.approx(0.1, abs=0.05)
+
+
+def test_idle_priority_classes_leave_their_share_to_the_others():
+    """Share the capacity of a class nobody uses between the other classes."""
+    share = _share_of_api_calls(("profiles", "photo_info"))
+
+    assert share["profiles"] == pytest.approx(2 / 3, abs=0.05)
+    assert share["photo_info"] == pytest.approx(1 / 3, abs=0.05)
+
+
+def test_unknown_priority_classes_raise_an_error():
+    """Reject priority classes without a weight, and weights of zero."""
+    api_key_manager = ApiKeyManager(["a"], rate_limit_per_second=1000)
+    with pytest.raises(ValueError):
+        with api_key_manager.get_api_key("thumbnails"):
+            pass
+
+    with pytest.raises(ValueError):
+        ApiKeyManager(["a"], priorities={"search": 0})
+
+
+def test_rate_limit_decreases_multiplicatively_and_increases_additively():
+    """Halve the rate limit after a failure, regain it slowly after successes."""
+    api_key = ApiKey("key", rate_limit_per_second=1.0)
+
+    api_key.slow_down(started=NOW, now=NOW + 1)
+    assert api_key.rate_limit_per_second == 0.5
+
+    for _ in range(5):
+        api_key.speed_up()
+    assert api_key.rate_limit_per_second == pytest.approx(0.75)
+
+    for _ in range(100):
+        api_key.speed_up()
+    assert api_key.rate_limit_per_second == 1.0
+
+
+def test_calls_in_flight_during_a_slow_down_do_not_slow_down_again():
+    """Count failures of calls started before the last decrease only once."""
+    api_key = ApiKey("key", rate_limit_per_second=1.0)
+
+    api_key.slow_down(started=NOW, now=NOW + 1)
+    api_key.slow_down(started=NOW + 0.5, now=NOW + 2)
+    assert api_key.rate_limit_per_second == 0.5
+
+    api_key.slow_down(started=NOW + 3, now=NOW + 4)
+    assert api_key.rate_limit_per_second == 0.25
+
+
+def test_rate_limit_does_not_drop_below_the_minimum():
+    """Keep calling at least once per minute."""
+    api_key = ApiKey("key", rate_limit_per_second=1.0)
+
+    for second in range(100):
+        api_key.slow_down(started=NOW + second, now=NOW + second)
+
+    assert api_key.rate_limit_per_second == MIN_RATE_LIMIT_PER_SECOND
+
+
+def test_rejected_keys_are_quarantined_then_probed():
+    """Stop using a rejected API key, re-admit it once a probing call succeeds."""
+    api_key = ApiKey("key", rate_limit_per_second=1.0, burst=10)
+    api_key._last_refill = NOW
+
+    api_key.quarantine(NOW)
+    assert api_key.quarantined
+    assert api_key.next_token_time(NOW) == NOW + QUARANTINE
+
+    # one probing call, and no other until it returns
+    probe = NOW + QUARANTINE
+    api_key.take_token(probe)
+    assert api_key.next_token_time(probe) == probe + PROBE_TIMEOUT
+
+    api_key.speed_up()
+    assert not api_key.quarantined
+    assert api_key.rate_limit_per_second == 0.5
+    assert api_key.next_token_time(probe) == probe
+
+
+def test_repeatedly_rejected_keys_stay_in_quarantine_longer():
+    """Double the quarantine each time an API key is rejected again."""
+    api_key = ApiKey("key", rate_limit_per_second=1.0)
+    api_key._last_refill = NOW
+
+    api_key.quarantine(NOW)
+    api_key.quarantine(NOW)
+    assert api_key.next_token_time(NOW) == NOW + 2 * QUARANTINE
+
+
+def test_manager_quarantines_keys_the_api_rejects():
+    """Quarantine an API key if the API call using it raises InvalidApiKeyError."""
+    api_key_manager = ApiKeyManager(["a", "b"], rate_limit_per_second=1000)
+
+    with pytest.raises(InvalidApiKeyError):
+        with api_key_manager.get_api_key() as rejected_api_key:
+            raise InvalidApiKeyError()
+
+    _, quarantined = api_key_manager.statistics
+    assert quarantined == 1
+    for _ in range(5):
+        with api_key_manager.get_api_key() as api_key:
+            assert api_key != rejected_api_key
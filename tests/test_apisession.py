@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test sharing one pool of keep-alive connections to the API."""
+
+
+import http.server
+import threading
+
+import pytest
+
+from flickrhistory.apisession import ApiSession
+
+
+class _OkHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def do_GET(self):
+        body = b'{"stat": "ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_session(monkeypatch):
+    """Start without a shared adapter, and without sessions."""
+    # ApiSession is a pseudo-singleton, replace its shared state
+    monkeypatch.setattr(ApiSession, "_adapter", None)
+    monkeypatch.setattr(ApiSession, "_thread_local", threading.local())
+    return ApiSession
+
+
+@pytest.fixture
+def server_url():
+    """Serve `{"stat": "ok"}` on localhost."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_threads_have_their_own_session_sharing_one_adapter(api_session):
+    """Return the same session within a thread, and one adapter for all."""
+    sessions = []
+
+    def _get_session():
+        sessions.append(api_session())
+        sessions.append(api_session())
+
+    thread = threading.Thread(target=_get_session)
+    thread.start()
+    thread.join()
+    _get_session()
+
+    assert sessions[0] is sessions[1]
+    assert sessions[2] is sessions[3]
+    assert sessions[0] is not sessions[2]
+    adapters = {
+        id(session.get_adapter("https://api.flickr.com/")) for session in sessions
+    }
+    assert len(adapters) == 1
+
+
+def test_connection_pool_size_can_be_configured(config, api_session):
+    """Use `api_connections_per_host` connections per host."""
+    config["api_connections_per_host"] = 7
+
+    adapter = api_session().get_adapter("https://api.flickr.com/")
+
+    assert adapter._pool_maxsize == 7
+
+
+def test_requests_reuse_open_connections(api_session, server_url):
+    """Send consecutive requests over the same connection, and count them."""
+    for _ in range(3):
+        with api_session().get(server_url) as response:
+            assert response.json() == {"stat": "ok"}
+
+    assert api_session.statistics() == (3, 1, 2)
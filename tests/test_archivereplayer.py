@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test archiving API responses, and replaying them into the database."""
+
+
+import datetime
+
+import pytest
+
+import flickrhistory.archivereplayer
+from flickrhistory.archivereplayer import ArchiveReplayer
+from flickrhistory.database import PhotoSaver
+from flickrhistory.photodownloader import PhotoDownloader
+from flickrhistory.responsearchive import ResponseArchive
+from flickrhistory.timespan import TimeSpan
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def response_archive(config, monkeypatch, tmp_path):
+    """Archive API responses to tmp_path, close the archive afterwards."""
+    config["response_archive"] = str(tmp_path / "archive")
+
+    # ResponseArchive is a pseudo-singleton, start with a segment of our own
+    for attribute, value in (
+        ("_partition", None),
+        ("_segment", None),
+        ("_segment_file", None),
+        ("_num_records", 0),
+        ("_span", None),
+    ):
+        monkeypatch.setattr(ResponseArchive, attribute, value)
+
+    yield ResponseArchive()
+    ResponseArchive().close()
+
+
+@pytest.fixture
+def saved_photos(monkeypatch):
+    """Collect the photos saved to the database, instead of saving them."""
+    saved_photos = []
+    monkeypatch.setattr(flickrhistory.archivereplayer, "Session", lambda: None)
+    monkeypatch.setattr(
+        PhotoSaver, "save", lambda self, photo: saved_photos.append(photo)
+    )
+    return saved_photos
+
+
+def _download(api_key_manager, streaming):
+    """Download the photos of 40 minutes of March 2015, return their ids."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=40))
+    photo_downloader = PhotoDownloader(
+        timespan, api_key_manager, pagination="keyset", streaming=streaming
+    )
+    return [photo["id"] for photo in photo_downloader.photos]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_every_search_response_is_archived(
+    fake_flickr_api, api_key_manager, response_archive, streaming
+):
+    """Archive each search response once, also when streaming them."""
+    _download(api_key_manager, streaming)
+    response_archive.close()
+
+    records = list(response_archive.records())
+
+    assert fake_flickr_api.calls["flickr.photos.search"] > 1
+    assert len(records) == fake_flickr_api.calls["flickr.photos.search"]
+    assert all(record["method"] == "flickr.photos.search" for record in records)
+    assert all("api_key" not in record["query"] for record in records)
+
+
+def test_replay_saves_the_downloaded_photos(
+    fake_search_api, api_key_manager, response_archive, saved_photos
+):
+    """Save the same photos from the archive as the download did."""
+    photo_ids = _download(api_key_manager, streaming=False)
+    response_archive.close()
+
+    ArchiveReplayer().replay()
+
+    # (keyset pages overlap by a second, replay saves those photos twice)
+    assert {photo["id"] for photo in saved_photos} == set(photo_ids)
+
+
+def test_replay_only_replays_searches_within_a_time_span(
+    fake_search_api, api_key_manager, response_archive, saved_photos
+):
+    """Skip the archived searches for photos uploaded outside `timespan`."""
+    _download(api_key_manager, streaming=False)
+    response_archive.close()
+
+    ArchiveReplayer().replay(
+        TimeSpan(
+            MARCH_2015 + datetime.timedelta(hours=1),
+            MARCH_2015 + datetime.timedelta(hours=2),
+        )
+    )
+
+    assert saved_photos == []
+
+
+def test_replay_discards_photos_outside_the_region(
+    config, fake_flickr_api, api_key_manager, response_archive, saved_photos
+):
+    """Save only the archived photos that lie within the region’s polygon."""
+    _download(api_key_manager, streaming=False)
+    response_archive.close()
+
+    config["regions"] = {
+        "west": {"polygon": [[-180, -90], [0, -90], [0, 90], [-180, 90]]}
+    }
+    config["region"] = "west"
+    ArchiveReplayer().replay()
+
+    longitudes = [
+        float(photo["geom"].partition("POINT(")[2].split()[0]) for photo in saved_photos
+    ]
+    assert longitudes
+    assert all(longitude < 0 for longitude in longitudes)
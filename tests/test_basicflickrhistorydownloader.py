@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test the progress reports of the plain-text downloader."""
+
+
+import datetime
+import time
+import types
+
+import pytest
+
+from flickrhistory.basicflickrhistorydownloader import BasicFlickrHistoryDownloader
+
+
+@pytest.fixture
+def downloader():
+    """Return a BasicFlickrHistoryDownloader that has not started downloading."""
+    return BasicFlickrHistoryDownloader()
+
+
+def _status_line(capsys, downloader):
+    downloader.report_progress()
+    return capsys.readouterr().err.rstrip("\r\n")
+
+
+@pytest.mark.parametrize(
+    "eta, short_eta",
+    [
+        (None, "?"),
+        (datetime.timedelta(minutes=5), "0:05"),
+        (datetime.timedelta(hours=7, minutes=30), "7:30"),
+        (datetime.timedelta(days=1234, hours=3, minutes=4), "1234d 03:04"),
+    ],
+)
+def test_eta_is_shown_in_days_hours_and_minutes(downloader, eta, short_eta):
+    """Format the ETA compactly, or as “?” before there is an estimate."""
+    if eta is not None:
+        downloader._remaining_work_estimator = object()
+        downloader._last_eta = (time.time(), eta)
+
+    assert downloader._short_eta == short_eta
+
+
+def test_status_line_fits_80_columns(capsys, downloader):
+    """Keep the status line within 79 characters, also with large numbers."""
+    downloader._database_writer_threads = [types.SimpleNamespace(count=123456789)]
+    downloader._remaining_work_estimator = object()
+    downloader._last_eta = (time.time(), datetime.timedelta(days=1234))
+    for _ in range(999):
+        downloader._write_queue.put(None)
+
+    line = _status_line(capsys, downloader)
+
+    assert "123456789 photos" in line
+    assert "1234d 00:00" in line
+    assert len(line) <= 79
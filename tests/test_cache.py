@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test keeping state between runs in the cache file."""
+
+
+import pytest
+
+from flickrhistory.cache import Cache
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Count how often the cache file is written."""
+    saves = []
+    save_cache = Cache._save_cache
+
+    def _save_cache(self):
+        saves.append(dict(self._cache))
+        save_cache(self)
+
+    monkeypatch.setattr(Cache, "_save_cache", _save_cache)
+    return saves
+
+
+def test_cache_contexts_save_the_cache_once(saves):
+    """Write the cache file when leaving the context, not on every change."""
+    with Cache() as cache:
+        cache["a"] = 1
+        cache["b"] = 2
+        del cache["a"]
+        assert saves == []
+
+    assert saves == [{"b": 2}]
+    assert Cache()["b"] == 2
+
+
+def test_changes_outside_a_context_are_saved_right_away(saves):
+    """Write the cache file on every change made outside a context."""
+    cache = Cache()
+
+    cache["a"] = 1
+    cache["b"] = 2
+
+    assert len(saves) == 2
+    assert Cache()["a"] == 1
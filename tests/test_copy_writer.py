@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test saving photos in bulk with COPY."""
+
+
+import csv
+import datetime
+import io
+import types
+
+import pytest
+
+import flickrhistory.database.copy_writer
+from flickrhistory.database import CopyWriter, FieldProfile
+from flickrhistory.database.copy_writer import PHOTO_COLUMNS, _csv_value
+
+
+PHOTO = {
+    "id": "10000000001",
+    "owner": "12345678@N01",
+    "ownername": 'Jane "JD" Doe',
+    "title": 'Commas, "quotes",\nnew lines, and a NUL\x00',
+    "dateupload": "1425168000",
+    "latitude": "60.192059",
+    "longitude": "24.945831",
+    "tags": "helsinki snow",
+}
+
+
+class FakeSession:
+    """Record what a CopyWriter writes, instead of writing it to a database."""
+
+    def __init__(self):
+        """Initialise a FakeSession."""
+        self.statements = []
+        self.copied = {}
+
+    def __call__(self):
+        """Pretend to be the Session class, and return this session."""
+        return self
+
+    def __enter__(self):
+        """Enter the session context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit the session context."""
+
+    def begin(self):
+        """Begin a transaction."""
+        return self
+
+    def execute(self, statement):
+        """Record a statement."""
+        self.statements.append(str(statement))
+
+    def connection(self):
+        """Return the session’s connection, with this as its DB-API connection."""
+        return types.SimpleNamespace(
+            connection=types.SimpleNamespace(driver_connection=self)
+        )
+
+    def cursor(self):
+        """Return a cursor."""
+        return self
+
+    def copy_expert(self, statement, data):
+        """Record the data copied to a table, in psycopg2’s manner."""
+        table = statement.split()[1]
+        self.copied[table] = data.read()
+
+
+class FailingSession(FakeSession):
+    """A session whose database is unreachable."""
+
+    def __enter__(self):
+        """Fail to connect."""
+        raise ConnectionError("could not connect to server")
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """Replace the Session of CopyWriter with a FakeSession."""
+    session = FakeSession()
+    monkeypatch.setattr(flickrhistory.database.copy_writer, "Session", session)
+    return session
+
+
+@pytest.fixture
+def failing_session(monkeypatch):
+    """Replace the Session of CopyWriter with a FailingSession."""
+    session = FailingSession()
+    monkeypatch.setattr(flickrhistory.database.copy_writer, "Session", session)
+    return session
+
+
+@pytest.fixture
+def copy_writer():
+    """Return a CopyWriter that writes only when flushed."""
+    return CopyWriter(FieldProfile("full"), flush_rows=1000, flush_interval=3600)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, ""),
+        ("", '""'),
+        (True, "t"),
+        (False, "f"),
+        (42, "42"),
+        (b"\x01\xab", "\\x01ab"),
+        (
+            datetime.datetime(2015, 3, 1, 12, tzinfo=datetime.timezone.utc),
+            "2015-03-01T12:00:00+00:00",
+        ),
+        ('say "cheese", please', '"say ""cheese"", please"'),
+        ("NUL\x00", '"NUL"'),
+    ],
+)
+def test_csv_values(value, expected):
+    """Format values for COPY, quote strings, and keep NULL apart from ''."""
+    assert _csv_value(value) == expected
+
+
+def test_csv_values_can_be_read_back():
+    """Keep the columns of a row apart, whatever the strings contain."""
+    row = ['a "quoted", comma', "two\nlines", "", "\r\n", ",", '"']
+
+    line = ",".join(_csv_value(value) for value in row)
+
+    assert next(csv.reader(io.StringIO(line))) == row
+
+
+def test_flush_copies_the_rows_of_photos_users_and_tags(session, copy_writer):
+    """Copy a row per photo, user, and tag to the staging tables, then merge."""
+    copy_writer.add([PHOTO])
+    copy_writer.flush()
+
+    photos, users, tags = (
+        list(csv.reader(io.StringIO(session.copied[table])))
+        for table in (
+            copy_writer._staging_photos,
+            copy_writer._staging_users,
+            copy_writer._staging_tags,
+        )
+    )
+
+    (photo,) = photos
+    photo = dict(zip(PHOTO_COLUMNS + ("tagged",), photo))
+    assert photo["id"] == PHOTO["id"]
+    assert photo["title"] == PHOTO["title"].replace("\x00", "")
+    assert photo["user_id"] == "12345678"
+    assert photo["tagged"] == "t"
+    assert [user[2] for user in users] == [PHOTO["ownername"]]
+    assert sorted(tag for _, tag in tags) == ["helsinki", "snow"]
+    assert any("INSERT INTO photos" in statement for statement in session.statements)
+
+
+def test_flush_calls_back_once_the_photos_are_written(session, copy_writer):
+    """Call the functions waiting for a flush after the photos are committed."""
+    calls = []
+    copy_writer.add([PHOTO])
+    copy_writer.when_flushed(lambda: calls.append("success"))
+    assert calls == []
+
+    copy_writer.flush()
+    copy_writer.flush()
+
+    assert calls == ["success"]
+
+
+def test_when_flushed_calls_back_right_away_if_nothing_is_pending(session, copy_writer):
+    """Do not wait for a flush if there are no photos to write."""
+    calls = []
+
+    copy_writer.when_flushed(lambda: calls.append("success"))
+
+    assert calls == ["success"]
+    assert session.statements == []
+
+
+def test_photos_are_flushed_every_flush_rows(session):
+    """Write the collected photos once there are flush_rows of them."""
+    copy_writer = CopyWriter(FieldProfile("full"), flush_rows=2, flush_interval=3600)
+
+    copy_writer.add([PHOTO])
+    assert session.copied == {}
+
+    copy_writer.add([dict(PHOTO, id="10000000002")])
+    photos = csv.reader(io.StringIO(session.copied[copy_writer._staging_photos]))
+    assert len(list(photos)) == 2
+
+
+def test_failed_flush_discards_the_photos_and_calls_on_failure(
+    failing_session, copy_writer
+):
+    """Re-raise the exception, and call on_failure (never on_success)."""
+    calls = []
+    copy_writer.add([PHOTO])
+    copy_writer.when_flushed(
+        lambda: calls.append("success"), lambda: calls.append("failure")
+    )
+
+    with pytest.raises(ConnectionError):
+        copy_writer.flush()
+    copy_writer.flush()  # nothing left to write
+
+    assert calls == ["failure"]
+
+
+def test_discard_forgets_the_photos_and_calls_on_failure(session, copy_writer):
+    """Drop the collected photos without writing them, call on_failure."""
+    calls = []
+    copy_writer.add([PHOTO])
+    copy_writer.when_flushed(
+        lambda: calls.append("success"), lambda: calls.append("failure")
+    )
+
+    copy_writer.discard()
+    copy_writer.flush()
+
+    assert calls == ["failure"]
+    assert session.copied == {}
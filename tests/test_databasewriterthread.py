@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test writing photos to the database, and reporting the time spans done."""
+
+
+import datetime
+import logging
+import queue
+
+import pytest
+
+import flickrhistory.database.copy_writer
+from flickrhistory.database import PhotoSaver
+from flickrhistory.databasewriterthread import DatabaseWriterThread, PendingTimeSpan
+from flickrhistory.timespan import TimeSpan
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+TIMESPAN = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=1))
+
+
+def _page(photo_id):
+    return [
+        {
+            "id": str(photo_id),
+            "owner": "12345678@N01",
+            "dateupload": str(int(MARCH_2015.timestamp())),
+        }
+    ]
+
+
+def _reported(done_queue):
+    reported = []
+    while not done_queue.empty():
+        reported.append(done_queue.get_nowait())
+    return reported
+
+
+def test_pending_timespan_reports_once_all_batches_are_written():
+    """Report the time span once it is complete and its batches are committed."""
+    done_queue = queue.Queue()
+    pending_timespan = PendingTimeSpan(TIMESPAN, done_queue)
+
+    for _ in range(2):
+        pending_timespan.add_batch()
+    pending_timespan.batch_written()
+    pending_timespan.complete()
+    assert _reported(done_queue) == []
+
+    pending_timespan.batch_written()
+    pending_timespan.complete()
+    assert _reported(done_queue) == [TIMESPAN]
+
+
+def test_pending_timespan_waits_until_it_is_complete():
+    """Do not report a time span whose photos are still being downloaded."""
+    done_queue = queue.Queue()
+    pending_timespan = PendingTimeSpan(TIMESPAN, done_queue)
+
+    pending_timespan.add_batch()
+    pending_timespan.batch_written()
+    assert _reported(done_queue) == []
+
+    pending_timespan.complete()
+    assert _reported(done_queue) == [TIMESPAN]
+
+
+def test_pending_timespan_with_a_failed_batch_is_never_reported():
+    """Leave a time span in the gaps of the history if one batch failed."""
+    done_queue = queue.Queue()
+    pending_timespan = PendingTimeSpan(TIMESPAN, done_queue)
+
+    for _ in range(2):
+        pending_timespan.add_batch()
+    pending_timespan.batch_failed()
+    pending_timespan.batch_written()
+    pending_timespan.complete()
+
+    assert _reported(done_queue) == []
+
+
+def test_pending_timespan_without_a_timespan_is_never_reported():
+    """Do not report anything for photos that do not belong to a time span."""
+    done_queue = queue.Queue()
+    pending_timespan = PendingTimeSpan(None, done_queue)
+
+    pending_timespan.add_batch()
+    pending_timespan.batch_written()
+    pending_timespan.complete()
+
+    assert _reported(done_queue) == []
+
+
+def _write(pages):
+    """Write pages of photos with a DatabaseWriterThread, return the time spans."""
+    write_queue = queue.Queue()
+    done_queue = queue.Queue()
+
+    database_writer = DatabaseWriterThread(write_queue)
+    database_writer.start()
+
+    for page in pages:
+        pending_timespan = PendingTimeSpan(TIMESPAN, done_queue)
+        pending_timespan.add_batch()
+        write_queue.put((page, pending_timespan))
+        pending_timespan.complete()
+
+    database_writer.shutdown.set()
+    database_writer.join(timeout=5)
+    assert not database_writer.is_alive()
+
+    return database_writer, _reported(done_queue)
+
+
+def test_writer_reports_the_time_spans_it_saved(monkeypatch):
+    """Report each time span once its page of photos is saved."""
+    monkeypatch.setattr(PhotoSaver, "save_many", lambda self, page: list(page))
+
+    database_writer, reported = _write([_page(1), _page(2)])
+
+    assert database_writer.count == 2
+    assert reported == [TIMESPAN, TIMESPAN]
+
+
+@pytest.mark.parametrize("database_writer", ["orm", "copy"])
+def test_writer_survives_database_errors(config, monkeypatch, caplog, database_writer):
+    """Log errors, keep on writing, and report none of the failed time spans."""
+
+    def _unreachable(*args, **kwargs):
+        raise ConnectionError("could not connect to server")
+
+    config["database_writer"] = database_writer
+    config["copy_flush_rows"] = 1
+    monkeypatch.setattr(PhotoSaver, "save_many", _unreachable)
+    monkeypatch.setattr(flickrhistory.database.copy_writer, "Session", _unreachable)
+
+    with caplog.at_level(logging.ERROR):
+        database_writer, reported = _write([_page(1), _page(2)])
+
+    assert reported == []
+    assert database_writer.count == 0
+    assert (
+        len(
+            [
+                record
+                for record in caplog.records
+                if record.exc_info and record.exc_info[0] is ConnectionError
+            ]
+        )
+        == 2
+    )
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test choosing which photo fields to download and save."""
+
+
+import datetime
+
+import pytest
+
+from flickrhistory.database import FieldProfile, PhotoSaver
+from flickrhistory.photodownloader import PhotoDownloader
+from flickrhistory.timespan import TimeSpan
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def _sql(condition):
+    return str(condition.compile(compile_kwargs={"literal_binds": True}))
+
+
+def test_the_full_profile_is_the_default():
+    """Request all extras unless `field_profile` selects another profile."""
+    assert FieldProfile().extras == (
+        "description",
+        "date_upload",
+        "date_taken",
+        "geo",
+        "owner_name",
+        "tags",
+        "license",
+    )
+
+
+def test_the_profile_can_be_configured(config):
+    """Use the profile `field_profile` names."""
+    config["field_profile"] = "minimal"
+
+    assert FieldProfile().extras == ("date_upload", "geo")
+
+
+def test_unknown_profiles_raise_an_error():
+    """Refuse a field_profile that does not exist."""
+    with pytest.raises(ValueError):
+        FieldProfile("everything")
+
+
+def test_profiles_select_the_fields_they_save():
+    """Keep only the fields of a profile (and the ones searches always return)."""
+    photo = PhotoSaver.normalise(
+        {
+            "id": "16000000000",
+            "title": "A photo",
+            "description": {"_content": "A long description"},
+            "dateupload": "1425168000",
+            "latitude": "60.2",
+            "longitude": "24.9",
+            "accuracy": "16",
+            "tags": "helsinki",
+        }
+    )
+
+    assert set(FieldProfile("minimal").select(photo)) == {
+        "id",
+        "title",
+        "date_posted",
+        "geom",
+        "geo_accuracy",
+    }
+    assert set(FieldProfile("standard").select(photo)) == set(photo) - {"description"}
+
+
+@pytest.mark.parametrize(
+    "profile, columns",
+    [
+        ("minimal", ["geo_accuracy"]),
+        ("standard", ["geo_accuracy", "license_id"]),
+        ("full", ["geo_accuracy", "license_id"]),
+    ],
+)
+def test_photos_lacking_fields_of_the_profile_are_incomplete(profile, columns):
+    """Consider photos incomplete if they lack a field getInfo fills in."""
+    condition = _sql(FieldProfile(profile).incomplete_photos)
+
+    assert condition == " OR ".join(f"photos.{column} IS NULL" for column in columns)
+
+
+def test_searches_request_the_extras_of_the_profile(
+    config, fake_flickr_api, api_key_manager
+):
+    """Download only the fields of the configured profile."""
+    config["field_profile"] = "minimal"
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=10))
+
+    photos = list(PhotoDownloader(timespan, api_key_manager).photos)
+
+    assert photos
+    assert all("description" not in photo for photo in photos)
+    assert all("tags" not in photo for photo in photos)
+    assert all("date_posted" in photo and "geom" in photo for photo in photos)
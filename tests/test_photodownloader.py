@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test downloading the photos of a time span."""
+
+
+import datetime
+
+import pytest
+
+from flickrhistory.exceptions import DownloadBatchIsTooLargeError
+from flickrhistory.fakeflickrapi import ID_OFFSET, FakeFlickrApi, UploadDensityCurve
+from flickrhistory.photodownloader import PhotoDownloader
+from flickrhistory.timespan import TimeSpan
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def _photo_ids(fake_flickr_api, timespan):
+    """Return the ids of the photos the fake API has for timespan, in order."""
+    return [
+        str(ID_OFFSET + photo)
+        for photo in fake_flickr_api.density_curve.photos_between(
+            int(timespan.start.timestamp()), int(timespan.end.timestamp())
+        )
+    ]
+
+
+@pytest.fixture
+def dense_fake_flickr_api(config):
+    """Serve a FakeFlickrApi with five uploads per second."""
+    density_curve = UploadDensityCurve([("2000-01-01", 5 * 24 * 60 * 60)])
+    with FakeFlickrApi(density_curve=density_curve) as fake_flickr_api:
+        config["flickr_api_endpoint_url"] = fake_flickr_api.url
+        yield fake_flickr_api
+
+
+def _results(timestamps, total=None):
+    """Return search results with one photo per POSIX timestamp."""
+    return {
+        "photos": {
+            "page": 1,
+            "pages": 1,
+            "perpage": 500,
+            "total": len(timestamps) if total is None else total,
+            "photo": [
+                {
+                    "id": str(timestamp),
+                    "dateupload": str(timestamp),
+                    "accuracy": "0",
+                    "license": "0",
+                    "tags": "",
+                }
+                for timestamp in timestamps
+            ],
+        },
+        "stat": "ok",
+    }
+
+
+def test_photos_posted_after_the_time_span_are_skipped():
+    """Skip photos the API returns although they were posted later."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=1))
+    start = int(timespan.start.timestamp())
+    photo_downloader = PhotoDownloader(timespan, api_key_manager=None)
+
+    photos = photo_downloader.photos_in_results(
+        _results([start, start + 60, start + 61])
+    )
+
+    assert [photo["date_posted"] for photo in photos] == [
+        MARCH_2015,
+        MARCH_2015 + datetime.timedelta(seconds=60),
+    ]
+
+
+def test_time_spans_with_too_many_photos_raise_an_error():
+    """Raise DownloadBatchIsTooLargeError with the total and the first page."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=1))
+    start = int(timespan.start.timestamp())
+    photo_downloader = PhotoDownloader(timespan, api_key_manager=None)
+
+    with pytest.raises(DownloadBatchIsTooLargeError) as exception_info:
+        list(
+            photo_downloader.photos_in_results(
+                _results([start, start + 1], total=10000)
+            )
+        )
+
+    assert exception_info.value.total == 10000
+    assert len(exception_info.value.photos) == 2
+
+
+def test_pages_download_all_photos_in_order(fake_search_api, api_key_manager):
+    """Download every photo of a time span of several pages exactly once."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=1))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager)
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert fake_search_api.calls == 4  # 1801 photos
+    assert photo_ids == fake_search_api.photo_ids(timespan)
+
+
+def test_pages_yield_the_photos_of_each_page_of_results(
+    fake_search_api, api_key_manager
+):
+    """Return one list of photos per page of search results."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=1))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager)
+
+    pages = list(photo_downloader.pages)
+
+    assert [len(page) for page in pages] == [500, 500, 500, 301]
+    assert [photo["id"] for page in pages for photo in page] == (
+        fake_search_api.photo_ids(timespan)
+    )
+
+
+def test_pages_are_downloaded_in_parallel(fake_search_api, api_key_manager):
+    """Download the remaining pages in parallel once the first one arrived."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=1))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager)
+
+    list(photo_downloader.photos)
+
+    assert fake_search_api.max_calls_in_flight > 1
+
+
+@pytest.mark.parametrize("pagination", ["pages", "keyset"])
+def test_streamed_pages_download_all_photos_in_order(
+    fake_search_api, api_key_manager, pagination
+):
+    """Parse pages while they arrive, and still return every photo once."""
+    fake_search_api.photos_per_upload = 3
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=30))
+    photo_downloader = PhotoDownloader(
+        timespan, api_key_manager, pagination=pagination, streaming=True
+    )
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert photo_ids == fake_search_api.photo_ids(timespan)
+
+
+def test_keyset_downloads_more_photos_than_one_search_returns(
+    fake_search_api, api_key_manager
+):
+    """Download all photos of a time span too large for page-based pagination."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=3))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager, pagination="keyset")
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert len(photo_ids) > 5000
+    assert photo_ids == fake_search_api.photo_ids(timespan)
+
+
+def test_keyset_skips_the_photos_it_has_seen_in_the_last_second(
+    fake_search_api, api_key_manager
+):
+    """Return each photo once, also if pages end in the middle of a second."""
+    fake_search_api.photos_per_upload = 3  # 500 is not divisible by 3
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=30))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager, pagination="keyset")
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert photo_ids == fake_search_api.photo_ids(timespan)
+
+
+def test_keyset_pages_through_a_second_with_more_photos_than_a_page(
+    fake_search_api, api_key_manager
+):
+    """Request the next page if all photos of a page were uploaded in one second."""
+    fake_search_api.interval = 60
+    fake_search_api.photos_per_upload = 700
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=2))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager, pagination="keyset")
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert photo_ids == fake_search_api.photo_ids(timespan)
+
+
+def test_pagination_is_configurable(config):
+    """Use `pagination` in the configuration, reject unknown modes."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=1))
+
+    config["pagination"] = "keyset"
+    assert PhotoDownloader(timespan, api_key_manager=None).pagination == "keyset"
+
+    config["pagination"] = "cursor"
+    with pytest.raises(ValueError):
+        PhotoDownloader(timespan, api_key_manager=None)
+
+
+def _split(timespan, total, photos):
+    """Split timespan as if its first page held photos, out of total."""
+    photo_downloader = PhotoDownloader(timespan, api_key_manager=None)
+    return photo_downloader.split(
+        DownloadBatchIsTooLargeError(total=total, photos=photos)
+    )
+
+
+def test_split_keeps_the_first_page_and_divides_the_rest_evenly():
+    """Cut the rest of a time span into pieces of at most 3000 photos each."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=10))
+    first_page = [
+        {"date_posted": MARCH_2015 + datetime.timedelta(seconds=second)}
+        for second in range(500)
+    ]
+
+    downloaded, pieces = _split(timespan, 9500, first_page)
+
+    assert downloaded == TimeSpan(
+        MARCH_2015, MARCH_2015 + datetime.timedelta(seconds=499)
+    )
+    # 9000 remaining photos
+    assert len(pieces) == 3
+    assert pieces[0].start == downloaded.end
+    assert pieces[-1].end == timespan.end
+    assert all(
+        piece.end == next_piece.start for piece, next_piece in zip(pieces, pieces[1:])
+    )
+    durations = [piece.duration for piece in pieces]
+    assert max(durations) - min(durations) < datetime.timedelta(milliseconds=1)
+
+
+def test_split_without_photos_divides_the_whole_time_span():
+    """Split a time span the API reported as too large, but sent no photos for."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=10))
+
+    downloaded, pieces = _split(timespan, 9001, [])
+
+    assert downloaded is None
+    assert len(pieces) == 4
+    assert sum(pieces) == [timespan]
+
+
+def test_split_does_not_cut_pieces_shorter_than_a_second():
+    """Stop splitting at time spans of one second."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(seconds=2))
+
+    _, pieces = _split(timespan, 100000, [])
+
+    assert len(pieces) == 2
+
+
+def test_num_photos_counts_the_photos_of_a_time_span(fake_search_api, api_key_manager):
+    """Ask the API how many photos a time span contains, in one call."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=10))
+
+    num_photos = PhotoDownloader(timespan, api_key_manager).num_photos
+
+    assert num_photos == len(fake_search_api.photo_ids(timespan))
+    assert fake_search_api.calls == 1
+
+
+@pytest.mark.parametrize("pagination", ["pages", "keyset"])
+def test_photos_are_downloaded_from_the_configured_endpoint(
+    fake_flickr_api, api_key_manager, pagination
+):
+    """Download all photos from `flickr_api_endpoint_url`, none uploaded later."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=40))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager, pagination=pagination)
+
+    photos = list(photo_downloader.photos)
+
+    assert fake_flickr_api.calls["flickr.photos.search"] > 1
+    assert [photo["id"] for photo in photos] == _photo_ids(fake_flickr_api, timespan)
+    assert all(
+        timespan.start <= photo["date_posted"] <= timespan.end for photo in photos
+    )
+
+
+def test_keyset_downloads_more_photos_than_the_api_returns_per_search(
+    dense_fake_flickr_api, api_key_manager
+):
+    """Download all photos of a time span beyond the API’s limit per search."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(minutes=30))
+    photo_downloader = PhotoDownloader(timespan, api_key_manager, pagination="keyset")
+
+    photo_ids = [photo["id"] for photo in photo_downloader.photos]
+
+    assert len(photo_ids) > 4000
+    assert photo_ids == _photo_ids(dense_fake_flickr_api, timespan)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test saving pages of photos with set-based upserts."""
+
+
+import contextlib
+
+import pytest
+import sqlalchemy.dialects.postgresql
+
+import flickrhistory.database.photo_saver
+from flickrhistory.database import FieldProfile, PhotoSaver, RowCache
+
+
+class _FakeSession:
+    """Record the statements executed, instead of executing them."""
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def begin(self):
+        return contextlib.nullcontext()
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def statements():
+    """Collect the statements executed besides upserts."""
+    return []
+
+
+@pytest.fixture
+def upserts(monkeypatch, row_cache, statements):
+    """Collect the tables and rows save_many upserts, instead of writing them."""
+    upserts = []
+    # (an empty database, RowCache does not have to load the licenses)
+    monkeypatch.setattr(RowCache, "_licenses", set())
+    monkeypatch.setattr(
+        flickrhistory.database.photo_saver,
+        "_upsert",
+        lambda session, model, rows: upserts.append((model.__tablename__, rows)),
+    )
+    monkeypatch.setattr(
+        flickrhistory.database.photo_saver,
+        "Session",
+        lambda: _FakeSession(statements),
+    )
+    return upserts
+
+
+def _photo(photo_id, owner="12345678@N01", **fields):
+    photo = {
+        "id": str(photo_id),
+        "owner": owner,
+        "ownername": f"User {owner}",
+        "dateupload": "1425168000",
+        "license": "4",
+        "tags": "helsinki summer",
+        "accuracy": "16",
+    }
+    photo.update(fields)
+    return photo
+
+
+def test_save_many_upserts_each_table_once_in_key_order(upserts):
+    """Write licenses, users, photos, tags and their associations, sorted."""
+    page = [
+        _photo(3, license="2"),
+        _photo(1, owner="87654321@N02"),
+        _photo(2, tags="helsinki"),
+        _photo(1, owner="87654321@N02"),
+    ]
+
+    photos = PhotoSaver(FieldProfile("full")).save_many(page)
+
+    assert [photo["id"] for photo in photos] == ["3", "1", "2", "1"]
+    tables = {table: rows for table, rows in upserts}
+    assert [table for table, _ in upserts] == [
+        "licenses",
+        "users",
+        "photos",
+        "tags",
+        "tag_photo_associations",
+    ]
+    assert tables["licenses"] == [{"id": 2}, {"id": 4}]
+    assert [(user["id"], user["farm"]) for user in tables["users"]] == [
+        ("12345678", "1"),
+        ("87654321", "2"),
+    ]
+    assert [photo["id"] for photo in tables["photos"]] == ["1", "2", "3"]
+    assert tables["tags"] == [{"tag": "helsinki"}, {"tag": "summer"}]
+    assert tables["tag_photo_associations"][:3] == [
+        {"photo_id": "1", "tag_tag": "helsinki"},
+        {"photo_id": "1", "tag_tag": "summer"},
+        {"photo_id": "2", "tag_tag": "helsinki"},
+    ]
+
+
+def test_save_many_leaves_missing_fields_as_they_are(upserts):
+    """Write only the columns contained in the data, and in the profile."""
+    page = [_photo(1, description={"_content": "A photo"})]
+    del page[0]["license"]
+
+    PhotoSaver(FieldProfile("standard")).save_many(page)
+
+    (photo,) = dict(upserts)["photos"]
+    assert "license_id" not in photo
+    assert "description" not in photo
+    assert photo["geo_accuracy"] == 16
+    assert dict(upserts)["licenses"] == []
+
+
+def test_save_many_without_photos_does_not_write(upserts):
+    """Do not open a transaction for an empty page."""
+    assert PhotoSaver().save_many([]) == []
+    assert upserts == []
+
+
+def test_tags_a_photo_no_longer_has_are_removed_in_one_statement(upserts, statements):
+    """Delete the associations of the photos that are not in their new tags."""
+    PhotoSaver(FieldProfile("full")).save_many([_photo(1), _photo(2, tags="")])
+
+    (delete,) = statements
+    sql = str(
+        delete.compile(
+            dialect=sqlalchemy.dialects.postgresql.dialect(),
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+    assert sql.startswith("DELETE FROM tag_photo_associations")
+    assert "photo_id IN ('1', '2')" in sql
+    assert "NOT IN (('1', 'helsinki'), ('1', 'summer'))" in sql
+
+
+def test_save_many_skips_rows_known_to_exist(upserts):
+    """Do not write licenses, tags and users again that are saved already."""
+    photo_saver = PhotoSaver(FieldProfile("full"))
+    photo_saver.save_many([_photo(1)])
+    upserts.clear()
+
+    photo_saver.save_many([_photo(2), _photo(3, owner="87654321@N02", license="2")])
+
+    tables = dict(upserts)
+    assert tables["licenses"] == [{"id": 2}]
+    assert [user["id"] for user in tables["users"]] == ["87654321"]
+    assert tables["tags"] == []
+    assert [photo["id"] for photo in tables["photos"]] == ["2", "3"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test restricting downloads to a region, and its cache."""
+
+
+import pytest
+
+from flickrhistory.apikeymanager import ApiKeyManager
+from flickrhistory.cache import Cache
+from flickrhistory.region import Region
+
+
+# a triangle, west of the prime meridian and north of the equator
+TRIANGLE = [[-10, 0], [0, 0], [-10, 10]]
+
+
+@pytest.fixture
+def regions(config):
+    """Define a few regions in the configuration."""
+    config["regions"] = {
+        "triangle": {"polygon": TRIANGLE},
+        "box": {"bbox": [1, 2, 3, 4]},
+        "place": {"woe_id": 12345},
+    }
+    return config["regions"]
+
+
+def _photo(longitude, latitude):
+    return {"geom": f"SRID=4326;POINT({longitude} {latitude})"}
+
+
+def test_no_region_searches_and_keeps_everything(config):
+    """Do not restrict searches if no region is configured."""
+    region = Region()
+
+    assert region.name is None
+    assert region.query == {}
+    assert region.contains({})
+
+
+@pytest.mark.parametrize(
+    "name, query",
+    [
+        ("triangle", {"bbox": "-10.000000,0.000000,0.000000,10.000000"}),
+        ("box", {"bbox": "1.000000,2.000000,3.000000,4.000000"}),
+        ("place", {"woe_id": "12345"}),
+    ],
+)
+def test_regions_restrict_searches(regions, name, query):
+    """Search a polygon’s bounding box, or the box or place given."""
+    assert Region(name).query == query
+
+
+def test_polygons_discard_photos_outside_them(regions):
+    """Keep photos inside a polygon, discard those outside or without location."""
+    region = Region("triangle")
+
+    assert region.contains(_photo(-9, 1))
+    assert not region.contains(_photo(-1, 9))  # in the bounding box only
+    assert not region.contains(_photo(5, 5))
+    assert not region.contains({"geom": None})
+
+
+@pytest.mark.parametrize("name", ["undefined", "../etc"])
+def test_invalid_regions_raise_an_error(regions, name):
+    """Raise a ValueError for regions that are not defined, or invalid names."""
+    with pytest.raises(ValueError):
+        Region(name)
+
+
+def test_regions_have_their_own_cache_but_share_the_api_key_usage(
+    config, regions, tmp_path
+):
+    """Keep a cache file per region, but one for the API keys’ usage."""
+    with Cache() as cache:
+        cache["progress"] = "world"
+
+    config["region"] = "triangle"
+    with Cache() as cache:
+        cache["progress"] = "triangle"
+    with Cache(per_region=ApiKeyManager.CACHE_PER_REGION) as cache:
+        cache[ApiKeyManager.CACHE_KEY] = "shared"
+
+    assert Cache()["progress"] == "triangle"
+    assert (tmp_path / "flickrhistory-triangle.yml").exists()
+
+    config["region"] = None
+    assert Cache()["progress"] == "world"
+    assert Cache()[ApiKeyManager.CACHE_KEY] == "shared"
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test estimating the API calls and time the remaining downloads take."""
+
+
+import datetime
+
+import pytest
+
+import flickrhistory.remainingworkestimator
+from flickrhistory.exceptions import ApiResponseError
+from flickrhistory.remainingworkestimator import RemainingWorkEstimator
+from flickrhistory.timespan import TimeSpan
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def estimator():
+    """Return a RemainingWorkEstimator for two API keys at 0.5 calls/s."""
+    return RemainingWorkEstimator(
+        num_api_keys=2,
+        rate_limit_per_second=0.5,
+        photos_per_timespan=3000,
+        users_per_photo=0.1,
+    )
+
+
+@pytest.mark.parametrize(
+    "num_photos, search_calls",
+    [
+        (0, 1),  # an empty time span still needs one call
+        (500, 1),
+        (501, 2),
+        (3000, 6),
+        (9000, 18),  # three time spans of six pages
+    ],
+)
+def test_search_calls_count_the_pages_of_each_time_span(
+    estimator, num_photos, search_calls
+):
+    """Count one call per page of 500 photos, in time spans of 3000 photos."""
+    assert estimator.search_calls(num_photos) == search_calls
+
+
+def test_estimate_adds_up_the_calls_and_their_time(estimator):
+    """Add profile and photo info calls, and divide by the rate limit."""
+    estimate = estimator.estimate(
+        [3000, 500], incomplete_profiles=10, incomplete_photos=20
+    )
+
+    assert estimate == {
+        "photos": 3500,
+        "search_calls": 7,
+        "profile_calls": 350 + 10,
+        "photo_info_calls": 20,
+        "api_calls": 387,
+        "eta": datetime.timedelta(seconds=387),
+    }
+
+
+def test_count_photos_splits_gaps_the_api_cannot_count(monkeypatch):
+    """Count the halves of a gap if the API fails to count all of it."""
+
+    class _FakePhotoDownloader:
+        def __init__(self, timespan, api_key_manager):
+            if timespan.duration > datetime.timedelta(days=1):
+                raise ApiResponseError()
+            self.num_photos = round(timespan.duration / datetime.timedelta(hours=1))
+
+    monkeypatch.setattr(
+        flickrhistory.remainingworkestimator, "PhotoDownloader", _FakePhotoDownloader
+    )
+    gaps = [
+        TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(hours=12)),
+        TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(days=4)),
+    ]
+
+    assert RemainingWorkEstimator.count_photos(gaps, api_key_manager=None) == [12, 96]
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test decoding API responses."""
+
+
+import json
+
+import pytest
+
+from flickrhistory.database import PhotoSaver
+from flickrhistory.responsedecoder import ResponseDecoder
+
+
+@pytest.fixture(scope="module")
+def search_results():
+    """Return the body of a flickr.photos.search response with 500 photos."""
+    photos = [
+        {
+            "id": str(16000000000 + n),
+            "owner": f"{10000000 + n % 37}@N0{n % 9}",
+            "ownername": f"Photographer {n % 37}",
+            "secret": f"{n * 7919:010x}",
+            "server": str(1000 + n % 4000),
+            "title": f"Photo {n}",
+            "description": {"_content": f"Description of photo {n}"},
+            "license": str(n % 11),
+            "dateupload": str(1425168000 + n * 7),  # 2015-03-01
+            "datetaken": "2015-02-28 12:34:56" if n % 10 else "0000-01-01 00:00:00",
+            "tags": f"tag{n % 5} tag{n % 13}" if n % 3 else "",
+            "latitude": f"{60 + n / 1000:.6f}" if n % 4 else 0,
+            "longitude": f"{24 + n / 1000:.6f}" if n % 4 else 0,
+            "accuracy": str(n % 17),
+        }
+        for n in range(500)
+    ]
+    return json.dumps(
+        {
+            "photos": {
+                "page": 1,
+                "pages": 3,
+                "perpage": 500,
+                "total": 1234,
+                "photo": photos,
+            },
+            "stat": "ok",
+        }
+    ).encode("utf-8")
+
+
+def _normalised_photos(results):
+    return [PhotoSaver.normalise(photo) for photo in results["photos"]["photo"]]
+
+
+@pytest.mark.parametrize("decoder", ["orjson", "msgspec"])
+def test_fast_decoders_return_the_same_photos(search_results, decoder):
+    """Decode search results into the same records as the standard library."""
+    pytest.importorskip(decoder)
+
+    expected = _normalised_photos(ResponseDecoder("json").decode(search_results))
+    photos = _normalised_photos(
+        ResponseDecoder(decoder).decode_search_results(search_results)
+    )
+
+    assert len(photos) == 500
+    assert photos == expected
+
+
+def test_msgspec_falls_back_on_other_responses():
+    """Decode responses that are not search results (e.g., errors) as they are."""
+    pytest.importorskip("msgspec")
+
+    content = b'{"stat": "fail", "code": 105, "message": "Service unavailable"}'
+
+    assert ResponseDecoder("msgspec").decode_search_results(content) == json.loads(
+        content
+    )
+
+
+def test_unknown_decoders_raise_an_error():
+    """Refuse a json_decoder that is not supported."""
+    with pytest.raises(ValueError):
+        ResponseDecoder("simplejson")
+
+
+def _chunks(content, size=7):
+    return (content[start : start + size] for start in range(0, len(content), size))
+
+
+def test_streamed_search_results_are_the_same_as_decoded_ones(search_results):
+    """Parse search results chunk by chunk: the page first, then each photo."""
+    expected = json.loads(search_results)
+
+    results, *photos = ResponseDecoder("json").iter_search_results(
+        _chunks(search_results)
+    )
+
+    assert results["photos"]["total"] == expected["photos"]["total"]
+    assert "photo" not in results["photos"]
+    assert photos == expected["photos"]["photo"]
+
+
+def test_streamed_responses_that_are_not_search_results_are_decoded_whole():
+    """Yield an error response (without a list of photos) as it is."""
+    content = b'{"stat": "fail", "code": 105, "message": "Service unavailable"}'
+
+    assert list(ResponseDecoder("json").iter_search_results(_chunks(content))) == [
+        json.loads(content)
+    ]
+
+
+def test_streamed_search_results_cut_short_raise_an_error(search_results):
+    """Raise a ValueError if the response ends in the middle of the photos."""
+    with pytest.raises(ValueError):
+        list(
+            ResponseDecoder("json").iter_search_results(
+                _chunks(search_results[: len(search_results) // 2])
+            )
+        )
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test retrying failed work items, and the circuit breaker."""
+
+
+import time
+
+import pytest
+
+from flickrhistory.exceptions import ApiResponseError, CircuitOpenError
+from flickrhistory.retrypolicy import RetryPolicy
+
+
+def _fail(retry_policy, times, exception=None):
+    """Report times failed API calls."""
+    for _ in range(times):
+        retry_policy.before_call()
+        retry_policy.after_call(exception or ApiResponseError())
+
+
+def test_delays_grow_exponentially_then_give_up(retry_policy):
+    """Wait up to twice as long after each failure, give up after MAX_ATTEMPTS."""
+    for attempt in range(1, RetryPolicy.MAX_ATTEMPTS):
+        delay = retry_policy.delay("item")
+        assert 0 <= delay <= min(RetryPolicy.MAX_DELAY, 2**attempt)
+
+    assert retry_policy.delay("item") is None
+    retries, given_up, _ = retry_policy.statistics
+    assert (retries, given_up) == (RetryPolicy.MAX_ATTEMPTS - 1, 1)
+
+
+def test_forgetting_an_item_starts_over(retry_policy):
+    """Reset the attempts of an item that succeeded."""
+    for _ in range(RetryPolicy.MAX_ATTEMPTS - 1):
+        retry_policy.delay("item")
+    retry_policy.forget("item")
+
+    assert retry_policy.delay("item") is not None
+
+
+def test_circuit_opens_after_consecutive_failures(retry_policy):
+    """Stop calling the API after FAILURE_THRESHOLD failures in a row."""
+    _fail(retry_policy, RetryPolicy.FAILURE_THRESHOLD - 1)
+    retry_policy.before_call()
+    retry_policy.after_call()  # a success resets the count
+    _fail(retry_policy, RetryPolicy.FAILURE_THRESHOLD - 1)
+    assert not retry_policy.circuit_open
+
+    _fail(retry_policy, 1)
+    assert retry_policy.circuit_open
+    with pytest.raises(CircuitOpenError):
+        retry_policy.before_call()
+
+
+def test_other_exceptions_do_not_open_the_circuit(retry_policy):
+    """Count only failures of the API."""
+    _fail(retry_policy, 2 * RetryPolicy.FAILURE_THRESHOLD, KeyboardInterrupt())
+
+    assert not retry_policy.circuit_open
+
+
+def test_circuit_lets_one_trial_call_through(retry_policy, monkeypatch):
+    """Let exactly one call through once the circuit has been open long enough."""
+    _fail(retry_policy, RetryPolicy.FAILURE_THRESHOLD)
+    monkeypatch.setattr(RetryPolicy, "_open_until", time.time() - 1)
+
+    retry_policy.before_call()
+    with pytest.raises(CircuitOpenError):
+        retry_policy.before_call()
+
+    retry_policy.after_call()
+    assert not retry_policy.circuit_open
+    retry_policy.before_call()
+
+
+def test_failed_trial_calls_keep_the_circuit_open_longer(retry_policy, monkeypatch):
+    """Double how long the circuit stays open after a failed trial call."""
+    _fail(retry_policy, RetryPolicy.FAILURE_THRESHOLD)
+    monkeypatch.setattr(RetryPolicy, "_open_until", time.time() - 1)
+
+    retry_policy.before_call()
+    retry_policy.after_call(ApiResponseError())
+
+    assert retry_policy.circuit_open
+    assert RetryPolicy._open_until == pytest.approx(
+        time.time() + 2 * RetryPolicy.OPEN_DURATION, abs=1
+    )
+
+
+def test_delays_wait_for_the_circuit_to_close(retry_policy):
+    """Do not retry an item before the circuit breaker lets calls through."""
+    _fail(retry_policy, RetryPolicy.FAILURE_THRESHOLD)
+
+    assert retry_policy.delay("item") >= RetryPolicy.OPEN_DURATION - 1
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test remembering which licenses, tags, and users are in the database."""
+
+
+import flickrhistory.database.row_cache
+from flickrhistory.database import RowCache
+from flickrhistory.database.row_cache import LruCache
+
+
+class _FakeSession:
+    """Return the license ids 0 to 4, count the queries."""
+
+    queries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def scalars(self, statement):
+        _FakeSession.queries += 1
+        return iter(range(5))
+
+
+def test_lru_cache_forgets_the_least_recently_used_entries():
+    """Drop the entry used longest ago once the cache is full."""
+    lru_cache = LruCache(max_size=2)
+    lru_cache["a"] = 1
+    lru_cache["b"] = 2
+    lru_cache.get("a")
+    lru_cache["c"] = 3
+
+    assert len(lru_cache) == 2
+    assert lru_cache.get("b") is None
+    assert lru_cache.get("a") == 1
+    assert lru_cache.get("c") == 3
+
+
+def test_lru_cache_counts_hits_and_misses():
+    """Count the lookups that found an entry, and those that did not."""
+    lru_cache = LruCache(max_size=10)
+    lru_cache["a"] = 1
+
+    lru_cache.get("a")
+    lru_cache.get("a")
+    lru_cache.get("b", "default")
+
+    assert (lru_cache.hits, lru_cache.misses) == (2, 1)
+
+
+def test_licenses_are_loaded_once(monkeypatch, row_cache):
+    """Read the licenses from the database the first time they are needed only."""
+    monkeypatch.setattr(flickrhistory.database.row_cache, "Session", _FakeSession)
+    monkeypatch.setattr(_FakeSession, "queries", 0)
+
+    assert row_cache.unknown_licenses({1, 7}) == {7}
+    row_cache.remember_licenses({7})
+    assert row_cache.unknown_licenses({1, 7, 8}) == {8}
+
+    assert _FakeSession.queries == 1
+    assert row_cache.statistics[0] == (3, 2)
+
+
+def test_tags_are_known_once_remembered(row_cache):
+    """Report tags as unknown until they are remembered."""
+    assert row_cache.unknown_tags({"helsinki", "snow"}) == {"helsinki", "snow"}
+
+    row_cache.remember_tags({"helsinki"})
+
+    assert row_cache.unknown_tags({"helsinki", "snow"}) == {"snow"}
+    assert row_cache.statistics[1] == (1, 3)
+
+
+def test_users_are_known_if_saving_them_would_not_change_anything(row_cache):
+    """Skip users saved with the same name, but not with a new name or profile."""
+    assert not row_cache.user_is_known("123", "1", {"name": "Jane"})
+
+    row_cache.remember_user("123", "1", {"name": "Jane"})
+
+    assert row_cache.user_is_known("123", "1", {"name": "Jane"})
+    assert row_cache.user_is_known("123", "1", {})
+    assert not row_cache.user_is_known("123", "1", {"name": "Jane Doe"})
+    assert not row_cache.user_is_known("123", "1", {"name": "Jane", "city": "Oslo"})
+    assert not row_cache.user_is_known("123", "2", {"name": "Jane"})
+
+
+def test_users_saved_without_a_name_are_known_only_without_a_name(row_cache):
+    """Do not assume the name of a user whose name was not written."""
+    row_cache.remember_user("123", "1", {})
+
+    assert row_cache.user_is_known("123", "1", {})
+    assert not row_cache.user_is_known("123", "1", {"name": "Jane"})
+
+
+def test_row_caches_share_what_they_remember(row_cache):
+    """Remember rows for all RowCaches of a process."""
+    row_cache.remember_tags({"helsinki"})
+
+    assert RowCache().unknown_tags({"helsinki"}) == set()
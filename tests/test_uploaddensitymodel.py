@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Test planning time spans from the density of uploads."""
+
+
+import datetime
+
+import pytest
+
+from flickrhistory.cache import Cache
+from flickrhistory.timespan import TimeSpan
+from flickrhistory.uploaddensitymodel import UploadDensityModel
+
+
+MARCH_2015 = datetime.datetime(2015, 3, 1, tzinfo=datetime.timezone.utc)
+APRIL_2015 = datetime.datetime(2015, 4, 1, tzinfo=datetime.timezone.utc)
+ONE_HOUR = datetime.timedelta(hours=1)
+
+
+@pytest.fixture(autouse=True)
+def upload_density_model(monkeypatch):
+    """Start without observations, and without statistics."""
+    # UploadDensityModel is a pseudo-singleton, replace its shared state
+    for attribute, value in (
+        ("_months", None),
+        ("_hits", 0),
+        ("_misses", 0),
+        ("_planned_timespans", 0),
+        ("_one_day_timespans", 0),
+    ):
+        monkeypatch.setattr(UploadDensityModel, attribute, value)
+    return UploadDensityModel()
+
+
+def test_months_without_observations_are_planned_in_days(upload_density_model):
+    """Cut a gap in a month without observations into one-day time spans."""
+    gap = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(days=3, hours=12))
+
+    timespans = list(upload_density_model.plan(gap, target=2400))
+
+    assert [timespan.duration for timespan in timespans] == [
+        datetime.timedelta(days=1)
+    ] * 3 + [datetime.timedelta(hours=12)]
+
+
+def test_time_spans_are_planned_to_hold_the_target_number_of_photos(
+    upload_density_model,
+):
+    """Cut a gap into time spans expected to hold `target` photos each."""
+    # one photo per second
+    upload_density_model.observe(
+        TimeSpan(MARCH_2015, MARCH_2015 + ONE_HOUR), 3600, max_photos_per_timespan=3000
+    )
+    gap = TimeSpan(MARCH_2015, MARCH_2015 + datetime.timedelta(days=1))
+
+    timespans = list(upload_density_model.plan(gap, target=2400))
+
+    assert len(timespans) == 36
+    assert timespans[0].start == gap.start
+    assert timespans[-1].end == gap.end
+    assert all(
+        timespan.end == next_timespan.start
+        for timespan, next_timespan in zip(timespans, timespans[1:])
+    )
+    assert all(
+        upload_density_model.expected_photos(timespan) == pytest.approx(2400)
+        for timespan in timespans
+    )
+
+
+def test_planned_time_spans_stop_where_observations_end(upload_density_model):
+    """Do not extend a planned time span into a month without observations."""
+    upload_density_model.observe(
+        TimeSpan(MARCH_2015, MARCH_2015 + ONE_HOUR), 36, max_photos_per_timespan=3000
+    )
+    gap = TimeSpan(APRIL_2015 - ONE_HOUR, APRIL_2015 + datetime.timedelta(days=2))
+
+    timespans = list(upload_density_model.plan(gap, target=2400))
+
+    assert timespans[0] == TimeSpan(gap.start, APRIL_2015)
+    assert timespans[1] == TimeSpan(APRIL_2015, APRIL_2015 + datetime.timedelta(days=1))
+
+
+def test_observations_are_shared_between_the_months_of_a_time_span(
+    upload_density_model,
+):
+    """Attribute the photos of a time span to its months by their share of it."""
+    upload_density_model.observe(
+        TimeSpan(APRIL_2015 - ONE_HOUR, APRIL_2015 + 3 * ONE_HOUR),
+        400,
+        max_photos_per_timespan=3000,
+    )
+
+    assert upload_density_model.photos_per_second("2015-03") == pytest.approx(
+        100 / 3600
+    )
+    assert upload_density_model.photos_per_second("2015-04") == pytest.approx(
+        100 / 3600
+    )
+    assert upload_density_model.photos_per_second("2015-05") is None
+
+
+def test_statistics_count_time_spans_that_were_too_large(upload_density_model):
+    """Report the share of observed time spans below the limit as hit rate."""
+    timespan = TimeSpan(MARCH_2015, MARCH_2015 + ONE_HOUR)
+    for num_photos in (100, 2000, 2999, 3001):
+        upload_density_model.observe(timespan, num_photos, max_photos_per_timespan=3000)
+    # 8100 photos in four hours, ~2000 per hour
+    list(upload_density_model.plan(timespan, target=1000))
+
+    hit_rate, planned_timespans, one_day_timespans = upload_density_model.statistics
+
+    assert hit_rate == 0.75
+    assert planned_timespans == 3
+    assert one_day_timespans == 1
+
+
+def test_observations_are_restored_from_the_cache(monkeypatch, upload_density_model):
+    """Load the observations of earlier runs from the cache."""
+    upload_density_model.observe(
+        TimeSpan(MARCH_2015, MARCH_2015 + ONE_HOUR), 3600, max_photos_per_timespan=3000
+    )
+    with Cache() as cache:
+        cache[UploadDensityModel.CACHE_KEY] = upload_density_model.to_cache()
+
+    monkeypatch.setattr(UploadDensityModel, "_months", None)
+
+    assert UploadDensityModel().photos_per_second("2015-03") == pytest.approx(1.0)